@@ -0,0 +1,293 @@
+"""
+async_transport.py - Camada de rede do nó com asyncio
+
+Alternativa ao ThreadedTransport: um único event loop (numa thread de
+fundo, para que a API síncrona do Node continue igual) cuida de aceitar,
+conectar, ler e escrever em todos os sockets via streams, e aplica as
+operações recebidas no CRDT. O protocolo de rede é o mesmo (linhas JSON
+ou frames binários negociados no hello, lotes 'batch', compressão e
+controle de fluxo de outbound.py), então nós nos dois modos interoperam.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from outbound import admit, encode_frame
+from transport import encode_line
+from wire import BinaryEncoder, FrameCompressor, FrameDecoder
+
+
+class _AsyncPeer:
+    """Fila de saída de um peer, drenada por uma task de escrita"""
+
+    def __init__(self, peer_id, writer):
+        self.peer_id = peer_id
+        self.writer = writer
+        # Codificador binário e compressão da conexão atual (None = linhas
+        # JSON, sem compressão)
+        self.encoder = None
+        self.compressor = None
+        self.queue = deque()
+        self.ready = asyncio.Event()
+        self.task = None
+        self.lagging = False
+
+        self.frames_sent = 0
+        self.ops_sent = 0
+        self.bytes_sent = 0
+        self.bytes_raw = 0
+        self.dropped = 0
+        self.lags = 0
+
+    def pending(self):
+        return len(self.queue)
+
+    def retarget(self, writer, binary=False, compress=False):
+        """Mesma regra do PeerSender: codificador e fluxo zlib novos a cada conexão"""
+        if writer is not self.writer:
+            self.writer = writer
+            self.encoder = BinaryEncoder() if binary else None
+            self.compressor = FrameCompressor() if compress else None
+        else:
+            if binary and self.encoder is None:
+                self.encoder = BinaryEncoder()
+            if compress and self.compressor is None:
+                self.compressor = FrameCompressor()
+
+    def enqueue(self, outgoing, high_water):
+        """Enfileira (ver outbound.admit); só no event loop"""
+        if admit(self, outgoing, high_water):
+            self.queue.append(outgoing)
+            self.ready.set()
+        elif not self.queue:
+            self.ready.set()   # Fila vazia: o peer já pode voltar
+
+
+class AsyncioTransport:
+    """Transporte TCP baseado em asyncio (um event loop para todos os peers)"""
+
+    def __init__(self, node):
+        self.node = node
+        self.loop = None
+        self.server = None
+        self.senders = {}   # {node_id: _AsyncPeer}
+        self._thread = None
+        self._thread_id = None
+        # Peers com conexão sendo aberta / cuja última tentativa falhou
+        self._connecting = set()
+        self._unreachable = set()
+        # O asyncio guarda só referências fracas das tasks
+        self._tasks = set()
+        # Bytes recebidos por peer (os enviados ficam em cada _AsyncPeer)
+        self.received = {}
+
+    # ------------------------------------------------------------------
+    # Ciclo de vida (chamado de fora do loop)
+    # ------------------------------------------------------------------
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run():
+            self._thread_id = threading.get_ident()
+            asyncio.set_event_loop(self.loop)
+            self.loop.call_soon(started.set)
+            self.loop.run_forever()
+            self.loop.close()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+        asyncio.run_coroutine_threadsafe(self._main(), self.loop)
+
+    def stop(self):
+        if self.loop is None or self.loop.is_closed():
+            return
+        future = asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop)
+        try:
+            future.result(timeout=5)
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def broadcast(self, outgoing):
+        """Enfileira a mensagem para todos os peers (seguro de qualquer thread)"""
+        if threading.get_ident() == self._thread_id:
+            self._enqueue_all(outgoing)
+        elif self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._enqueue_all, outgoing)
+
+    def send(self, peer_id, outgoing):
+        """Enfileira a mensagem para um único peer (seguro de qualquer thread)"""
+        if threading.get_ident() == self._thread_id:
+            self._enqueue(peer_id, outgoing)
+        elif self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._enqueue, peer_id, outgoing)
+
+    def connected_peers(self):
+        return list(self.senders)
+
+    # ------------------------------------------------------------------
+    # Dentro do event loop
+    # ------------------------------------------------------------------
+    async def _main(self):
+        node = self.node
+        try:
+            self.server = await asyncio.start_server(self._on_accept, node.host, node.port)
+        except Exception as e:
+            print(f"[Node {node.node_id}] Erro iniciando servidor: {e}")
+            return
+        print(f"[Node {node.node_id}] Servidor escutando em {node.host}:{node.port}")
+
+        # Aguarda um pouco antes de conectar aos peers; depois, reconecta
+        # periodicamente aos que ficaram sem conexão
+        await asyncio.sleep(2.0)
+        while node.running:
+            for peer in node.peers:
+                if peer[0] not in self.senders and peer[0] not in self._connecting:
+                    self._spawn(self._connect(*peer))
+            if not node.reconnect_interval:
+                break
+            await asyncio.sleep(node.reconnect_interval)
+
+    async def _connect(self, peer_id, peer_host, peer_port):
+        node = self.node
+        self._connecting.add(peer_id)
+        try:
+            reader, writer = await asyncio.open_connection(peer_host, peer_port)
+        except Exception as e:
+            if peer_id not in self._unreachable:
+                self._unreachable.add(peer_id)
+                print(f"[Node {node.node_id}] Erro ao conectar com {peer_id}: {e}")
+            return
+        finally:
+            self._connecting.discard(peer_id)
+        self._unreachable.discard(peer_id)
+        print(f"[Node {node.node_id}] Conectado ao peer {peer_id}")
+        writer.write(encode_line(node._hello_message()))
+        self._register(peer_id, writer)
+        await self._read_loop(reader, writer, peer_id)
+
+    async def _on_accept(self, reader, writer):
+        writer.write(encode_line(self.node._hello_message()))
+        try:
+            await self._read_loop(reader, writer, None)
+        except asyncio.CancelledError:
+            # Handlers do servidor cancelados no stop(): o asyncio registra
+            # um erro espúrio se o cancelamento escapar daqui
+            pass
+
+    async def _read_loop(self, reader, writer, peer_id):
+        node = self.node
+        decoder = FrameDecoder()
+        remote_id = peer_id
+        try:
+            while node.running:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                metrics = node.metrics
+                if metrics is None:
+                    messages = decoder.feed(data)
+                else:
+                    start = time.perf_counter()
+                    messages = decoder.feed(data)
+                    metrics.observe('decode_us', (time.perf_counter() - start) * 1e6)
+                    metrics.count('messages_in', len(messages))
+                for msg in messages:
+                    if msg.get('type') == 'hello':
+                        remote_id = msg.get('node_id')
+                        if remote_id:
+                            self._register(remote_id, writer, node._accepts_binary(msg),
+                                           node._accepts_compression(msg))
+                            # O sync (locks das réplicas, delta ou snapshot
+                            # O(n)) roda fora do loop; as mensagens seguintes
+                            # da conexão esperam, na ordem
+                            await asyncio.to_thread(node._on_peer_hello, remote_id, msg)
+                        continue
+                    node._process_message(msg)
+                if remote_id:
+                    self.received[remote_id] = self.received.get(remote_id, 0) + len(data)
+        except ConnectionError:
+            pass
+        except Exception as e:
+            print(f"[Node {node.node_id}] Erro na conexão: {e}")
+        finally:
+            writer.close()
+            peer = self.senders.get(remote_id)
+            if peer is not None and peer.writer is writer:
+                del self.senders[remote_id]
+                peer.task.cancel()
+                node._on_peer_lost(remote_id)
+
+    def _register(self, peer_id, writer, binary=False, compress=False):
+        peer = self.senders.get(peer_id)
+        if peer is None:
+            peer = self.senders[peer_id] = _AsyncPeer(peer_id, writer)
+            peer.task = self._spawn(self._write_loop(peer))
+        # Nova conexão com o mesmo peer: a fila pendente é mantida
+        peer.retarget(writer, binary, compress)
+
+    def _spawn(self, coro):
+        task = self.loop.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _enqueue(self, peer_id, outgoing):
+        peer = self.senders.get(peer_id)
+        if peer is not None:
+            peer.enqueue(outgoing, self.node.high_water)
+
+    def _enqueue_all(self, outgoing):
+        high_water = self.node.high_water
+        for peer in self.senders.values():
+            peer.enqueue(outgoing, high_water)
+
+    async def _write_loop(self, peer):
+        node = self.node
+        max_batch = max(1, node.max_batch)
+        while True:
+            await peer.ready.wait()
+            # Dá uma janela para coalescer uma rajada num único frame
+            if node.flush_interval > 0 and len(peer.queue) < max_batch:
+                await asyncio.sleep(node.flush_interval)
+            count = min(len(peer.queue), max_batch)
+            batch = [peer.queue.popleft() for _ in range(count)]
+            drained = peer.lagging and not peer.queue
+            if drained:
+                peer.lagging = False
+            if not peer.queue:
+                peer.ready.clear()
+            if batch:
+                writer = peer.writer
+                data = encode_frame(batch, peer.encoder)
+                raw = len(data)
+                if peer.compressor is not None:
+                    data = peer.compressor.compress(data)
+                try:
+                    writer.write(data)
+                    await writer.drain()
+                except (ConnectionError, RuntimeError) as e:
+                    print(f"[Node {node.node_id}] Erro enviando para {peer.peer_id}: {e}")
+                    continue
+                peer.frames_sent += 1
+                peer.ops_sent += len(batch)
+                peer.bytes_sent += len(data)
+                peer.bytes_raw += raw
+            if drained:
+                # Gera o delta da volta fora do loop (ver _read_loop)
+                await asyncio.to_thread(node._on_peer_drained, peer.peer_id)
+
+    async def _shutdown(self):
+        if self.server is not None:
+            self.server.close()
+        for peer in list(self.senders.values()):
+            peer.writer.close()
+        self.senders.clear()
+        # Cancela conexões, leitores e escritores pendentes
+        current = asyncio.current_task()
+        tasks = [t for t in asyncio.all_tasks() if t is not current]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
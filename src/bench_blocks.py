@@ -0,0 +1,66 @@
+"""
+bench_blocks.py - Benchmark de colagens (paste) com blocos vs. caractere a caractere
+
+Aplica P colagens de L caracteres em posições aleatórias de duas formas:
+- blocos: cada colagem é um único Character (run) e uma única mensagem
+- char a char: cada caractere é um Character e uma mensagem próprios (a
+  extensão de blocos da digitação fica desligada)
+Reporta tempo, memória do documento e bytes das mensagens geradas.
+
+Uso: python3 bench_blocks.py [P] [L]
+"""
+import json
+import random
+import sys
+import time
+import tracemalloc
+from crdt_document import CRDTDocument
+from vector_clock import VectorClock
+
+
+def paste_workload(pastes, length, seed=42):
+    rnd = random.Random(seed)
+    return [(rnd.random(), ''.join(rnd.choice('abcdefgh ') for _ in range(length)))
+            for _ in range(pastes)]
+
+
+def run(workload, blockwise):
+    doc = CRDTDocument(run_limit=None if blockwise else 1)
+    clock = VectorClock('node1', ['node1', 'node2', 'node3'])
+    wire_bytes = 0
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    for fraction, text in workload:
+        position = int(fraction * len(doc))
+        pieces = [text] if blockwise else list(text)
+        for offset, piece in enumerate(pieces):
+            clock.increment()
+            char, origin = doc.local_insert(position + (0 if blockwise else offset), piece, 'node1', clock)
+            clock.increment(len(piece) - 1)
+            message = {'type': 'insert', 'op_id': clock.delta(), 'site_id': 'node1',
+                       'char': char.to_dict(), 'origin_id': origin}
+            wire_bytes += len(json.dumps(message)) + 1
+    elapsed = time.perf_counter() - start
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, memory, wire_bytes, len(doc.tree), doc.get_text()
+
+
+def main():
+    pastes = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    length = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    workload = paste_workload(pastes, length)
+
+    print(f"{pastes} colagens de {length} caracteres")
+    print(f"{'modo':<14} {'tempo (s)':>10} {'memória (KB)':>13} {'rede (KB)':>10} {'elementos':>10}")
+    results = {}
+    for label, blockwise in (('blocos', True), ('char a char', False)):
+        elapsed, memory, wire, elements, text = run(workload, blockwise)
+        results[label] = text
+        print(f"{label:<14} {elapsed:>10.3f} {memory / 1024:>13.1f} {wire / 1024:>10.1f} {elements:>10}")
+    assert results['blocos'] == results['char a char']
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+bench_broadcast.py - Vazão de broadcast sob rajadas de digitação
+
+Sobe 3 nós em loopback (portas livres), dispara K inserções de um caractere
+no node1 (cada uma é uma operação) e mede o tempo até todos os nós
+convergirem. Compara o envio sem agrupamento (max_batch=1, flush=0) com o
+pipeline em lotes. Por fim, repete a rajada com um peer "travado" (aceita a
+conexão mas nunca lê): as edições locais não devem bloquear no seu socket,
+e a fila dele não passa do high_water (as operações excedentes são
+descartadas; o peer seria atualizado por sync ao voltar a ler).
+
+Uso: python3 bench_broadcast.py [K]
+"""
+import socket
+import sys
+import time
+from node import Node
+
+# Limite da fila do peer travado (menor que o padrão, para a rajada passar dele)
+STALLED_HIGH_WATER = 1000
+
+
+def free_ports(count):
+    sockets = [socket.socket() for _ in range(count)]
+    for s in sockets:
+        s.bind(('localhost', 0))
+    ports = [s.getsockname()[1] for s in sockets]
+    for s in sockets:
+        s.close()
+    return ports
+
+
+def start_cluster(size, **options):
+    ids = [f'node{i}' for i in range(1, size + 1)]
+    ports = dict(zip(ids, free_ports(size)))
+    nodes = []
+    for node_id in ids:
+        peers = [(p, 'localhost', ports[p]) for p in ids if p != node_id]
+        node = Node(node_id, 'localhost', ports[node_id], peers, **options)
+        node.start()
+        nodes.append(node)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        if all(len(n.connected_peers()) == size - 1 for n in nodes):
+            return nodes
+        time.sleep(0.05)
+    raise RuntimeError("Cluster não conectou a tempo")
+
+
+def typing_burst(nodes, keystrokes, timeout=120):
+    writer = nodes[0]
+    start = time.perf_counter()
+    for i in range(keystrokes):
+        writer.insert(i, 'abcdefghij'[i % 10])
+    local_done = time.perf_counter() - start
+    expected = writer.get_text()
+    while time.perf_counter() - start < timeout:
+        if all(n.get_text() == expected for n in nodes):
+            return local_done, time.perf_counter() - start
+        time.sleep(0.01)
+    raise RuntimeError("Sem convergência dentro do tempo limite")
+
+
+def stalled_peer_burst(keystrokes):
+    """Rajada local com um peer que nunca lê do socket"""
+    stalled = socket.socket()
+    stalled.bind(('localhost', 0))
+    stalled.listen(1)
+    port, = free_ports(1)
+    peers = [('stalled', 'localhost', stalled.getsockname()[1])]
+    node = Node('node1', 'localhost', port, peers, high_water=STALLED_HIGH_WATER)
+    node.start()
+    try:
+        while 'stalled' not in node.connected_peers():
+            time.sleep(0.05)
+        start = time.perf_counter()
+        for i in range(keystrokes):
+            node.insert(i, 'x' * 64)
+        sender = node.transport.senders['stalled']
+        return time.perf_counter() - start, sender.pending(), sender.dropped
+    finally:
+        node.stop()
+        stalled.close()
+
+
+def main():
+    keystrokes = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    print(f"3 nós, {keystrokes} inserções de 1 caractere no node1")
+    print(f"{'modo':<16} {'local (s)':>10} {'convergência (s)':>17} {'ops/s':>10} {'frames':>8}")
+    for label, options in (('sem lotes', {'flush_interval': 0, 'max_batch': 1}),
+                           ('em lotes', {})):
+        nodes = start_cluster(3, **options)
+        try:
+            local, total = typing_burst(nodes, keystrokes)
+            frames = sum(s.frames_sent for s in nodes[0].transport.senders.values())
+            print(f"{label:<16} {local:>10.3f} {total:>17.3f} {keystrokes / total:>10.0f} {frames:>8}")
+        finally:
+            for n in nodes:
+                n.stop()
+
+    local, pending, dropped = stalled_peer_burst(keystrokes)
+    print(f"peer travado: {keystrokes} inserções locais em {local:.3f}s ({pending} ops retidos na fila "
+          f"do peer, {dropped} descartados; high_water={STALLED_HIGH_WATER})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+bench_bulk.py - Replay de um log de operações: uma a uma vs. em lote
+
+Quatro autores digitam (uma inserção por tecla, ~10% de backspaces) em
+rajadas de 50 teclas em posições sorteadas; o log é o de um dos nós, na
+ordem em que aplicou as operações. Medimos o replay desse log num nó novo:
+- sequencial: cada operação pelo caminho normal (_apply_batch)
+- lote: Node.import_operations, com o RGA montado de uma vez
+- lote + pool: idem, com as subárvores ordenadas em P processos
+em dois cenários: o log inteiro num documento vazio e a segunda metade do
+log sobre o documento com a primeira (cada rajada vira uma subárvore
+pendurada num caractere existente, como na cauda do log em disco depois
+de um snapshot). O tempo do pool inclui a criação dos processos (spawn).
+Os textos resultantes são comparados com o do replay sequencial.
+
+Uso: python3 bench_bulk.py [teclas] [processos]
+"""
+import gc
+import json
+import random
+import sys
+import time
+from node import Node
+
+AUTHORS = ['node1', 'node2', 'node3', 'node4']
+BURST = 50
+
+
+def generate(keys):
+    """Log (na ordem de aplicação de node1) de uma sessão com vários autores"""
+    nodes = {}
+    for author in AUTHORS:
+        peers = [(peer, 'localhost', 0) for peer in AUTHORS if peer != author]
+        nodes[author] = Node(author, 'localhost', 0, peers, id_mode='lamport', gc_interval=0)
+    log = []
+    nodes['node1'].replica._log = log.append
+    outbox = []
+    for author, node in nodes.items():
+        node._broadcast = lambda message, author=author: outbox.append((author, message))
+    rnd = random.Random(11)
+    typed = 0
+    while typed < keys:
+        node = nodes[rnd.choice(AUTHORS)]
+        cursor = rnd.randint(0, len(node.document))
+        for _ in range(BURST):
+            if cursor and rnd.random() < 0.1:
+                cursor -= 1
+                node.delete(cursor)
+            else:
+                node.insert(cursor, rnd.choice('abcdefgh '))
+                cursor += 1
+            typed += 1
+        # Fim da rajada: todos recebem o que foi enviado
+        for author, message in outbox:
+            data = json.loads(json.dumps(message))
+            for other, peer in nodes.items():
+                if other != author:
+                    peer._apply_batch([data])
+        outbox.clear()
+    return [json.loads(json.dumps(message)) for message in log]
+
+
+def fresh():
+    return Node('node9', 'localhost', 0, [('node1', 'localhost', 0)], id_mode='lamport',
+                gc_interval=0)
+
+
+def state(node):
+    return node.get_text(), [(c.site, c.seq, len(c), bool(c.deleted)) for c in node.document.tree]
+
+
+def replay(log, base, mode, processes):
+    node = fresh()
+    node._broadcast = lambda message: None
+    node._apply_batch(log[:base])
+    tail = log[base:]
+    gc.collect()
+    start = time.perf_counter()
+    if mode == 'sequencial':
+        node._apply_batch(tail)
+    else:
+        node.import_operations(tail, processes=processes if mode == 'lote + pool' else 0)
+    elapsed = time.perf_counter() - start
+    return elapsed, state(node)
+
+
+def main():
+    keys = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    start = time.perf_counter()
+    log = generate(keys)
+    print(f"{keys} teclas de {len(AUTHORS)} autores, {len(log)} operações no log "
+          f"(geradas em {time.perf_counter() - start:.1f} s); pool com {processes} processos")
+    print(f"{'cenário':<22} {'modo':<12} {'tempo (s)':>10} {'ops/s':>10} {'igual':>6}")
+    for scenario, base in (('log inteiro', 0), ('metade sobre metade', len(log) // 2)):
+        expected = None
+        for mode in ('sequencial', 'lote', 'lote + pool'):
+            elapsed, result = replay(log, base, mode, processes)
+            if expected is None:
+                expected = result
+            same = 'sim' if result[0] == expected[0] else 'NÃO'
+            print(f"{scenario:<22} {mode:<12} {elapsed:>10.2f} "
+                  f"{(len(log) - base) / elapsed:>10,.0f} {same:>6}")
+
+
+if __name__ == '__main__':
+    main()
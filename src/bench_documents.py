@@ -0,0 +1,67 @@
+"""
+bench_documents.py - Benchmark de um nó com muitos documentos
+
+Um nó com persistência recebe edições em D documentos (cada um começa
+com um parágrafo); no máximo MAX_DOCUMENTS ficam em memória e os demais
+voltam para o disco (LRU). Depois medimos a vazão de edições locais
+quando só um subconjunto dos documentos (os "ativos") está em uso, e a
+memória do processo (tracemalloc) ao final de cada cenário.
+
+Uso: python3 bench_documents.py [documentos] [max_documents]
+"""
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from node import Node
+
+EDITS = 5000
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    max_documents = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    rnd = random.Random(4)
+    base = tempfile.mkdtemp(prefix='bench_documents_')
+    tracemalloc.start()
+    try:
+        node = Node('node1', 'localhost', 0, [], data_dir=base, gc_interval=0,
+                    max_documents=max_documents)
+        node._broadcast = lambda message: None
+        node.start()    # Thread de group commit dos logs dos documentos
+        docs = [f'doc{i:05d}' for i in range(total)]
+
+        start = time.perf_counter()
+        for doc in docs:
+            node.insert(0, 'Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * 10, doc=doc)
+        elapsed = time.perf_counter() - start
+        memory, _ = tracemalloc.get_traced_memory()
+        print(f"{total} documentos criados em {elapsed:.1f}s; {len(node.documents())} em memória "
+              f"(max_documents={max_documents}), {memory / 1e6:.1f} MB")
+
+        print(f"{'ativos':>7} {'edições/s':>10} {'carregados':>11} {'descartados':>12} {'MB':>7}")
+        for active in (10, max_documents // 2, max_documents * 2, total):
+            if active > total:
+                continue
+            working = rnd.sample(docs, active)
+            before = dict(node.document_stats)
+            start = time.perf_counter()
+            for _ in range(EDITS):
+                doc = rnd.choice(working)
+                node.insert(rnd.randint(0, 100), rnd.choice('abcdefgh '), doc=doc)
+            elapsed = time.perf_counter() - start
+            memory, _ = tracemalloc.get_traced_memory()
+            stats = node.document_stats
+            print(f"{active:>7} {EDITS / elapsed:>10,.0f} "
+                  f"{stats['loaded'] - before['loaded']:>11} "
+                  f"{stats['evicted'] - before['evicted']:>12} {memory / 1e6:>7.1f}")
+        node.stop()
+    finally:
+        tracemalloc.stop()
+        shutil.rmtree(base)
+
+
+if __name__ == '__main__':
+    main()
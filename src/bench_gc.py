@@ -0,0 +1,71 @@
+"""
+bench_gc.py - Benchmark da coleta de tombstones
+
+Um documento de longa duração: N caracteres digitados com saltos de
+cursor, dos quais a maior parte é depois deletada (~10 tombstones por
+caractere visível). Medimos memória (tracemalloc), get_text e buscas por
+índice visual antes e depois da coleta, além do tempo da coleta e da
+memória que ela estima ter liberado.
+
+Uso: python3 bench_gc.py [N] [vector|lamport]
+"""
+import random
+import sys
+import time
+import tracemalloc
+from node import Node
+
+
+def measure(node, rnd, lookups=20000):
+    """(MB em uso, s get_text, µs por busca de índice)"""
+    memory, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    text = node.get_text()
+    text_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(lookups):
+        node.document.position_id_at(rnd.randrange(len(text)))
+    lookup_time = (time.perf_counter() - start) / lookups * 1e6
+    return memory / 1e6, text_time, lookup_time
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    id_mode = sys.argv[2] if len(sys.argv) > 2 else 'lamport'
+    rnd = random.Random(3)
+
+    tracemalloc.start()
+    # Nó sem peers: tudo que ele aplicou já é estável
+    node = Node('node1', 'localhost', 0, [], id_mode=id_mode)
+    node._broadcast = lambda message: None
+    cursor = 0
+    for _ in range(n):
+        if rnd.random() < 0.05:
+            cursor = rnd.randint(0, len(node.document))
+        node.insert(cursor, rnd.choice('abcdefgh '))
+        cursor += 1
+    while len(node.document) > n // 11:
+        node.delete(rnd.randrange(len(node.document)))
+    node.operation_log.clear()
+
+    blocks, chars = node.document.tombstones()
+    print(f"{n} caracteres ({id_mode}): {len(node.document)} visíveis, "
+          f"{chars} deletados em {blocks} tombstones")
+    print(f"{'':<8} {'blocos':>9} {'MB':>8} {'get_text (ms)':>14} {'busca (µs)':>11}")
+    before = measure(node, rnd)
+    print(f"{'antes':<8} {len(node.document.tree):>9} {before[0]:>8.1f} "
+          f"{before[1] * 1e3:>14.2f} {before[2]:>11.2f}")
+
+    start = time.perf_counter()
+    removed, _, estimated = node.collect_garbage()
+    gc_time = time.perf_counter() - start
+    after = measure(node, rnd)
+    print(f"{'depois':<8} {len(node.document.tree):>9} {after[0]:>8.1f} "
+          f"{after[1] * 1e3:>14.2f} {after[2]:>11.2f}")
+    print(f"coleta: {removed} blocos em {gc_time:.2f}s; estimado {estimated / 1e6:.1f} MB, "
+          f"medido {before[0] - after[0]:.1f} MB")
+    tracemalloc.stop()
+
+
+if __name__ == '__main__':
+    main()
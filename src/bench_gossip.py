@@ -0,0 +1,117 @@
+"""
+bench_gossip.py - Simulação de disseminação: malha completa vs. gossip
+
+Sobe N nós no mesmo processo, ligados pela rede simulada de
+sim_transport.py (tempo virtual, latência sorteada por mensagem, ordem
+FIFO por conexão, frames binários codificados como no transporte real,
+sem falhas). Depois dos handshakes, nós sorteados
+fazem OPS edições; medimos até todos os nós convergirem:
+- malha: cada nó conectado a todos, operações enviadas a todos
+- gossip: cada nó com alguns vizinhos (anel + atalhos aleatórios),
+  operações enviadas a 'fanout' vizinhos e repassadas; anti-entropia
+  periódica repara o que o repasse não levou
+Colunas: conexões (TCP) no cluster, mensagens enviadas pelo autor de cada
+edição, mensagens e bytes enviados no cluster por edição (repasses, anúncios
+de versão e syncs incluídos), tempo (virtual) da última edição até a
+convergência e fluxos de sync da anti-entropia.
+
+Uso: python3 bench_gossip.py [edições] [fanout] [nós...]
+"""
+import random
+import sys
+import time
+from node import Node
+from sim_transport import SimNetwork
+
+LATENCY = (0.001, 0.010)   # s, por mensagem
+EDIT_INTERVAL = 0.002      # s entre edições (de nós sorteados)
+ANTI_ENTROPY = 0.2         # s entre rodadas de anti-entropia de cada nó
+DEGREE = 8                 # vizinhos por nó (aprox.) no modo gossip
+CHECK = 0.005              # s entre verificações de convergência
+WARMUP = 0.1               # s para os handshakes antes da primeira edição
+
+
+def topology(ids, mode, rnd):
+    """Vizinhos de cada nó: todos (malha) ou anel + atalhos aleatórios"""
+    if mode == 'malha':
+        return {node_id: [p for p in ids if p != node_id] for node_id in ids}
+    size = len(ids)
+    neighbors = {node_id: set() for node_id in ids}
+    for i, node_id in enumerate(ids):
+        for other in (ids[(i + 1) % size], ids[(i - 1) % size]):
+            neighbors[node_id].add(other)
+        while len(neighbors[node_id]) < DEGREE // 2 + 2:
+            other = rnd.choice(ids)
+            if other != node_id:
+                neighbors[node_id].add(other)
+                neighbors[other].add(node_id)
+    return {node_id: sorted(peers) for node_id, peers in neighbors.items()}
+
+
+def converged(nodes):
+    versions = [{site: seq for site, seq in node.applied.clock.items() if seq}
+                for node in nodes]
+    return all(version == versions[0] for version in versions)
+
+
+def run(size, mode, edits, fanout, seed=1):
+    rnd = random.Random(seed)
+    network = SimNetwork(seed, latency=LATENCY)
+    ids = [f'node{i:03d}' for i in range(size)]
+    links = topology(ids, mode, rnd)
+    nodes = []
+    for node_id in ids:
+        peers = [(peer_id, 'sim', 0) for peer_id in links[node_id]]
+        node = Node(node_id, 'sim', 0, peers, id_mode='lamport', gc_interval=0,
+                    fanout=fanout if mode == 'gossip' else 0, members=ids,
+                    anti_entropy_interval=ANTI_ENTROPY, reconnect_interval=0,
+                    transport=network.transport)
+        nodes.append(node)
+    for node in nodes:
+        network.start(node)
+    network.run_until(WARMUP)
+    by_author = 0
+
+    def edit(node):
+        nonlocal by_author
+        before = network.messages
+        node.insert(rnd.randint(0, len(node.get_text())), rnd.choice('abcdefgh '))
+        by_author += network.messages - before
+
+    messages, sent, syncs = network.messages, network.bytes, network.syncs
+    for i in range(edits):
+        network.schedule(WARMUP + i * EDIT_INTERVAL, edit, rnd.choice(nodes))
+
+    last_edit = WARMUP + (edits - 1) * EDIT_INTERVAL
+    network.run_until(last_edit)
+    while not converged(nodes):
+        if network.now - last_edit > 60:
+            raise RuntimeError("Sem convergência em 60 s (virtuais)")
+        network.run_until(network.now + CHECK)
+    texts = {node.get_text() for node in nodes}
+    assert len(texts) == 1, "Textos divergentes com a mesma versão"
+    connections = sum(len(peers) for peers in links.values()) // 2
+    return (connections, by_author, network.messages - messages, network.bytes - sent,
+            network.syncs - syncs, network.now - last_edit)
+
+
+def main():
+    edits = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    fanout = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    sizes = [int(arg) for arg in sys.argv[3:]] or [50, 100, 200]
+    print(f"{edits} edições, fanout {fanout} (gossip), latência {LATENCY[0] * 1e3:.0f}-"
+          f"{LATENCY[1] * 1e3:.0f} ms, anti-entropia a cada {ANTI_ENTROPY * 1e3:.0f} ms")
+    print(f"{'nós':>4} {'modo':<7} {'conexões':>9} {'autor':>6} {'msgs/edição':>12} "
+          f"{'bytes/edição':>13} {'convergência (ms)':>18} {'syncs':>6} {'tempo real (s)':>15}")
+    for size in sizes:
+        for mode in ('malha', 'gossip'):
+            start = time.perf_counter()
+            connections, by_author, messages, sent, syncs, elapsed = run(size, mode, edits, fanout)
+            print(f"{size:>4} {mode:<7} {connections:>9} {by_author / edits:>6.0f} "
+                  f"{messages / edits:>12,.0f} "
+                  f"{sent / edits:>13,.0f} {elapsed * 1e3:>18.0f} {syncs:>6} "
+                  f"{time.perf_counter() - start:>15.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+bench_index.py - Benchmark de replay de inserções remotas no CRDTDocument
+
+Simula uma rajada de tráfego de um peer (digitação sequencial seguida de
+deleções) aplicando N inserções remotas e mede o custo por operação.
+Com o índice de position_id o custo por operação deve ficar estável
+(escalonamento linear do replay total).
+
+Uso: python3 bench_index.py [N1 N2 ...]
+"""
+import sys
+import time
+from crdt_document import CRDTDocument
+
+
+def build_ops(n, site='node2'):
+    """Gera N mensagens de inserção remota no formato do protocolo"""
+    ops = []
+    origin = None
+    for i in range(1, n + 1):
+        clock = [['node1', 0], [site, i]]
+        char = {'value': chr(97 + i % 26), 'vector_clock': clock,
+                'site_id': site, 'deleted': False}
+        ops.append((char, origin))
+        origin = (clock, site)
+    return ops
+
+
+def replay(n):
+    ops = build_ops(n)
+    doc = CRDTDocument()
+
+    start = time.perf_counter()
+    for char, origin in ops:
+        doc.remote_insert(char, origin)
+    # Reenvio (duplicatas) e deleção por ID também passam pelo índice
+    for char, origin in ops[::10]:
+        doc.remote_insert(char, origin)
+        doc.remote_delete((char['vector_clock'], char['site_id']))
+    elapsed = time.perf_counter() - start
+
+    assert len(doc.get_text()) == n - len(ops[::10])
+    return elapsed
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [5000, 10000, 20000, 40000, 80000]
+    print(f"{'N':>8} {'total (s)':>10} {'us/op':>8}")
+    for n in sizes:
+        elapsed = replay(n)
+        print(f"{n:>8} {elapsed:>10.3f} {elapsed / n * 1e6:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
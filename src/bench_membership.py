@@ -0,0 +1,84 @@
+"""
+bench_membership.py - Custo do relógio com o histórico de membros do cluster
+
+Um nó de um cluster com 4 membros atuais cujo documento já recebeu
+operações de H outros nós, que saíram. Dois cenários:
+- ativos: os H sites continuam nos relógios (como quando não havia saída
+  de membros: o relógio guardava todo nó já visto)
+- aposentados: os H nós anunciaram a saída ('leave') e os sites foram
+  aposentados (fora das listas densas, ver vector_clock.py)
+Medimos o tempo de uma edição local (incremento, op_id, publicação do
+estado de leitura) e de uma operação remota aplicada, e o tamanho do op_id
+(JSON) enviado: o relógio inteiro (formato anterior) e o delta.
+Os IDs são dots Lamport; a última coluna é o tamanho que o relógio de um
+position_id teria no modo vetorial (aposentados somados numa só entrada).
+
+Uso: python3 bench_membership.py [edições] [H...]
+"""
+import json
+import random
+import sys
+import time
+from node import Node
+
+PEERS = [('node2', 'localhost', 0), ('node3', 'localhost', 0), ('node4', 'localhost', 0)]
+
+
+def remote_messages(count):
+    """Digitação de um dos membros atuais (node2)"""
+    messages = []
+    source = Node('node2', 'localhost', 0, [('node1', 'localhost', 0)] + PEERS[1:],
+                  id_mode='lamport', gc_interval=0)
+    source._broadcast = messages.append
+    rnd = random.Random(5)
+    for _ in range(count):
+        source.insert(rnd.randint(0, len(source.document)), rnd.choice('abcdefgh '))
+    return [json.loads(json.dumps(message)) for message in messages]
+
+
+def run(history, retire, edits, messages):
+    node = Node('node1', 'localhost', 0, PEERS, id_mode='lamport', gc_interval=0)
+    sent = []
+    node._broadcast = sent.append
+    ghosts = {f'old{i:05d}': 5 for i in range(history)}
+    with node.lock:
+        node.vector_clock.update(ghosts, 5)
+        node.applied.update(ghosts)
+    if retire:
+        for ghost in ghosts:
+            node._remove_member({'type': 'leave', 'site_id': ghost, 'final': 5})
+
+    rnd = random.Random(3)
+    start = time.perf_counter()
+    for _ in range(edits):
+        node.insert(rnd.randint(0, len(node.document)), rnd.choice('abcdefgh '))
+    local = (time.perf_counter() - start) / edits
+    delta_bytes = sum(len(json.dumps(message['op_id'])) for message in sent) / len(sent)
+    full_bytes = len(json.dumps(node.vector_clock.get_copy()))
+    id_bytes = len(json.dumps(sorted(node.vector_clock.id_clock().items())))
+
+    start = time.perf_counter()
+    for message in messages:
+        node._apply_batch([message])
+    remote = (time.perf_counter() - start) / len(messages)
+    return local, remote, full_bytes, delta_bytes, id_bytes
+
+
+def main():
+    edits = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    histories = [int(arg) for arg in sys.argv[2:]] or [0, 100, 1000, 4000]
+    messages = remote_messages(edits)
+    print(f"{edits} edições locais e {edits} remotas, 4 membros atuais")
+    print(f"{'H':>6} {'sites':<12} {'local (us)':>11} {'remota (us)':>12} "
+          f"{'op_id inteiro (B)':>18} {'op_id delta (B)':>16} {'ID vetorial (B)':>16}")
+    for history in histories:
+        for retire in (False, True):
+            local, remote, full_bytes, delta_bytes, id_bytes = run(history, retire, edits,
+                                                                   messages)
+            print(f"{history:>6} {'aposentados' if retire else 'ativos':<12} {local * 1e6:>11.1f} "
+                  f"{remote * 1e6:>12.1f} {full_bytes:>18,} {delta_bytes:>16.1f} "
+                  f"{id_bytes:>16,}")
+
+
+if __name__ == '__main__':
+    main()
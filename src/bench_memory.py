@@ -0,0 +1,54 @@
+"""
+bench_memory.py - Memória e tamanho de mensagem por modo de position_id
+
+Para clusters de 3, 16 e 64 nós, digita N caracteres (um bloco por tecla,
+o pior caso para o documento: a extensão de blocos fica desligada) com o
+relógio já avançado em todos os nós e compara os modos 'vector' (relógio
+vetorial completo no ID) e 'lamport' (dot compacto): bytes por caractere
+no documento e bytes por mensagem.
+
+Uso: python3 bench_memory.py [N]
+"""
+import json
+import random
+import sys
+import tracemalloc
+from crdt_document import CRDTDocument
+from vector_clock import VectorClock
+
+
+def typing_session(n, cluster_size, id_mode):
+    nodes = [f'node{i}' for i in range(1, cluster_size + 1)]
+    clock = VectorClock('node1', nodes)
+    rnd = random.Random(7)
+    clock.update({node: rnd.randint(1, 100000) for node in nodes[1:]})
+    clock.lamport = sum(clock.clock.values())
+
+    tracemalloc.start()
+    doc = CRDTDocument(id_mode, run_limit=1)
+    wire_bytes = 0
+    for i in range(n):
+        clock.increment()
+        char, origin = doc.local_insert(i, 'x', 'node1', clock)
+        message = {'type': 'insert', 'op_id': clock.delta(), 'site_id': 'node1',
+                   'char': char.to_dict(), 'origin_id': origin}
+        if id_mode == 'lamport':
+            message['lamport'] = clock.lamport
+        wire_bytes += len(json.dumps(message)) + 1
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return memory / n, wire_bytes / n
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f"{n} caracteres digitados (um bloco por tecla)")
+    print(f"{'nós':>4} {'modo':<8} {'bytes/char (doc)':>17} {'bytes/msg':>10}")
+    for cluster_size in (3, 16, 64):
+        for id_mode in CRDTDocument.ID_MODES:
+            per_char, per_msg = typing_session(n, cluster_size, id_mode)
+            print(f"{cluster_size:>4} {id_mode:<8} {per_char:>17.1f} {per_msg:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+bench_positions.py - Benchmark de edição local por posição no CRDTDocument
+
+Monta um documento com N caracteres e mede o custo de inserções e deleções
+locais no início, no meio e no fim. Com a árvore de estatística de ordem o
+custo deve ser o mesmo (O(log n)) independentemente da posição.
+
+Mede também a digitação em sequência no meio do documento (cada tecla
+logo após a anterior), localmente e aplicada como inserções remotas num
+segundo documento: com o cursor de cada site o origin não é buscado e as
+teclas estendem o bloco da anterior ('elementos' é quantos nós a
+digitação acrescentou à árvore).
+
+Uso: python3 bench_positions.py [N] [K]
+"""
+import json
+import sys
+import time
+from crdt_document import CRDTDocument
+from vector_clock import VectorClock
+
+
+def build_document(n):
+    doc = CRDTDocument()
+    clock = VectorClock('node1', ['node1', 'node2', 'node3'])
+    for i in range(n):
+        clock.increment()
+        doc.local_insert(i, chr(97 + i % 26), 'node1', clock)
+    return doc, clock
+
+
+def measure(doc, clock, position_of, k):
+    start = time.perf_counter()
+    for _ in range(k):
+        clock.increment()
+        doc.local_insert(position_of(len(doc)), 'x', 'node1', clock)
+        doc.local_delete(position_of(len(doc)))
+    return (time.perf_counter() - start) / (2 * k)
+
+
+def typing(doc, clock, k):
+    """K teclas seguidas no meio do documento; retorna as mensagens de inserção"""
+    cursor = len(doc) // 2
+    messages = []
+    for _ in range(k):
+        clock.increment()
+        char, origin = doc.local_insert(cursor, 'y', 'node1', clock)
+        messages.append((char.to_dict(), origin))
+        cursor += 1
+    return messages
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    k = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+
+    doc, clock = build_document(n)
+    remote, _ = build_document(n)
+    print(f"Documento com {n} caracteres, {k} inserções + {k} deleções por posição")
+    added = len(doc.tree)
+    start = time.perf_counter()
+    messages = typing(doc, clock, k)
+    local = (time.perf_counter() - start) / k
+    added = len(doc.tree) - added
+    messages = json.loads(json.dumps(messages))
+    start = time.perf_counter()
+    for char, origin in messages:
+        remote.remote_insert(char, origin)
+    applied = (time.perf_counter() - start) / k
+    print(f"  {'digitação local':<18} {local * 1e6:8.2f} us/op {added:>8} elementos")
+    print(f"  {'digitação remota':<18} {applied * 1e6:8.2f} us/op")
+    assert doc.get_text() == remote.get_text()
+
+    for label, position_of in (('início', lambda size: 0),
+                               ('meio', lambda size: size // 2),
+                               ('fim', lambda size: size - 1)):
+        per_op = measure(doc, clock, position_of, k)
+        print(f"  {label:<18} {per_op * 1e6:8.2f} us/op")
+
+
+if __name__ == '__main__':
+    main()
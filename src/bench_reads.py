@@ -0,0 +1,106 @@
+"""
+bench_reads.py - Benchmark de leituras concorrentes com aplicação de ops remotas
+
+Três "peers" geram operações de digitação; no nó medido, uma thread de
+recepção por peer entrega as mensagens enquanto R threads leem o texto a
+cada milissegundo (como uma interface redesenhando a tela). Dois cenários:
+- lock: cada thread de recepção aplica a mensagem com o lock do nó, e cada
+  leitura adquire o mesmo lock (comportamento anterior)
+- snapshot: as threads de recepção só enfileiram para a thread de
+  aplicação, e as leituras usam o último estado publicado, sem lock
+Medimos o tempo até todas as operações estarem aplicadas e a latência
+das leituras nesse intervalo (média e pior caso).
+
+Uso: python3 bench_reads.py [ops por peer] [leitores]
+"""
+import random
+import statistics
+import sys
+import threading
+import time
+from node import Node
+
+PEERS = ['node2', 'node3', 'node4']
+
+
+def generate(count):
+    """Mensagens de cada peer, digitando em trechos do próprio documento"""
+    streams = {}
+    rnd = random.Random(9)
+    for peer in PEERS:
+        messages = []
+        source = Node(peer, 'localhost', 0, [], gc_interval=0)
+        source._broadcast = messages.append
+        for _ in range(count):
+            source.insert(rnd.randint(0, len(source.document)), rnd.choice('abcdefgh '))
+        streams[peer] = messages
+    return streams
+
+
+def run(streams, readers, scenario):
+    node = Node('node1', 'localhost', 0, [], gc_interval=0)
+    node._broadcast = lambda message: None
+    if scenario == 'snapshot':
+        node.start()
+        receive = node._process_message
+        read = node.get_text
+    else:
+        receive = lambda message: node._apply_batch([message])
+        def read():
+            with node.lock:
+                return node.document.get_text()
+
+    total = sum(len(messages) for messages in streams.values())
+    done = threading.Event()
+    latencies = [[] for _ in range(readers)]
+
+    def reader(slot):
+        while not done.is_set():
+            start = time.perf_counter()
+            read()
+            latencies[slot].append(time.perf_counter() - start)
+            time.sleep(0.001)
+
+    def receiver(messages):
+        for message in messages:
+            receive(message)
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    for thread in threads:
+        thread.start()
+    start = time.perf_counter()
+    receivers = [threading.Thread(target=receiver, args=(messages,)) for messages in streams.values()]
+    for thread in receivers:
+        thread.start()
+    for thread in receivers:
+        thread.join()
+    # Espera a thread de aplicação alcançar as operações enfileiradas
+    while sum(node.read_snapshot().applied.get(peer, 0) for peer in PEERS) < total:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    done.set()
+    for thread in threads:
+        thread.join()
+    if scenario == 'snapshot':
+        node.stop()
+    latencies = [latency for per_reader in latencies for latency in per_reader]
+    return elapsed, latencies, len(node.get_text())
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    streams = generate(count)
+    total = count * len(PEERS)
+    print(f"{total} operações de {len(PEERS)} peers, {readers} leitores")
+    print(f"{'cenário':<10} {'aplicação (s)':>14} {'ops/s':>10} {'leituras':>9} "
+          f"{'média (µs)':>11} {'pior (ms)':>10}")
+    for scenario in ('lock', 'snapshot'):
+        elapsed, latencies, size = run(streams, readers, scenario)
+        assert size == total
+        print(f"{scenario:<10} {elapsed:>14.2f} {total / elapsed:>10,.0f} {len(latencies):>9} "
+              f"{statistics.mean(latencies) * 1e6:>11.1f} {max(latencies) * 1e3:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
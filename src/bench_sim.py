@@ -0,0 +1,151 @@
+"""
+bench_sim.py - Convergência de um cluster grande sob falhas de rede
+
+Sobe N nós (gossip com o fanout pedido, ou malha completa com fanout 0)
+na rede simulada de sim_transport.py, em tempo virtual, e aplica edições
+de nós sorteados (inserções, deleções e delete_range) em cada cenário:
+- ideal: só latência
+- reordem: operações ao vivo fora de ordem e duplicadas
+- perda: mensagens perdidas, derrubando a conexão (o nó reconecta e o
+  hello dispara o sync)
+- partição: o cluster se divide ao meio durante as edições e se reúne
+  depois da última
+- tudo: todas as falhas juntas
+Ao final, todos os nós precisam ter a mesma versão e o mesmo texto.
+Colunas: tempo (virtual) da última edição (ou do fim da partição) até a
+convergência, tempo real da rodada e a razão entre o tempo virtual
+simulado e ele, mensagens e bytes enviados, falhas sorteadas
+(quedas de conexão, duplicadas, fora de ordem), fluxos de sync e o maior
+pico do buffer causal entre os nós. Os bytes são estimados com os
+codecs em regime da rede simulada, compartilhados pelas conexões (ver
+sim_transport.py), e não somam o tráfego exato de cada conexão. O último
+cenário roda duas vezes com a mesma semente para conferir que o
+resultado se repete.
+O custo é de ~115 µs reais por mensagem, quase todo nos nós aplicando e
+repassando as mensagens, não na rede simulada; a razão virtual/real
+depende então do ritmo das edições. Com 200 nós: uma rajada de 100
+edições a cada 5 ms (~80 mil mensagens em ~0,7 s virtuais) roda a
+~0,15x; uma edição por segundo roda a ~3x, onde pesam as rodadas de
+anti-entropia.
+
+Uso: python3 bench_sim.py [nós] [edições] [fanout] [intervalo entre edições em ms]
+"""
+import random
+import sys
+import time
+from bench_gossip import topology
+from node import Node
+from sim_transport import SimNetwork
+
+LATENCY = (0.001, 0.010)   # s, por mensagem
+EDIT_INTERVAL = 0.005      # s entre edições (de nós sorteados)
+ANTI_ENTROPY = 0.2         # s entre rodadas de anti-entropia de cada nó
+RECONNECT = 0.1            # s entre rodadas de reconexão de cada nó
+CHECK = 0.01               # s entre verificações de convergência
+WARMUP = 0.1               # s para os handshakes antes da primeira edição
+TIMEOUT = 60               # s (virtuais) para convergir
+
+SCENARIOS = [
+    ('ideal', {}, False),
+    ('reordem', {'reorder': 0.2, 'duplicate': 0.05}, False),
+    ('perda', {'loss': 0.002}, False),
+    ('partição', {}, True),
+    ('tudo', {'reorder': 0.2, 'duplicate': 0.05, 'loss': 0.002}, True),
+]
+
+
+def converged(nodes):
+    versions = [{site: seq for site, seq in node.applied.clock.items() if seq}
+                for node in nodes]
+    return all(version == versions[0] for version in versions)
+
+
+def edit(node, rnd):
+    length = len(node.get_text())
+    roll = rnd.random()
+    if length > 10 and roll < 0.2:
+        node.delete(rnd.randrange(length))
+    elif length > 10 and roll < 0.3:
+        start = rnd.randrange(length)
+        node.delete_range(start, rnd.randint(1, min(5, length - start)))
+    else:
+        node.insert(rnd.randint(0, length), ''.join(rnd.choice('abcdefgh ')
+                                                   for _ in range(rnd.randint(1, 3))))
+
+
+def run(size, edits, fanout, faults, split, seed=1, interval=EDIT_INTERVAL):
+    rnd = random.Random(seed)
+    network = SimNetwork(seed, latency=LATENCY, **faults)
+    ids = [f'node{i:03d}' for i in range(size)]
+    links = topology(ids, 'gossip' if fanout else 'malha', rnd)
+    nodes = []
+    for node_id in ids:
+        peers = [(peer_id, 'sim', 0) for peer_id in links[node_id]]
+        node = Node(node_id, 'sim', 0, peers, id_mode='lamport', gc_interval=0,
+                    fanout=fanout, members=ids, anti_entropy_interval=ANTI_ENTROPY,
+                    reconnect_interval=RECONNECT, transport=network.transport)
+        nodes.append(node)
+
+    start = time.perf_counter()
+    for node in nodes:
+        network.start(node)
+    network.run_until(WARMUP)
+    before = (network.messages, network.bytes, network.syncs)
+    for i in range(edits):
+        network.schedule(WARMUP + i * interval, edit, rnd.choice(nodes), rnd)
+    last_edit = WARMUP + (edits - 1) * interval
+    if split:
+        # Divide no primeiro terço das edições; reúne depois da última
+        network.schedule(WARMUP + edits // 3 * interval,
+                         network.partition, ids[:size // 2], ids[size // 2:])
+        network.schedule(last_edit + interval, network.heal)
+        last_edit += interval
+
+    network.run_until(last_edit)
+    while not converged(nodes):
+        if network.now - last_edit > TIMEOUT:
+            raise RuntimeError(f"Sem convergência em {TIMEOUT} s (virtuais)")
+        network.run_until(network.now + CHECK)
+    texts = {node.get_text() for node in nodes}
+    assert len(texts) == 1, "Textos divergentes com a mesma versão"
+    return {
+        'convergence': network.now - last_edit,
+        'virtual': network.now,
+        'real': time.perf_counter() - start,
+        'messages': network.messages - before[0],
+        'bytes': network.bytes - before[1],
+        'resets': network.resets,
+        'duplicated': network.duplicated,
+        'reordered': network.reordered,
+        'syncs': network.syncs - before[2],
+        'peak': max(node.buffer_stats()['peak'] for node in nodes),
+        'text': texts.pop(),
+    }
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    edits = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    fanout = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    interval = float(sys.argv[4]) / 1e3 if len(sys.argv) > 4 else EDIT_INTERVAL
+    mode = f"gossip (fanout {fanout})" if fanout else "malha"
+    print(f"{size} nós, {mode}, {edits} edições a cada {interval * 1e3:g} ms, latência "
+          f"{LATENCY[0] * 1e3:.0f}-{LATENCY[1] * 1e3:.0f} ms")
+    print(f"{'cenário':<9} {'convergência (ms)':>18} {'real (s)':>9} {'virtual/real':>13} "
+          f"{'msgs':>9} {'MiB (estim.)':>13} {'quedas':>7} {'dups':>6} {'fora de ordem':>14} "
+          f"{'syncs':>6} {'pico buffer':>12}")
+    for name, faults, split in SCENARIOS:
+        result = run(size, edits, fanout, faults, split, interval=interval)
+        print(f"{name:<9} {result['convergence'] * 1e3:>18.0f} {result['real']:>9.1f} "
+              f"{result['virtual'] / result['real']:>12.2f}x {result['messages']:>9,} "
+              f"{result['bytes'] / 2 ** 20:>13.1f} {result['resets']:>7} "
+              f"{result['duplicated']:>6} {result['reordered']:>14} {result['syncs']:>6} "
+              f"{result['peak']:>12}")
+
+    again = run(size, edits, fanout, faults, split, interval=interval)
+    del result['real'], again['real']
+    print(f"mesma semente, mesmo resultado ({name}): {'sim' if again == result else 'não'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,365 @@
+"""
+bench_suite.py - Gerador de carga e medição de convergência de um cluster
+
+Sobe N nós em loopback (threads de um único processo ou um processo por
+nó, --processes), cada um com a rede real (transporte e formato de fio
+escolhidos), e reproduz cargas de edição configuráveis:
+- typing: cada nó digita um caractere por vez no seu cursor
+- paste: colagens de blocos de texto em posições aleatórias
+- hotspot: todos os nós editam o início do documento ao mesmo tempo
+  (inserções concorrentes na mesma posição e deleções)
+- deletes: deleções de caracteres e de trechos (delete_range), com
+  colagens para repor o texto
+Cada nó edita no ritmo pedido (--rate ops/s) e registra, por operação
+local, o instante da edição e, por site remoto, o instante em que cada
+nova versão ficou visível (estado publicado após a aplicação). Ao final,
+cada nó espera ter aplicado todas as operações de todos os sites.
+
+Métricas por carga: ops/s (edições locais e aplicação até a convergência),
+latência local -> remota (p50/p99/máx, entre cada edição e a publicação
+dela em cada outro nó), tempo da última edição até a convergência e bytes
+enviados pela rede. Os resultados também saem em JSON (--json), com a
+configuração de cada rodada, para acompanhar regressões entre versões.
+
+Uso: python3 bench_suite.py [--nodes N] [--workloads typing,paste,...]
+                            [--ops N] [--rate N] [--processes] [--json arquivo]
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import platform
+import queue
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from bisect import bisect_left
+from crdt_document import CRDTDocument
+from node import Node
+
+WORKLOADS = ('typing', 'paste', 'hotspot', 'deletes')
+
+PASTE_SIZE = 1000       # Caracteres por colagem (paste e reposição em deletes)
+CONNECT_TIMEOUT = 15    # s para o cluster se conectar
+CONVERGE_TIMEOUT = 60   # s para cada nó aplicar tudo após a última edição
+
+
+def free_ports(count):
+    sockets = [socket.socket() for _ in range(count)]
+    for s in sockets:
+        s.bind(('localhost', 0))
+    ports = [s.getsockname()[1] for s in sockets]
+    for s in sockets:
+        s.close()
+    return ports
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+# ----------------------------------------------------------------------
+# Cargas
+# ----------------------------------------------------------------------
+class Editor:
+    """Gera e executa as edições de um nó para uma carga"""
+
+    def __init__(self, node, workload, seed):
+        self.node = node
+        self.workload = workload
+        self.rnd = random.Random(seed)
+        self.cursor = None
+
+    def step(self):
+        node, rnd = self.node, self.rnd
+        size = len(node.get_text())
+        if self.workload == 'typing':
+            if self.cursor is None or self.cursor > size:
+                self.cursor = rnd.randint(0, size)
+            node.insert(self.cursor, rnd.choice('abcdefghij '))
+            self.cursor += 1
+        elif self.workload == 'paste':
+            node.insert(rnd.randint(0, size), ''.join(
+                rnd.choice('abcdefghij ') for _ in range(PASTE_SIZE)))
+        elif self.workload == 'hotspot':
+            if size > 2 and rnd.random() < 0.3:
+                node.delete(rnd.randint(0, 2))
+            else:
+                node.insert(0, rnd.choice('abcdefghij'))
+        elif size < PASTE_SIZE // 2:
+            node.insert(rnd.randint(0, size), 'x' * PASTE_SIZE)
+        elif rnd.random() < 0.5:
+            node.delete(rnd.randint(0, size - 1))
+        else:
+            node.delete_range(rnd.randint(0, size - 1), rnd.randint(2, 40))
+
+
+# ----------------------------------------------------------------------
+# Um nó do cluster (numa thread ou num processo)
+# ----------------------------------------------------------------------
+def track_visible(node, events):
+    """
+    Registra (site, seq, instante) sempre que a versão aplicada de um site
+    remoto avança, no momento em que o novo estado é publicado
+    """
+    replica = node.replica
+    publish = replica._publish
+    seen = {}
+
+    def publish_and_track():
+        publish()
+        now = time.time()
+        for site, seq in replica.applied.clock.items():
+            if seq > seen.get(site, 0):
+                seen[site] = seq
+                if site != node.node_id:
+                    events.append((site, seq, now))
+
+    replica._publish = publish_and_track
+
+
+def run_node(spec, control, results):
+    """
+    Ciclo de um nó: conecta, espera o início, edita no ritmo pedido,
+    anuncia a própria versão final e espera alcançar a de todos
+    """
+    node_id = spec['node_id']
+    node = Node(node_id, 'localhost', spec['port'], spec['peers'], **spec['options'])
+    visible = []
+    track_visible(node, visible)
+    node.start()
+    try:
+        deadline = time.time() + CONNECT_TIMEOUT
+        while len(node.connected_peers()) < len(spec['peers']) and time.time() < deadline:
+            time.sleep(0.02)
+        results.put((node_id, 'ready', len(node.connected_peers())))
+        start = control.get()
+
+        editor = Editor(node, spec['workload'], spec['seed'])
+        interval = 1.0 / spec['rate'] if spec['rate'] > 0 else 0
+        edits = []
+        last = 0
+        for i in range(spec['ops']):
+            delay = start + i * interval - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            before = time.time()
+            editor.step()
+            seq = node.read_snapshot().applied.get(node_id, 0)
+            if seq > last:
+                edits.append((node_id, seq, before))
+                last = seq
+        finished = time.time()
+        results.put((node_id, 'done', {site: seq for site, seq in
+                                       node.read_snapshot().applied.items() if site == node_id}))
+
+        target = control.get()
+        deadline = time.time() + CONVERGE_TIMEOUT
+        converged = None
+        while time.time() < deadline:
+            applied = node.read_snapshot().applied
+            if all(applied.get(site, 0) >= seq for site, seq in target.items()):
+                converged = time.time()
+                break
+            time.sleep(0.001)
+        sent = list(node.transport.senders.values())
+        results.put((node_id, 'result', {
+            'edits': edits,
+            'visible': visible,
+            'finished': finished,
+            'converged': converged,
+            'text': hashlib.sha1(node.get_text().encode('utf-8')).hexdigest(),
+            'length': len(node.get_text()),
+            'bytes': sum(s.bytes_sent for s in sent),
+            'frames': sum(s.frames_sent for s in sent),
+            'buffer_peak': node.buffer_stats()['peak'],
+        }))
+        control.get()
+    finally:
+        node.stop()
+
+
+def run_cluster(config, workload):
+    """Uma rodada: sobe o cluster, aplica a carga e calcula as métricas"""
+    size = config['nodes']
+    ids = [f'node{i}' for i in range(1, size + 1)]
+    ports = dict(zip(ids, free_ports(size)))
+    options = {'id_mode': config['ids'], 'transport': config['transport'],
+               'wire_format': config['wire']}
+
+    if config['processes']:
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        make_queue, spawn = context.Queue, context.Process
+    else:
+        results = queue.Queue()
+        make_queue, spawn = queue.Queue, threading.Thread
+    controls = {}
+    workers = []
+    for i, node_id in enumerate(ids):
+        spec = {
+            'node_id': node_id,
+            'port': ports[node_id],
+            'peers': [(p, 'localhost', ports[p]) for p in ids if p != node_id],
+            'options': options,
+            'workload': workload,
+            'seed': config['seed'] * 1000 + i,
+            'ops': config['ops'],
+            'rate': config['rate'],
+        }
+        controls[node_id] = make_queue()
+        worker = spawn(target=run_node, args=(spec, controls[node_id], results), daemon=True)
+        worker.start()
+        workers.append(worker)
+
+    def collect(kind):
+        replies = {}
+        while len(replies) < size:
+            node_id, reply_kind, payload = results.get(timeout=CONNECT_TIMEOUT + CONVERGE_TIMEOUT)
+            assert reply_kind == kind, (node_id, reply_kind, kind)
+            replies[node_id] = payload
+        return replies
+
+    def tell_all(message):
+        for control in controls.values():
+            control.put(message)
+
+    connected = collect('ready')
+    if any(count < size - 1 for count in connected.values()):
+        tell_all(None)
+        raise RuntimeError(f"Cluster não conectou a tempo: {connected}")
+    start = time.time() + 0.2
+    tell_all(start)
+    target = {}
+    for version in collect('done').values():
+        target.update(version)
+    tell_all(target)
+    reports = collect('result')
+    tell_all(None)
+    for worker in workers:
+        worker.join(timeout=10)
+    return summarize(ids, reports, start, config)
+
+
+def summarize(ids, reports, start, config):
+    # Latência: para cada edição, o primeiro anúncio em cada outro nó de uma
+    # versão do site que a inclua
+    visible = {}
+    for node_id in ids:
+        per_site = {}
+        for site, seq, at in reports[node_id]['visible']:
+            per_site.setdefault(site, ([], []))
+            per_site[site][0].append(seq)
+            per_site[site][1].append(at)
+        visible[node_id] = per_site
+    latencies = []
+    edits = 0
+    for node_id in ids:
+        for site, seq, at in reports[node_id]['edits']:
+            edits += 1
+            for other in ids:
+                if other == node_id:
+                    continue
+                seqs, times = visible[other].get(site, ((), ()))
+                index = bisect_left(seqs, seq)
+                if index < len(seqs):
+                    latencies.append(times[index] - at)
+
+    finished = max(report['finished'] for report in reports.values())
+    converged_at = [report['converged'] for report in reports.values()]
+    converged = (all(at is not None for at in converged_at)
+                 and len({report['text'] for report in reports.values()}) == 1)
+    total_ops = config['ops'] * len(ids)
+    wire = sum(report['bytes'] for report in reports.values())
+    return {
+        'ops': total_ops,
+        'edits': edits,
+        'converged': converged,
+        'length': reports[ids[0]]['length'],
+        'local_ops_per_sec': total_ops / (finished - start),
+        'applied_ops_per_sec': total_ops / (max(converged_at) - start) if converged else None,
+        'latency_ms': {
+            'p50': percentile(latencies, 0.50) * 1e3 if latencies else None,
+            'p99': percentile(latencies, 0.99) * 1e3 if latencies else None,
+            'max': max(latencies) * 1e3 if latencies else None,
+            'samples': len(latencies),
+        },
+        'convergence_ms': (max(converged_at) - finished) * 1e3 if converged else None,
+        'wire_bytes': wire,
+        'wire_frames': sum(report['frames'] for report in reports.values()),
+        'wire_bytes_per_op': wire / total_ops,
+        'buffer_peak': max(report['buffer_peak'] for report in reports.values()),
+    }
+
+
+def revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga e convergência de um cluster de nós")
+    parser.add_argument('--nodes', type=int, default=3)
+    parser.add_argument('--workloads', default=','.join(WORKLOADS),
+                        help=f"Cargas separadas por vírgula ({', '.join(WORKLOADS)})")
+    parser.add_argument('--ops', type=int, default=500, help="Edições por nó")
+    parser.add_argument('--rate', type=float, default=200, help="Edições por segundo por nó (0 = sem limite)")
+    parser.add_argument('--processes', action='store_true',
+                        help="Um processo por nó (padrão: threads num único processo)")
+    parser.add_argument('--transport', choices=sorted(Node.TRANSPORTS), default='thread')
+    parser.add_argument('--wire', choices=Node.WIRE_FORMATS, default='binary')
+    parser.add_argument('--ids', choices=CRDTDocument.ID_MODES, default='vector')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', default=None, help="Arquivo para os resultados em JSON")
+    args = parser.parse_args()
+
+    workloads = [w for w in args.workloads.split(',') if w]
+    for workload in workloads:
+        if workload not in WORKLOADS:
+            parser.error(f"carga inválida: {workload}")
+    config = {key: getattr(args, key) for key in
+              ('nodes', 'ops', 'rate', 'processes', 'transport', 'wire', 'ids', 'seed')}
+
+    runs = []
+    print(f"{args.nodes} nós ({'processos' if args.processes else 'threads'}), {args.ops} edições "
+          f"por nó a {args.rate:.0f}/s, transporte {args.transport}, fio {args.wire}, IDs {args.ids}")
+    print(f"{'carga':<9} {'local ops/s':>12} {'aplic. ops/s':>13} {'p50 (ms)':>9} {'p99 (ms)':>9} "
+          f"{'conv. (ms)':>11} {'bytes/op':>9} {'ok':>3}")
+    for workload in workloads:
+        metrics = run_cluster(config, workload)
+        runs.append({'workload': workload, **metrics})
+        latency = metrics['latency_ms']
+
+        def show(value, spec):
+            return format(value, spec) if value is not None else '-'
+        print(f"{workload:<9} {metrics['local_ops_per_sec']:>12,.0f} "
+              f"{show(metrics['applied_ops_per_sec'], '>13,.0f')} "
+              f"{show(latency['p50'], '>9.1f')} {show(latency['p99'], '>9.1f')} "
+              f"{show(metrics['convergence_ms'], '>11.0f')} {metrics['wire_bytes_per_op']:>9,.0f} "
+              f"{'sim' if metrics['converged'] else 'NÃO':>3}")
+
+    if args.json is not None:
+        document = {
+            'revision': revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'config': config,
+            'runs': runs,
+        }
+        with open(args.json, 'w') as f:
+            json.dump(document, f, indent=2)
+    if not all(run['converged'] for run in runs):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+bench_sync.py - Benchmark de sync de réplicas atrasadas (snapshot e delta)
+
+Um nó gera N operações (digitação com saltos de cursor e ~20% de
+deleções). Medimos quanto custa colocar em dia:
+- uma réplica nova (snapshot completo)
+- uma réplica que parou na metade (delta com a segunda metade)
+comparando com o replay das N mensagens originais, uma a uma.
+Tudo em processo, sem rede: mede geração, tamanho e aplicação do fluxo.
+
+Uso: python3 bench_sync.py [N] [vector|lamport]
+"""
+import random
+import sys
+import time
+from node import Node
+
+
+def make_node(node_id, id_mode):
+    peers = [(p, 'localhost', 0) for p in ('node1', 'node2', 'node3') if p != node_id]
+    node = Node(node_id, 'localhost', 0, peers, id_mode=id_mode)
+    node.outbox = []
+    node._broadcast = node.outbox.append
+    node._send = lambda peer_id, message: node.outbox.append(message)
+    return node
+
+
+def edit(node, count, rnd):
+    cursor = len(node.document)
+    for _ in range(count):
+        length = len(node.document)
+        if rnd.random() < 0.05:
+            cursor = rnd.randint(0, length)
+        if length and cursor and rnd.random() < 0.2:
+            cursor -= 1
+            node.delete(cursor)
+        else:
+            node.insert(cursor, rnd.choice('abcdefgh '))
+            cursor += 1
+
+
+def sync(source, target):
+    """Envia de source para target o que falta; retorna (s gerar, s aplicar, bytes, tipo)"""
+    source.outbox.clear()
+    start = time.perf_counter()
+    source._on_peer_hello(target.node_id, target._hello_message())
+    generated = time.perf_counter() - start
+    messages = list(source.outbox)
+    start = time.perf_counter()
+    for message in messages:
+        target._process_message(message)
+    applied = time.perf_counter() - start
+    size = sum(len(m['data']) for m in messages)
+    kind = messages[0]['kind'] if messages else '-'
+    assert target.get_text() == source.get_text(), "Réplicas divergiram"
+    return generated, applied, size, kind
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    id_mode = sys.argv[2] if len(sys.argv) > 2 else 'lamport'
+    rnd = random.Random(1)
+
+    source = make_node('node1', id_mode)
+    start = time.perf_counter()
+    edit(source, n // 2, rnd)
+    halfway = make_node('node3', id_mode)
+    sync(source, halfway)
+    edit(source, n - n // 2, rnd)
+    print(f"{n} operações ({id_mode}) geradas em {time.perf_counter() - start:.1f}s; "
+          f"{len(source.document.tree)} blocos, {len(source.document)} caracteres visíveis")
+
+    # Replay das mensagens originais numa réplica nova
+    replayed = make_node('node2', id_mode)
+    start = time.perf_counter()
+    for message in source.outbox:
+        if message['type'] != 'sync':
+            replayed._process_message(message)
+    replay_time = time.perf_counter() - start
+
+    fresh = make_node('node2', id_mode)
+    print(f"{'cenário':<22} {'tipo':<9} {'gerar (s)':>10} {'aplicar (s)':>12} {'MB':>7}")
+    print(f"{'replay de mensagens':<22} {'-':<9} {'-':>10} {replay_time:>12.2f} {'-':>7}")
+    for label, target in (('réplica nova', fresh), ('réplica na metade', halfway)):
+        generated, applied, size, kind = sync(source, target)
+        print(f"{label:<22} {kind:<9} {generated:>10.2f} {applied:>12.2f} {size / 1e6:>7.2f}")
+
+
+if __name__ == '__main__':
+    main()
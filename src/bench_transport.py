@@ -0,0 +1,59 @@
+"""
+bench_transport.py - Transporte com threads vs. asyncio
+
+Sobe N nós no mesmo processo (loopback, malha completa). Cada nó digita K
+caracteres concorrentemente; mede as operações aplicadas por segundo em
+todo o cluster e a latência de convergência (da última edição local até
+todos os nós exibirem o mesmo texto).
+
+Uso: python3 bench_transport.py [N] [K]
+"""
+import sys
+import threading
+import time
+from bench_broadcast import start_cluster
+
+
+def concurrent_typing(nodes, keystrokes, timeout=300):
+    def type_on(node):
+        for i in range(keystrokes):
+            node.insert(i, 'abcdefghij'[i % 10])
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=type_on, args=(n,)) for n in nodes]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    last_local = time.perf_counter()
+
+    expected_length = keystrokes * len(nodes)
+    while time.perf_counter() - start < timeout:
+        texts = [n.get_text() for n in nodes]
+        if len(texts[0]) == expected_length and len(set(texts)) == 1:
+            end = time.perf_counter()
+            return end - start, end - last_local
+        time.sleep(0.01)
+    raise RuntimeError("Sem convergência dentro do tempo limite")
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    keystrokes = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    # Cada op é aplicada localmente e em todos os outros nós
+    applied = size * keystrokes * size
+
+    print(f"{size} nós, {keystrokes} inserções por nó (concorrentes)")
+    print(f"{'transporte':<12} {'total (s)':>10} {'ops aplicados/s':>16} {'convergência (s)':>17}")
+    for transport in ('thread', 'asyncio'):
+        nodes = start_cluster(size, transport=transport)
+        try:
+            total, convergence = concurrent_typing(nodes, keystrokes)
+            print(f"{transport:<12} {total:>10.3f} {applied / total:>16.0f} {convergence:>17.3f}")
+        finally:
+            for n in nodes:
+                n.stop()
+
+
+if __name__ == '__main__':
+    main()
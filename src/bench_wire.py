@@ -0,0 +1,93 @@
+"""
+bench_wire.py - Microbenchmark de serialização: linhas JSON vs frames binários
+
+Gera as mensagens de uma sessão de digitação (inserts de um caractere e
+alguns deletes) num cluster de N nós, e mede para cada formato, com e sem
+compressão zlib da conexão, o tamanho médio por mensagem e o tempo de
+codificar e decodificar o fluxo inteiro, em lotes como os que os
+PeerSender enviam.
+
+Uso: python3 bench_wire.py [mensagens] [nós]
+"""
+import json
+import random
+import sys
+import time
+from crdt_document import CRDTDocument
+from outbound import OutgoingMessage, encode_frame
+from vector_clock import VectorClock
+from wire import BinaryEncoder, FrameCompressor, FrameDecoder
+
+
+def typing_messages(n, cluster_size, id_mode):
+    nodes = [f'node{i}' for i in range(1, cluster_size + 1)]
+    clock = VectorClock('node1', nodes)
+    rnd = random.Random(7)
+    clock.update({node: rnd.randint(1, 100000) for node in nodes[1:]})
+    clock.lamport = sum(clock.clock.values())
+
+    doc = CRDTDocument(id_mode)
+    messages = []
+    for i in range(n):
+        clock.increment()
+        if i % 10 == 9:
+            target = doc.local_delete(len(doc) - 1)
+            message = {'type': 'delete', 'site_id': 'node1', 'target_id': target.position_id}
+        else:
+            char, origin = doc.local_insert(len(doc), 'x', 'node1', clock)
+            message = {'type': 'insert', 'op_id': clock.delta(), 'site_id': 'node1',
+                       'char': char.to_dict(), 'origin_id': origin}
+        if id_mode == 'lamport':
+            message['lamport'] = clock.lamport
+        # Mesma forma que a mensagem tem depois de passar pela rede
+        messages.append(json.loads(json.dumps(message)))
+    return messages
+
+
+def run(messages, binary, batch_size, compress=False):
+    outgoing = [OutgoingMessage(m) for m in messages]
+    encoder = BinaryEncoder() if binary else None
+    compressor = FrameCompressor() if compress else None
+
+    start = time.perf_counter()
+    frames = [encode_frame(outgoing[i:i + batch_size], encoder)
+              for i in range(0, len(outgoing), batch_size)]
+    if compressor is not None:
+        frames = [compressor.compress(frame) for frame in frames]
+    encode_time = time.perf_counter() - start
+
+    stream = b''.join(frames)
+    decoder = FrameDecoder()
+    start = time.perf_counter()
+    decoded = []
+    # Entrega em pedaços de 64 KiB, como o recv() dos transportes
+    for i in range(0, len(stream), 65536):
+        for msg in decoder.feed(stream[i:i + 65536]):
+            if msg.get('type') == 'batch':
+                decoded.extend(msg['ops'])
+            else:
+                decoded.append(msg)
+    decode_time = time.perf_counter() - start
+
+    assert decoded == messages, "Mensagens decodificadas diferem das originais"
+    n = len(messages)
+    return len(stream) / n, encode_time / n * 1e6, decode_time / n * 1e6
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    cluster_size = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    print(f"{n} mensagens, cluster de {cluster_size} nós")
+    print(f"{'modo':<8} {'lote':>5} {'formato':<12} {'bytes/msg':>10} {'enc µs/msg':>11} {'dec µs/msg':>11}")
+    for id_mode in CRDTDocument.ID_MODES:
+        messages = typing_messages(n, cluster_size, id_mode)
+        for batch_size in (1, 64):
+            for compress in (False, True):
+                for binary in (False, True):
+                    size, enc, dec = run(messages, binary, batch_size, compress)
+                    label = ('binary' if binary else 'json') + ('+zlib' if compress else '')
+                    print(f"{id_mode:<8} {batch_size:>5} {label:<12} {size:>10.1f} {enc:>11.2f} {dec:>11.2f}")
+
+
+if __name__ == '__main__':
+    main()
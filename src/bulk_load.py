@@ -0,0 +1,181 @@
+"""
+bulk_load.py - Ordenação do RGA em lote (replay e importação de logs)
+
+Inserir N blocos um a um custa, por bloco, a busca do origin e a varredura
+dos irmãos concorrentes. Com o lote inteiro em mãos a ordem final sai de
+uma única passada: a sequência do RGA é o percurso em pré-ordem da árvore
+de origins, com os filhos de cada caractere do maior para o menor ID (o
+que as inserções sequenciais produzem). Num bloco, o caractere seguinte
+do próprio bloco também é filho do anterior: os filhos com ID maior que
+ele vêm antes (o bloco é dividido), os demais depois do restante do bloco.
+
+Cada raiz (bloco cujo origin não está no lote) forma, com o que pende dela,
+uma subárvore independente das demais. Com 'processes' > 1, lotes grandes
+são ordenados num pool de processos, um grupo de subárvores por tarefa;
+os processos recebem e devolvem só tuplas e inteiros, não os blocos.
+"""
+import multiprocessing
+from bisect import bisect_right, insort
+from concurrent.futures import ProcessPoolExecutor
+from functools import cmp_to_key
+from character import Character
+
+# Abaixo disto (blocos) o pool custa mais do que economiza
+PARALLEL_MIN = 50000
+
+
+def _id_at(pid, offset):
+    """position_id do caractere no deslocamento 'offset' de um bloco (ver Character.id_at)"""
+    clock, site = pid
+    if isinstance(clock, int):
+        return (clock + offset, site)
+    return (tuple((k, v + offset) if k == site else (k, v) for k, v in clock), site)
+
+
+def _compare(a, b):
+    if Character.id_less(a, b):
+        return -1
+    return 1 if Character.id_less(b, a) else 0
+
+
+def _locator(items):
+    """Localiza (bloco, deslocamento) de um dot entre os blocos do lote"""
+    sites = {}
+    for i, (pid, length, origin) in enumerate(items):
+        site = pid[1]
+        seq = Character.seq_of(pid)
+        runs = sites.get(site)
+        if runs is None:
+            runs = sites[site] = ([], {})
+        starts, blocks = runs
+        if not starts or seq > starts[-1]:
+            starts.append(seq)
+        else:
+            insort(starts, seq)
+        blocks[seq] = (i, length)
+
+    def locate(dot):
+        runs = sites.get(dot[0])
+        if runs is None:
+            return None
+        starts, blocks = runs
+        k = bisect_right(starts, dot[1]) - 1
+        if k < 0:
+            return None
+        i, length = blocks[starts[k]]
+        offset = dot[1] - starts[k]
+        return (i, offset) if offset < length else None
+
+    return locate
+
+
+def order(items):
+    """
+    Ordena as subárvores de um lote. 'items' é uma lista de (position_id
+    do primeiro caractere, tamanho, dot do origin ou None), em ordem
+    causal. Retorna (raízes, ordem): as raízes são os índices dos blocos
+    cujo origin não está no lote, e ordem[raiz] é a sequência de trechos
+    (índice, início, fim) da subárvore dela, na ordem do documento.
+    """
+    locate = _locator(items)
+    roots = []
+    children = {}   # índice do bloco -> {deslocamento: [filhos]}
+    for i, (pid, length, origin) in enumerate(items):
+        found = locate(origin) if origin is not None else None
+        if found is None:
+            roots.append(i)
+        else:
+            parent, offset = found
+            children.setdefault(parent, {}).setdefault(offset, []).append(i)
+
+    if items and isinstance(items[0][0][0], int):
+        key = lambda i: items[i][0]    # Dots Lamport: comparação nativa
+    else:
+        key = cmp_to_key(lambda a, b: _compare(items[a][0], items[b][0]))
+    kids = {}
+    for parent, groups in children.items():
+        offsets = sorted(groups)
+        kids[parent] = [offsets, [sorted(groups[o], key=key, reverse=True) for o in offsets], 0]
+
+    result = {}
+    for root in roots:
+        out = []
+        stack = [(root, 0)]
+        while stack:
+            i, start = stack.pop()
+            pid, length = items[i][0], items[i][1]
+            entry = kids.get(i)
+            end = length
+            group = ()
+            if entry is not None and entry[2] < len(entry[0]):
+                offset = entry[0][entry[2]]
+                group = entry[1][entry[2]]
+                entry[2] += 1
+                end = offset + 1
+            out.append((i, start, end))
+            if end == length:
+                # Filhos do último caractere: depois do bloco, do maior ID ao menor
+                stack.extend((child, 0) for child in reversed(group))
+                continue
+            following = _id_at(pid, end)
+            split = 0
+            while split < len(group) and Character.id_less(following, items[group[split]][0]):
+                split += 1
+            # Ordem na pilha é a inversa: maiores, resto do bloco, menores
+            stack.extend((child, 0) for child in reversed(group[split:]))
+            stack.append((i, end))
+            stack.extend((child, 0) for child in reversed(group[:split]))
+        result[root] = out
+    return roots, result
+
+
+def _order_group(items):
+    """Tarefa do pool: ordena um grupo de subárvores inteiras"""
+    return order(items)[1]
+
+
+def order_parallel(items, processes):
+    """
+    Como order, dividindo as subárvores entre 'processes' processos.
+    Lotes pequenos (ou com uma única subárvore) são ordenados aqui mesmo.
+    """
+    if processes <= 1 or len(items) < PARALLEL_MIN:
+        return order(items)
+    locate = _locator(items)
+    root_of = []
+    roots = []
+    for i, (pid, length, origin) in enumerate(items):
+        found = locate(origin) if origin is not None else None
+        if found is None:
+            root_of.append(i)
+            roots.append(i)
+        else:
+            root_of.append(root_of[found[0]])
+    sizes = {}
+    for root in root_of:
+        sizes[root] = sizes.get(root, 0) + 1
+    if len(roots) < 2:
+        return order(items)
+
+    # Grupos de subárvores com tamanhos parecidos (maiores primeiro)
+    tasks = processes * 4
+    groups = [[] for _ in range(tasks)]
+    load = [0] * tasks
+    group_of = {}
+    for root in sorted(roots, key=sizes.get, reverse=True):
+        target = load.index(min(load))
+        group_of[root] = target
+        load[target] += sizes[root]
+    for i, root in enumerate(root_of):
+        groups[group_of[root]].append(i)
+
+    result = {}
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(processes, mp_context=context) as pool:
+        jobs = [(members, pool.submit(_order_group, [items[i] for i in members]))
+                for members in groups if members]
+        for members, job in jobs:
+            for local_root, pieces in job.result().items():
+                result[members[local_root]] = [(members[i], start, end)
+                                               for i, start, end in pieces]
+    return roots, result
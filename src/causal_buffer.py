@@ -0,0 +1,194 @@
+"""
+causal_buffer.py - Buffer de operações remotas aguardando dependências
+
+Uma operação remota só é aplicada quando:
+1. é a próxima do seu site: as operações de um site são entregues na
+   ordem em que ele as gerou (pelo contador do site no op_id), mesmo que
+   cheguem fora de ordem (conexões diferentes, sync, reenvio);
+2. o caractere de que ela depende já está no documento: o origin de uma
+   inserção ou o alvo de uma deleção.
+Até lá ela espera aqui, em vez de ser anexada ao fim ou descartada.
+
+As esperas são indexadas pela dependência que falta:
+- pela posição na sequência do site ({contador inicial: op}), liberada em
+  O(1) quando a operação anterior do site é entregue
+- pelo dot (site, seq) ausente; quando um bloco [first, last] daquele site
+  chega, as operações liberadas são encontradas por busca binária, sem
+  varrer o buffer
+"""
+from bisect import bisect_left, bisect_right
+
+
+class _SiteWaits:
+    __slots__ = ('seqs', 'ops')
+
+    def __init__(self):
+        self.seqs = []     # Seqs aguardados, ordenados
+        self.ops = {}      # seq -> [operações que esperam por ele]
+
+
+class CausalBuffer:
+    """Operações bloqueadas, indexadas pela dependência que falta"""
+
+    def __init__(self):
+        # Por site, o contador (no relógio vetorial) da última operação
+        # entregue: as operações de cada site formam uma sequência contígua
+        self.delivered = {}
+        self._early = {}     # site -> {contador inicial: op} (chegou antes da vez)
+        self._waits = {}     # site do dot -> _SiteWaits
+        self.buffered = 0    # Operações no buffer agora
+        self.peak = 0        # Maior profundidade já atingida
+        self.held = 0        # Total de operações que já precisaram esperar
+        self.released = 0    # Total de operações liberadas
+        self.duplicates = 0  # Operações descartadas por já terem sido entregues
+
+    def __len__(self):
+        return self.buffered
+
+    def _count_in(self):
+        self.buffered += 1
+        self.held += 1
+        if self.buffered > self.peak:
+            self.peak = self.buffered
+
+    def _count_out(self):
+        self.buffered -= 1
+        self.released += 1
+
+    # ------------------------------------------------------------------
+    # Ordem por site
+    # ------------------------------------------------------------------
+    def position(self, site, start, end):
+        """
+        Situação da operação que ocupa os contadores [start, end] do site:
+        'duplicate' (já entregue), 'next' (é a vez dela) ou 'early'.
+        """
+        last = self.delivered.get(site, 0)
+        if end <= last:
+            return 'duplicate'
+        if start <= last + 1:
+            return 'next'
+        return 'early'
+
+    def hold_early(self, site, start, op):
+        """Guarda uma operação que chegou antes das anteriores do seu site"""
+        early = self._early.get(site)
+        if early is None:
+            early = self._early[site] = {}
+        if start in early:
+            self.duplicates += 1
+            return
+        early[start] = op
+        self._count_in()
+
+    def deliver(self, site, end):
+        """
+        Marca como entregue a operação do site que termina em 'end' e
+        retorna a seguinte, se ela já tiver chegado (ou None).
+        """
+        if end > self.delivered.get(site, 0):
+            self.delivered[site] = end
+        early = self._early.get(site)
+        if not early:
+            return None
+        op = early.pop(end + 1, None)
+        if not early:
+            del self._early[site]
+        if op is not None:
+            self._count_out()
+        return op
+
+    def advance(self, delivered):
+        """
+        Incorpora entregas feitas em bloco (sync): descarta as operações
+        adiantadas que ficaram velhas e retorna as que passaram a ser a vez.
+        """
+        ready = []
+        for site, end in delivered.items():
+            if end <= self.delivered.get(site, 0):
+                continue
+            self.delivered[site] = end
+            early = self._early.get(site)
+            if not early:
+                continue
+            for start in [s for s in early if s <= end + 1]:
+                op = early.pop(start)
+                self._count_out()
+                if start == end + 1:
+                    ready.append(op)
+                else:
+                    self.duplicates += 1
+            if not early:
+                del self._early[site]
+        return ready
+
+    # ------------------------------------------------------------------
+    # Espera por dots
+    # ------------------------------------------------------------------
+    def wait(self, dependency, op):
+        """Guarda a operação até o dot 'dependency' chegar ao documento"""
+        dep_site, seq = dependency
+        waits = self._waits.get(dep_site)
+        if waits is None:
+            waits = self._waits[dep_site] = _SiteWaits()
+        ops = waits.ops.get(seq)
+        if ops is None:
+            waits.ops[seq] = [op]
+            seqs = waits.seqs
+            if not seqs or seq > seqs[-1]:
+                seqs.append(seq)
+            else:
+                seqs.insert(bisect_left(seqs, seq), seq)
+        else:
+            ops.append(op)
+        self._count_in()
+
+    def arrived(self, site, first, last):
+        """
+        Os dots (site, first..last) chegaram ao documento: retorna (e tira
+        do buffer) as operações que esperavam por eles.
+        """
+        waits = self._waits.get(site)
+        if waits is None:
+            return []
+        seqs = waits.seqs
+        lo = bisect_left(seqs, first)
+        hi = bisect_right(seqs, last)
+        if lo == hi:
+            return []
+        ready = []
+        for seq in seqs[lo:hi]:
+            ready.extend(waits.ops.pop(seq))
+        del seqs[lo:hi]
+        if not seqs:
+            del self._waits[site]
+        for _ in ready:
+            self._count_out()
+        return ready
+
+    def waiting(self):
+        """Retira e retorna todas as operações que esperam por dots"""
+        ready = []
+        for waits in self._waits.values():
+            for ops in waits.ops.values():
+                ready.extend(ops)
+        self._waits.clear()
+        for _ in ready:
+            self._count_out()
+        return ready
+
+    def dependencies(self):
+        """Número de dots distintos aguardados"""
+        return sum(len(waits.seqs) for waits in self._waits.values())
+
+    def stats(self):
+        """Métricas de profundidade do buffer"""
+        return {
+            'buffered': self.buffered,
+            'peak': self.peak,
+            'held': self.held,
+            'released': self.released,
+            'duplicates': self.duplicates,
+            'waiting_on': self.dependencies(),
+            'early_by_site': {site: len(ops) for site, ops in self._early.items()},
+        }
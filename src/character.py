@@ -1,45 +1,214 @@
 class Character:
-    def __init__(self, value, position_id, deleted=False):
+    """
+    Elemento do RGA. Representa uma sequência contígua ('run') de caracteres
+    inseridos por um mesmo site numa única operação: um único objeto guarda o
+    texto inteiro e o ID do primeiro caractere. O caractere no deslocamento i
+    tem o mesmo ID com o contador do próprio site somado de i (ver id_at).
+    O bloco só é dividido (split) quando uma inserção concorrente ou uma
+    deleção cai no seu interior.
+
+    Há dois formatos de position_id:
+    - vetorial: (tuple_of_tuples do relógio, site_id) - formato original
+    - dot Lamport: (contador_lamport, site_id) - tamanho constante,
+      independente do número de nós do cluster
+    Em ambos, 'seq' é o contador do próprio site e (site, seq) é único.
+
+    O bloco também guarda o dot (site, seq) do seu origin (ou None = início
+    do documento), o que permite reenviá-lo a outra réplica (sync) sem o
+    histórico de mensagens. 'deleted' é False ou, para tombstones, o dot da
+    deleção que o removeu (True quando o dot é desconhecido).
+    """
+
+    # Sem __dict__: no modo Lamport um caractere ocupa poucas palavras
+    __slots__ = ('value', 'clock', 'site', 'seq', 'deleted', 'origin')
+
+    def __init__(self, value, position_id, deleted=False, origin=None):
         self.value = value
+        self.origin = origin
         # position_id deve ser normalizado para (tuple_of_tuples, site_id)
-        # para garantir comparação estável
-        self.position_id = self._normalize_id(position_id)
+        # ou (lamport, site_id) para garantir comparação estável
+        clock, site = Character.normalize_id(position_id)
+        self.site = site
         self.deleted = deleted
-    
-    def _normalize_id(self, pid):
+        if isinstance(clock, int):
+            # Modo Lamport: o próprio contador é o seq; não guardamos relógio
+            self.clock = None
+            self.seq = clock
+        else:
+            self.clock = clock
+            self.seq = Character.seq_of((clock, site))
+
+    @property
+    def position_id(self):
+        if self.clock is None:
+            return (self.seq, self.site)
+        return (self.clock, self.site)
+
+    @staticmethod
+    def normalize_id(pid):
+        """
+        Converte um position_id em sua forma canônica e hashable.
+        Usado tanto na construção do Character quanto nas buscas do índice
+        do CRDTDocument (IDs vindos da rede chegam como listas).
+        """
         if pid is None: return None
         clock, site = pid
-        
+
+        # Dot Lamport: já é canônico
+        if isinstance(clock, int):
+            return (clock, site)
+
         # Se for Dicionário (Injeção Local)
         if isinstance(clock, dict):
             # Transforma dict em tupla de tuplas ordenada
             clock = tuple(sorted(clock.items()))
-            
+
         # Se for Lista (Vindo do JSON/Rede)
         elif isinstance(clock, list):
             # IMPORTANTE: O JSON traz listas de listas [[k,v], [k,v]].
             # Precisamos converter as listas internas [k,v] em tuplas (k,v)
             # antes de converter a lista externa em tupla.
             clock = tuple(sorted(tuple(item) for item in clock))
-            
+
         return (clock, site)
-    
+
+    @staticmethod
+    def seq_of(pid):
+        """Contador do próprio site dentro de um position_id normalizado"""
+        clock, site = pid
+        if isinstance(clock, int):
+            return clock
+        for node_id, counter in clock:
+            if node_id == site:
+                return counter
+        return 0
+
+    @staticmethod
+    def dot_of(pid):
+        """Chave (site, seq) de um position_id (normalizado ou vindo da rede)"""
+        if pid is None: return None
+        pid = Character.normalize_id(pid)
+        return pid[1], Character.seq_of(pid)
+
+    @property
+    def last_seq(self):
+        """Contador do último caractere do bloco"""
+        return self.seq + len(self.value) - 1
+
+    def id_at(self, offset):
+        """position_id do caractere no deslocamento 'offset' do bloco"""
+        if self.clock is None:
+            return (self.seq + offset, self.site)
+        if offset == 0:
+            return (self.clock, self.site)
+        site = self.site
+        return (tuple((k, v + offset) if k == site else (k, v) for k, v in self.clock), site)
+
+    def copy(self):
+        """
+        Cópia do bloco no estado atual. Só 'value' (divisão, extensão) e
+        'deleted' mudam depois de criado, e os valores são imutáveis: basta
+        copiar as referências.
+        """
+        clone = Character.__new__(Character)
+        clone.value = self.value
+        clone.clock = self.clock
+        clone.site = self.site
+        clone.seq = self.seq
+        clone.deleted = self.deleted
+        clone.origin = self.origin
+        return clone
+
+    def split(self, offset):
+        """
+        Divide o bloco em 'offset': este objeto fica com [0, offset) e um
+        novo Character com [offset, fim) é retornado.
+        """
+        # O origin da parte direita é o caractere anterior do mesmo bloco
+        right = Character(self.value[offset:], self.id_at(offset), self.deleted,
+                          (self.site, self.seq + offset - 1))
+        self.value = self.value[:offset]
+        return right
+
+    def __len__(self):
+        return len(self.value)
+
+    @staticmethod
+    def clock_less(a, b):
+        """
+        a < b entre relógios (tuplas ordenadas de (site, contador)): primeiro
+        pela soma dos contadores, que cresce com a causalidade e não muda
+        quando os sites aposentados viram a entrada FLOOR (ver
+        vector_clock.py); empatados, entrada a entrada, com o site ausente
+        valendo 0. Com entrada e saída de nós os relógios não têm todos os
+        mesmos sites; comparar as tuplas diretamente poria um relógio com
+        um site novo de nome menor antes de um anterior a ele.
+        """
+        sum_a = sum_b = 0
+        for x in a:
+            sum_a += x[1]
+        for y in b:
+            sum_b += y[1]
+        if sum_a != sum_b:
+            return sum_a < sum_b
+        for x, y in zip(a, b):
+            if x != y:
+                if x[0] == y[0]:
+                    return x[1] < y[1]
+                break
+        else:
+            if len(a) == len(b):
+                return False
+        # Sites diferentes: compara sobre a união
+        da, db = dict(a), dict(b)
+        for site in sorted(da.keys() | db.keys()):
+            x, y = da.get(site, 0), db.get(site, 0)
+            if x != y:
+                return x < y
+        return False
+
+    @staticmethod
+    def id_less(a, b):
+        """a < b entre position_ids normalizados (relógio ou contador, depois site)"""
+        if isinstance(a[0], int):
+            return a < b
+        if Character.clock_less(a[0], b[0]):
+            return True
+        if Character.clock_less(b[0], a[0]):
+            return False
+        return a[1] < b[1]
+
     def __lt__(self, other):
         # Lógica Crítica: Comparação de IDs para desempate
-        # Primeiro compara clocks, depois site_id
-        return self.position_id < other.position_id
-        
+        # Primeiro compara clocks (ou o contador Lamport), depois site_id
+        if self.clock is None:
+            return (self.seq, self.site) < (other.seq, other.site)
+        return Character.id_less((self.clock, self.site), (other.clock, other.site))
+
+    def __repr__(self):
+        return f"Character({self.value!r}, {self.position_id!r}, deleted={self.deleted})"
+
     def to_dict(self):
+        if self.clock is None:
+            return {
+                'value': self.value,
+                'lamport': self.seq,
+                'site_id': self.site,
+                'deleted': bool(self.deleted)
+            }
         return {
             'value': self.value,
-            'vector_clock': self.position_id[0], # Já é tupla
-            'site_id': self.position_id[1],
-            'deleted': self.deleted
+            'vector_clock': self.clock, # Já é tupla
+            'site_id': self.site,
+            'deleted': bool(self.deleted)
         }
-    
+
     @staticmethod
     def from_dict(data):
         # Reconstrói ID
-        raw_clock = data['vector_clock'] # Vem como lista do JSON
+        if 'lamport' in data:
+            raw_clock = data['lamport']
+        else:
+            raw_clock = data['vector_clock'] # Vem como lista do JSON
         site = data['site_id']
         return Character(data['value'], (raw_clock, site), data['deleted'])
@@ -1,120 +1,675 @@
 """
 crdt_document.py - Implementação do RGA (Replicated Growable Array)
 """
+import sys
+import time
+import bulk_load
 from character import Character
+from run_index import RunIndex
+from sequence_tree import SequenceTree
+from snapshot import DeleteRun
+from text_view import TextView
 
 class CRDTDocument:
-    def __init__(self):
-        # A lista contém objetos Character.
+    # Formatos de position_id suportados (ver Character)
+    ID_MODES = ('vector', 'lamport')
+    # Tamanho máximo de um bloco estendido pela digitação: cada extensão
+    # copia o texto do bloco, então blocos muito longos deixariam a
+    # digitação quadrática
+    RUN_LIMIT = 512
+    # Cursores guardados (dos sites que inseriram por último): cada mudança
+    # do texto ajusta todos eles
+    CURSORS = 8
+
+    def __init__(self, id_mode='vector', run_limit=None):
+        if id_mode not in self.ID_MODES:
+            raise ValueError(f"Modo de ID inválido: {id_mode}")
+        self.id_mode = id_mode
+        # Tamanho máximo dos blocos estendidos (ver _extend); 1 desliga a
+        # extensão: cada inserção fica num bloco próprio
+        self.run_limit = self.RUN_LIMIT if run_limit is None else run_limit
+        # A sequência de objetos Character fica numa árvore de estatística de
+        # ordem: cada nó sabe quantos caracteres visíveis há na sua subárvore,
+        # então índice visual <-> caractere custa O(log n), assim como inserir.
+        # Cada Character é um bloco (run) de caracteres contíguos de um mesmo
+        # site/operação; blocos só são divididos quando necessário.
         # Começamos vazios. O "início do texto" é virtualmente representado por None/Start.
-        self.characters = [] 
+        self.tree = SequenceTree()
+        # Índice (site, seq) -> nó da árvore.
+        # Permite detectar duplicatas, resolver o origin e localizar o alvo
+        # de uma deleção sem varrer o documento, mesmo no meio de um bloco.
+        self.index = RunIndex()
+        # Dot do bloco onde a próxima passada da coleta de tombstones continua
+        self._gc_cursor = None
+        # Tombstones guardados (blocos, caracteres), mantidos a cada deleção,
+        # divisão e coleta: as estatísticas não varrem o documento
+        self._tombstone_blocks = 0
+        self._tombstone_chars = 0
+        # Texto visível materializado e quem quer ser avisado das mudanças:
+        # cada mudança é um delta (índice, removidos, inseridos)
+        self.view = TextView()
+        self.listeners = []
+        # Cursor de cada site: nó onde ele inseriu por último, seq desse
+        # caractere (o último do bloco) e índice visual logo após ele.
+        # Digitação em sequência (local ou vinda da rede) acha o origin e a
+        # posição por aqui, sem busca na árvore nem no índice.
+        self._cursors = {}
+        # Instrumentação (Metrics do nó) ou None (desligada, ver metrics.py)
+        self.metrics = None
+
+    @property
+    def characters(self):
+        """Lista (cópia) de todos os blocos em ordem, incluindo tombstones. O(n)."""
+        return list(self.tree)
 
     def local_insert(self, index, char_value, site_id, vector_clock):
         """
-        Gera o ID único para o novo char e descobre quem é o 'vizinho da esquerda' (origin).
+        Gera o ID único para o novo bloco e descobre quem é o 'vizinho da esquerda' (origin).
+        'char_value' pode ter vários caracteres: o bloco inteiro usa o relógio
+        atual como ID do primeiro caractere, e o caractere i usa o contador do
+        site somado de i (o chamador deve avançar o relógio de acordo).
         Retorna os dados necessários para criar a mensagem de broadcast.
         """
         # 1. Criar o ID único do novo caractere
         # Nota: Convertemos o dict do relógio para tupla para ser imutável/hashable se necessário
         # Mas aqui, manteremos simples: (clock_dict, site_id)
         # O PDF sugere Position ID = (VectorClock, site_id)
-        new_pos_id = (vector_clock.get_copy(), site_id)
-        
+        # No modo 'lamport' o ID é o dot compacto (contador_lamport, site_id)
+        if self.id_mode == 'lamport':
+            new_pos_id = (vector_clock.lamport, site_id)
+        else:
+            new_pos_id = (vector_clock.id_clock(), site_id)
+
         # 2. Descobrir o ID do vizinho à esquerda (Origin)
         # Se index for 0, o origin é None (Início do Documento)
-        visible_chars = [c for c in self.characters if not c.deleted]
-        
         origin_pos_id = None
-        if index > 0 and index <= len(visible_chars):
-            # O vizinho é o caractere visível no índice anterior
-            origin_pos_id = visible_chars[index - 1].position_id
-        
-        # 3. Criar o objeto caractere
-        new_char = Character(char_value, new_pos_id, deleted=False)
-        
+        if index > 0 and index <= self.tree.weight:
+            cursor = self._cursor(site_id)
+            if cursor is not None and cursor[2] == index:
+                # Continuando a digitação: o vizinho é o nosso último caractere
+                origin_pos_id = cursor[0].item.id_at(len(cursor[0].item) - 1)
+            else:
+                # O vizinho é o caractere visível no índice anterior
+                origin_node, offset = self.tree.find(index - 1)
+                origin_pos_id = origin_node.item.id_at(offset)
+
+        # 3. Criar o objeto caractere (bloco)
+        new_char = Character(char_value, new_pos_id, deleted=False,
+                             origin=Character.dot_of(origin_pos_id))
+
         # 4. Inserir localmente usando a lógica RGA
-        self._rga_insert(new_char, origin_pos_id)
-        
+        self._rga_insert(new_char)
+
         return new_char, origin_pos_id
 
     def remote_insert(self, char_dict, origin_pos_id):
         """
-        Reconstrói o caractere vindo da rede e o insere na posição correta
-        relativa ao seu 'origin'.
+        Reconstrói o caractere (bloco) vindo da rede e o insere na posição
+        correta relativa ao seu 'origin'.
         """
         new_char = Character.from_dict(char_dict)
-        
+        new_char.origin = Character.dot_of(origin_pos_id)
+
         # Verifica se já temos este caractere (idempotência)
-        for c in self.characters:
-            if c.position_id == new_char.position_id:
-                return # Já existe, ignora
+        if (new_char.site, new_char.seq) in self.index:
+            return # Já existe, ignora
 
-        self._rga_insert(new_char, origin_pos_id)
+        self._rga_insert(new_char)
         return new_char
 
-    def _rga_insert(self, new_char, origin_pos_id):
+    def _rga_insert(self, new_char):
         """
         LÓGICA CORE DO RGA:
-        1. Encontra o índice do 'origin'.
+        1. Encontra o nó do 'origin' (dot guardado em new_char.origin).
         2. Varre para a direita pulando caracteres que foram inseridos
            concorrentemente mas têm prioridade (ID maior).
+        O bloco inteiro é posicionado pelo seu primeiro caractere: os demais
+        têm IDs maiores e origin no caractere anterior, logo ficam colados.
+        Quando o origin é o último caractere inserido por um site (o cursor
+        dele), o passo 1 sai do cache de cursores; se além disso nada é
+        pulado, o bloco estende o do origin (ver _extend).
         """
-        insert_index = 0
-        
-        # Passo 1: Encontrar onde começa o origin na lista real (incluindo deletados)
-        if origin_pos_id is not None:
-            found = False
-            for i, c in enumerate(self.characters):
-                if c.position_id == origin_pos_id:
-                    insert_index = i + 1
-                    found = True
-                    break
-            # Se recebemos um origin que não temos (falha causal grave), 
-            # por segurança anexamos ao fim (ou trataríamos buffer de espera).
-            if not found:
-                insert_index = len(self.characters)
+        tree = self.tree
+        metrics = self.metrics
+        if metrics is not None:
+            start = time.perf_counter()
+        # 'anchor' é o nó após o qual vamos inserir (None = início do documento)
+        anchor = None
+        # Índice visual logo após o anchor, quando já conhecido pelo cursor
+        index = None
+
+        # Passo 1: Encontrar o origin na sequência real (incluindo deletados)
+        cursor = None
+        if new_char.origin is not None:
+            cursor = self._cursor(new_char.origin[0])
+        if cursor is not None and cursor[1] == new_char.origin[1]:
+            anchor = cursor[0]
+            index = cursor[2]
+            if metrics is not None:
+                metrics.count('cursor_hits')
+        elif new_char.origin is not None:
+            anchor, offset = self.index.find(*new_char.origin)
+            if anchor is None:
+                # Origin desconhecido: o Node segura operações remotas no
+                # buffer causal até o origin chegar, então isto só acontece
+                # com registros inconsistentes; por segurança anexamos ao fim.
+                anchor = tree.last()
+            elif offset < len(anchor.item) - 1:
+                # O origin está no meio de um bloco: o próximo caractere é o
+                # seguinte do mesmo bloco. Como os IDs crescem dentro do bloco,
+                # ou pulamos o restante inteiro ou dividimos o bloco aqui.
+                if not Character.id_less(new_char.position_id, anchor.item.id_at(offset + 1)):
+                    self._split(anchor, offset + 1)
+        if metrics is not None:
+            metrics.observe('lookup_us', (time.perf_counter() - start) * 1e6)
+            skipped = 0
 
         # Passo 2: Tratar concorrência (Skipping)
         # Se outros nós inseriram coisas APÓS o mesmo origin, precisamos decidir a ordem.
         # Regra: Se o próximo caractere tem o mesmo origin (concorrente),
         # ordenamos decrescentemente pelo ID (ou site_id) para consistência.
-        
+
         # Simplificação robusta: Avançamos enquanto o caractere atual tiver um ID Maior
         # que o nosso. Isso garante que [Y, X] fiquem sempre na mesma ordem em todos os nós.
-        while insert_index < len(self.characters):
-            next_char = self.characters[insert_index]
-            
+        # Basta comparar com o primeiro caractere de cada bloco: se ele é maior,
+        # todos os seguintes do bloco também são.
+        next_node = tree.first() if anchor is None else tree.next(anchor)
+        while next_node is not None:
             # Comparamos os IDs. O __lt__ do Character resolve (Clock, SiteID).
             # Se o next_char for "maior" (mais recente/maior site_id), ele fica à esquerda.
             # Nós pulamos ele.
-            if new_char < next_char: 
-                insert_index += 1
+            if new_char < next_node.item:
+                anchor = next_node
+                next_node = tree.next(next_node)
+                index = None
+                if metrics is not None:
+                    skipped += 1
             else:
                 break
-        
-        self.characters.insert(insert_index, new_char)
-
-    def local_delete(self, index):
-        """Marca como deletado baseado no índice visual"""
-        visible_chars = [c for c in self.characters if not c.deleted]
-        
-        if 0 <= index < len(visible_chars):
-            target_char = visible_chars[index]
-            target_char.deleted = True
-            return target_char # Retorna objeto para pegar o ID e enviar rede
-        return None
-
-    def remote_delete(self, target_pos_id):
+        if metrics is not None:
+            metrics.observe('rga_skip', skipped)
+
+        if anchor is not None and self._extend(anchor, new_char):
+            node = anchor
+            if index is None:
+                index = tree.rank(node) + len(node.item) - len(new_char)
+        else:
+            node = self._insert_node(anchor, new_char)
+            if index is None:
+                index = tree.rank(node)
+        if not new_char.deleted:
+            self._changed(index, 0, new_char.value)
+            cursors = self._cursors
+            cursors.pop(new_char.site, None)
+            cursors[new_char.site] = [node, new_char.last_seq, index + len(new_char)]
+            if len(cursors) > self.CURSORS:
+                del cursors[next(iter(cursors))]
+        else:
+            self._tombstone_chars += len(new_char)
+        return node
+
+    def _extend(self, node, char):
+        """
+        Anexa 'char' ao fim do bloco do nó, se ele é a continuação do bloco:
+        mesmo site, seq seguinte, origin no último caractere e (modo
+        vetorial) o relógio que id_at daria. O chamador garante que 'char'
+        vai logo após o nó. Retorna se anexou.
+        """
+        run = node.item
+        if (run.site != char.site or run.deleted or char.deleted
+                or char.seq != run.last_seq + 1 or char.origin != (run.site, run.last_seq)
+                or len(run) + len(char) > self.run_limit):
+            return False
+        if run.clock is not None and run.id_at(len(run))[0] != char.clock:
+            return False
+        run.value += char.value
+        self.tree.set_weight(node, len(run))
+        return True
+
+    def _cursor(self, site):
+        """
+        Cursor [nó, seq, índice] de 'site' ou None se ele não vale mais: o
+        bloco foi dividido depois do caractere ou o caractere foi deletado
+        (deleções e inserções antes dele já ajustam o índice, ver _changed).
+        """
+        cursor = self._cursors.get(site)
+        if cursor is None:
+            return None
+        char = cursor[0].item
+        if char.deleted or char.last_seq != cursor[1]:
+            del self._cursors[site]
+            return None
+        return cursor
+
+    def bulk_insert(self, chars, processes=0):
+        """
+        Insere de uma vez um lote de blocos (Character com origin, em ordem
+        causal), com o mesmo documento que inseri-los um a um: a ordem do
+        lote sai de uma passada pela árvore de origins (ver bulk_load.py) e
+        cada subárvore entra contígua, após o seu origin. Num documento
+        vazio a árvore é montada direto, em O(n). Blocos já presentes são
+        ignorados. 'processes' > 1 ordena lotes grandes num pool de
+        processos. Retorna os blocos inseridos.
+        """
+        index = self.index
+        fresh = [char for char in chars if (char.site, char.seq) not in index]
+        if not fresh:
+            return []
+        items = [(char.position_id, len(char), char.origin) for char in fresh]
+        roots, order = bulk_load.order_parallel(items, processes)
+
+        def pieces(root):
+            for i, start, end in order[root]:
+                char = fresh[i]
+                if start == 0 and end == len(char):
+                    yield char
+                else:
+                    origin = char.origin if start == 0 else (char.site, char.seq + start - 1)
+                    yield Character(char.value[start:end], char.id_at(start), char.deleted, origin)
+
+        if not len(self.tree) and all(fresh[root].origin is None for root in roots):
+            # Irmãos no início do documento: do maior ID para o menor
+            roots.sort(key=lambda root: fresh[root], reverse=True)
+            self.load(piece for root in roots for piece in pieces(root))
+            return fresh
+        for root in roots:
+            node = None
+            for piece in pieces(root):
+                if node is None:
+                    node = self._rga_insert(piece)
+                    continue
+                # O restante da subárvore vem logo depois (nada do documento
+                # pende de blocos do lote)
+                node = self._insert_node(node, piece)
+                if not piece.deleted:
+                    self._changed(self.tree.rank(node), 0, piece.value)
+                else:
+                    self._tombstone_chars += len(piece)
+        return fresh
+
+    def _changed(self, index, deleted, inserted):
+        """Propaga uma mudança do texto visível para a view e os listeners"""
+        self.view.change(index, deleted, inserted)
+        for listener in self.listeners:
+            listener(index, deleted, inserted)
+        # Cursores depois da mudança andam junto; um cursor cujo caractere
+        # saiu é descartado
+        stale = None
+        for site, cursor in self._cursors.items():
+            position = cursor[2]
+            if index < position:
+                if index + deleted >= position:
+                    stale = stale or []
+                    stale.append(site)
+                else:
+                    cursor[2] = position + len(inserted) - deleted
+        if stale:
+            for site in stale:
+                del self._cursors[site]
+
+    def _insert_node(self, anchor, char):
+        """Insere o bloco após 'anchor' na árvore e o registra no índice"""
+        weight = 0 if char.deleted else len(char)
+        if char.deleted:
+            # Tombstone novo ou parte direita de um tombstone dividido
+            self._tombstone_blocks += 1
+        node = self.tree.insert_after(anchor, char, weight)
+        self.index.add(char.site, char.seq, node)
+        return node
+
+    def _split(self, node, offset):
+        """Divide o bloco do nó em 'offset' e retorna o nó da parte direita"""
+        char = node.item
+        right = char.split(offset)
+        if not char.deleted:
+            self.tree.set_weight(node, len(char))
+        return self._insert_node(node, right)
+
+    def _isolate(self, node, offset):
+        """Garante que o caractere em 'offset' seja um bloco próprio; retorna seu nó"""
+        if offset > 0:
+            node = self._split(node, offset)
+        if len(node.item) > 1:
+            self._split(node, 1)
+        return node
+
+    def _mark_deleted(self, node, dot=True):
+        if node.weight:
+            self._changed(self.tree.rank(node), node.weight, '')
+        node.item.deleted = dot
+        self._tombstone_blocks += 1
+        self._tombstone_chars += len(node.item)
+        self.tree.set_weight(node, 0)
+
+    def local_delete(self, index, dot=True):
+        """
+        Marca como deletado baseado no índice visual.
+        'dot' é o (site, seq) da operação de deleção, guardado no tombstone.
+        """
+        node, offset = self.tree.find(index)
+        if node is None:
+            return None
+        node = self._isolate(node, offset)
+        self._mark_deleted(node, dot)
+        return node.item # Retorna objeto para pegar o ID e enviar rede
+
+    def local_delete_range(self, index, length, dot=True):
+        """
+        Marca como deletados os 'length' caracteres visíveis a partir do
+        índice visual 'index' (uma única operação, com o mesmo 'dot').
+        Retorna as runs deletadas [(site, seq, tamanho)] em ordem do
+        documento; runs contíguas do mesmo site saem juntas.
+        """
+        tree = self.tree
+        remaining = min(length, tree.weight - index) if index >= 0 else 0
+        runs = []
+        deleted = 0
+        while remaining > 0:
+            # Após marcar um bloco, o próximo caractere visível ocupa o
+            # mesmo índice: uma busca O(log n) por bloco atingido
+            node, offset = tree.find(index)
+            if offset > 0:
+                node = self._split(node, offset)
+            char = node.item
+            if len(char) > remaining:
+                self._split(node, remaining)
+            size = len(char)
+            if runs and runs[-1][0] == char.site and runs[-1][1] + runs[-1][2] == char.seq:
+                runs[-1][2] += size
+            else:
+                runs.append([char.site, char.seq, size])
+            char.deleted = dot
+            tree.set_weight(node, 0)
+            self._tombstone_blocks += 1
+            remaining -= size
+            deleted += size
+        if deleted:
+            self._tombstone_chars += deleted
+            self._changed(index, deleted, '')
+        return [tuple(run) for run in runs]
+
+    def remote_delete_range(self, runs, dot=True):
+        """Aplica uma deleção de intervalo: runs [(site, seq, tamanho)]. Retorna quantos caracteres saíram"""
+        return sum(self.delete_run(site, seq, length, dot) for site, seq, length in runs)
+
+    def remote_delete(self, target_pos_id, dot=True):
         """Busca o caractere pelo ID único e marca tombstone"""
-        for c in self.characters:
-            # Precisamos comparar tuplas ou strings de forma consistente
-            # O target_pos_id vem do JSON (listas em vez de tuplas no clock),
-            # então a comparação direta pode falhar se não normalizada.
-            # Assume-se que a normalização ocorre na entrada da mensagem.
-            if c.position_id == target_pos_id:
-                c.deleted = True
-                return c
-        return None
-
-    def get_text(self):
-        return "".join([c.value for c in self.characters if not c.deleted])
+        # O target_pos_id vem do JSON (listas em vez de tuplas no clock),
+        # então normalizamos antes de consultar o índice.
+        node, offset = self.index.find(*Character.dot_of(target_pos_id))
+        if node is None:
+            return None
+        if not node.item.deleted:
+            node = self._isolate(node, offset)
+            self._mark_deleted(node, dot)
+        return node.item
+
+    def delete_run(self, site, seq, length, dot=True):
+        """
+        Marca como deletados os caracteres [seq, seq + length) do site.
+        Caracteres desconhecidos ou já deletados são ignorados.
+        Retorna quantos caracteres foram deletados.
+        """
+        deleted = 0
+        end = seq + length
+        while seq < end:
+            node, offset = self.index.find(site, seq)
+            if node is None:
+                seq += 1
+                continue
+            char = node.item
+            stop = min(end, char.seq + len(char))
+            if not char.deleted:
+                if offset > 0:
+                    node = self._split(node, offset)
+                if stop - seq < len(node.item):
+                    self._split(node, stop - seq)
+                self._mark_deleted(node, dot)
+                deleted += stop - seq
+            seq = stop
+        return deleted
+
+    # ------------------------------------------------------------------
+    # Coleta de tombstones
+    # ------------------------------------------------------------------
+    def collect_tombstones(self, stable, budget=1000):
+        """
+        Remove fisicamente tombstones causalmente estáveis, visitando no
+        máximo 'budget' blocos a partir de onde o passo anterior parou.
+        'stable' é, por site, o maior seq que todas as réplicas já
+        aplicaram. Um tombstone sai quando:
+        - a inserção e a deleção são estáveis: ninguém mais gera operações
+          com ele como origin, e todas as réplicas já o têm
+        - o bloco seguinte é estável ou tem ID menor: uma inserção futura
+          que o RGA pararia antes do tombstone (ID maior que o dele) também
+          para antes do seguinte, pois tem ID maior que tudo que é estável
+        O chamador garante que não há operações remotas em espera (elas
+        foram geradas antes e poderiam depender do tombstone).
+        Retorna (blocos, caracteres, bytes aproximados) removidos e se a
+        passada pelo documento terminou.
+        """
+        tree = self.tree
+        node = None
+        if self._gc_cursor is not None:
+            node, _ = self.index.find(*self._gc_cursor)
+        if node is None:
+            node = tree.first()
+
+        blocks = chars = size = 0
+        while node is not None and budget > 0:
+            budget -= 1
+            following = tree.next(node)
+            char = node.item
+            dot = char.deleted
+            if (dot and dot is not True and dot[1] <= stable.get(dot[0], 0)
+                    and char.last_seq <= stable.get(char.site, 0)
+                    and (following is None or following.item < char
+                         or following.item.last_seq <= stable.get(following.item.site, 0))):
+                size += self._footprint(node)
+                blocks += 1
+                chars += len(char)
+                self.index.remove(char.site, char.seq)
+                tree.remove(node)
+            node = following
+
+        self._tombstone_blocks -= blocks
+        self._tombstone_chars -= chars
+
+        self._gc_cursor = None if node is None else (node.item.site, node.item.seq)
+        return blocks, chars, size, node is None
+
+    @staticmethod
+    def _footprint(node):
+        """Memória aproximada (bytes) de um bloco: nó da árvore, Character, texto e ID"""
+        char = node.item
+        size = sys.getsizeof(node) + sys.getsizeof(char) + sys.getsizeof(char.value)
+        if char.clock is not None:
+            size += sys.getsizeof(char.clock) + sum(sys.getsizeof(entry) for entry in char.clock)
+        return size
+
+    def tombstones(self):
+        """(blocos, caracteres) deletados ainda guardados no documento. O(1)."""
+        return self._tombstone_blocks, self._tombstone_chars
+
+    # ------------------------------------------------------------------
+    # Sync entre réplicas (ver snapshot.py)
+    # ------------------------------------------------------------------
+    def delta(self, version):
+        """
+        Registros que faltam a uma réplica cuja versão (por site, o maior
+        seq já aplicado) é 'version', na ordem do documento:
+        - blocos inseridos depois da versão (com o estado de deleção atual)
+        - DeleteRun para deleções posteriores sobre blocos que ela já tem
+        Como a ordem é a do documento, o origin de cada bloco vem antes dele.
+        """
+        records = []
+        last_run = None
+        for char in self.tree:
+            known = version.get(char.site, 0)
+            if char.seq > known:
+                records.append(char)
+                last_run = None
+                continue
+            # Um bloco estendido pela digitação (ou montado em lote) pode
+            # ter só o começo conhecido: o restante vai como bloco próprio
+            size = len(char)
+            tail = None
+            if char.last_seq > known:
+                size = known - char.seq + 1
+                tail = Character(char.value[size:], char.id_at(size), char.deleted,
+                                 (char.site, known))
+            dot = char.deleted
+            # True = dot desconhecido: reenviamos (a deleção é idempotente)
+            if dot and (dot is True or dot[1] > version.get(dot[0], 0)):
+                if (last_run is not None and last_run.site == char.site and last_run.dot == dot
+                        and last_run.seq + last_run.length == char.seq):
+                    last_run.length += size
+                else:
+                    last_run = DeleteRun(char.site, char.seq, size, dot)
+                    records.append(last_run)
+            if tail is not None:
+                records.append(tail)
+                last_run = None
+        return records
+
+    def merge(self, records, applied=None):
+        """
+        Aplica registros de um delta/snapshot sobre o estado atual (inserção
+        RGA dos blocos que faltam, deleções dos demais). Idempotente.
+        'applied' é a versão desta réplica: blocos que ela já aplicou e não
+        estão no índice são tombstones coletados, e não voltam.
+        """
+        index = self.index
+        applied = applied or {}
+        for record in records:
+            if isinstance(record, DeleteRun):
+                self.delete_run(record.site, record.seq, record.length, record.dot)
+            elif (record.site, record.seq) not in index:
+                if record.last_seq > applied.get(record.site, 0):
+                    self._rga_insert(record)
+            else:
+                self._merge_tail(record, applied.get(record.site, 0))
+                if record.deleted:
+                    self.delete_run(record.site, record.seq, len(record), record.deleted)
+
+    def _merge_tail(self, record, known):
+        """
+        Bloco cujo início já temos: insere o fim que falta, se o remetente
+        o estendeu (digitação ou lote) com operações que não aplicamos.
+        As operações de um site chegam inteiras e em ordem, então o que
+        falta é um sufixo, depois do que já aplicamos ('known').
+        """
+        if record.last_seq <= known:
+            return
+        seq = record.seq
+        while seq <= record.last_seq:
+            node, _ = self.index.find(record.site, seq)
+            if node is None:
+                break
+            seq = node.item.seq + len(node.item)
+        seq = max(seq, known + 1)
+        if seq > record.last_seq:
+            return
+        offset = seq - record.seq
+        self._rga_insert(Character(record.value[offset:], record.id_at(offset), record.deleted,
+                                   (record.site, seq - 1)))
+
+    def load(self, chars):
+        """
+        Substitui o conteúdo pelos blocos de um snapshot (já na ordem do
+        documento), construindo a árvore e o índice em O(n).
+        """
+        previous = self.tree.weight
+        self.tree = SequenceTree()
+        self.index = RunIndex()
+        nodes = self.tree.build((c, 0 if c.deleted else len(c)) for c in chars)
+        self.index.add_many((node.item.site, node.item.seq, node) for node in nodes)
+        deleted = [len(node.item) for node in nodes if node.item.deleted]
+        self._tombstone_blocks = len(deleted)
+        self._tombstone_chars = sum(deleted)
+        self._replaced(previous)
+
+    def swap(self, staged):
+        """
+        Substitui o conteúdo pelo de 'staged', um documento montado à parte
+        (com load, fora do lock de quem usa este), em O(1) mais a
+        remontagem do texto. 'staged' não deve mais ser usado.
+        """
+        previous = self.tree.weight
+        self.tree, self.index = staged.tree, staged.index
+        self._tombstone_blocks, self._tombstone_chars = staged.tombstones()
+        self._replaced(previous)
+
+    def _replaced(self, previous):
+        """Descarta o que dependia do conteúdo anterior ('previous' caracteres visíveis)"""
+        self._cursors = {}
+        self._gc_cursor = None
+        self.view.invalidate()
+        if self.listeners:
+            self._changed(0, previous, self._build_text())
+
+    def get_char(self, pos_id):
+        """Retorna o Character (bloco) que contém o position_id informado (ou None)"""
+        node, _ = self.index.find(*Character.dot_of(pos_id))
+        return node.item if node is not None else None
+
+    def position_id_at(self, index):
+        """position_id do caractere visível no índice visual 'index' (ou None). O(log n)."""
+        node, offset = self.tree.find(index)
+        return node.item.id_at(offset) if node is not None else None
+
+    def visible_index(self, pos_id):
+        """
+        Índice visual do caractere com o position_id informado. O(log n).
+        Para tombstones, retorna o índice que o caractere ocuparia.
+        Retorna None se o ID for desconhecido.
+        """
+        node, offset = self.index.find(*Character.dot_of(pos_id))
+        if node is None:
+            return None
+        if node.item.deleted:
+            offset = 0
+        return self.tree.rank(node) + offset
+
+    def __len__(self):
+        """Quantidade de caracteres visíveis"""
+        return self.tree.weight
+
+    def get_text(self, start=0, end=None):
+        """
+        Texto visível, ou só o trecho [start, end). Vem da view
+        materializada; se ela precisar ser remontada e só um trecho foi
+        pedido, lê direto da árvore em O(log n + trecho).
+        """
+        if start == 0 and end is None:
+            return self.view.text(self._build_text)
+        length = self.tree.weight
+        end = length if end is None else max(0, min(end, length))
+        start = max(0, min(start, end))
+        if self.view.fresh:
+            return self.view.text(self._build_text)[start:end]
+        return self._read_range(start, end)
+
+    def text_handle(self):
+        """Texto visível como TextHandle, montado só quando lido (ver text_view.py)"""
+        return self.view.handle(self._build_text)
+
+    def _build_text(self):
+        return "".join([c.value for c in self.tree if not c.deleted])
+
+    def _read_range(self, start, end):
+        """Trecho [start, end) do texto visível, a partir da árvore"""
+        if start >= end:
+            return ''
+        node, offset = self.tree.find(start)
+        parts = []
+        remaining = end - start
+        while node is not None and remaining > 0:
+            char = node.item
+            if not char.deleted:
+                piece = char.value[offset:offset + remaining]
+                parts.append(piece)
+                remaining -= len(piece)
+                offset = 0
+            node = self.tree.next(node)
+        return ''.join(parts)
@@ -0,0 +1,77 @@
+"""
+dump_snapshot.py - Mostra o conteúdo de um fluxo de snapshot gravado
+
+Lê, aos pedaços, um arquivo no formato de snapshot.py (gravado por
+Node.export ou um snapshot-<n>.rgas do diretório de dados) e mostra o
+cabeçalho e um resumo: blocos, caracteres visíveis, tombstones e deleções
+por site. Antes do resumo, --records lista cada registro, na ordem do
+fluxo, ou --text mostra o texto visível. A memória usada não depende do
+tamanho do arquivo.
+
+Uso: python3 dump_snapshot.py <arquivo> [--records | --text]
+"""
+import argparse
+import json
+import sys
+from snapshot import DeleteRun, SnapshotReader
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conteúdo de um fluxo de snapshot")
+    parser.add_argument('path', help="Arquivo gravado por export ou snapshot-<n>.rgas ('-' = stdin)")
+    show = parser.add_mutually_exclusive_group()
+    show.add_argument('--records', action='store_true', help="Lista cada registro")
+    show.add_argument('--text', action='store_true', help="Mostra o texto visível")
+    args = parser.parse_args()
+
+    source = sys.stdin.buffer if args.path == '-' else open(args.path, 'rb')
+    reader = SnapshotReader()
+    sites = {}      # Site -> [blocos, caracteres, tombstones, deleções]
+    visible = 0
+    try:
+        for record in reader.stream(source):
+            if args.records:
+                print(record_line(record))
+            if isinstance(record, DeleteRun):
+                sites.setdefault(record.site, [0, 0, 0, 0])[3] += record.length
+                continue
+            stats = sites.setdefault(record.site, [0, 0, 0, 0])
+            stats[0] += 1
+            stats[1] += len(record)
+            if record.deleted:
+                stats[2] += len(record)
+            else:
+                visible += len(record)
+                if args.text:
+                    sys.stdout.write(record.value)
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+
+    if args.text:
+        print()
+    header = reader.header
+    print(f"Modo de ID: {header['id_mode']}, Lamport: {header['lamport']}")
+    print(f"Versão: {json.dumps(header['version'], sort_keys=True)}")
+    print(f"Relógio: {json.dumps(header['clock'], sort_keys=True)}")
+    print(f"Entregues: {json.dumps(header['delivered'], sort_keys=True)}")
+    print(f"{'site':<16} {'blocos':>10} {'caracteres':>12} {'tombstones':>12} {'deleções':>10}")
+    for site in sorted(sites):
+        blocks, chars, dead, runs = sites[site]
+        print(f"{site:<16} {blocks:>10,} {chars:>12,} {dead:>12,} {runs:>10,}")
+    total = [sum(stats[i] for stats in sites.values()) for i in range(4)]
+    print(f"{'total':<16} {total[0]:>10,} {total[1]:>12,} {total[2]:>12,} {total[3]:>10,}")
+    print(f"Caracteres visíveis: {visible:,}")
+
+
+def record_line(record):
+    """Uma linha por registro: bloco ou deleção de caracteres que o destino já tem"""
+    if isinstance(record, DeleteRun):
+        return f"DELETE {record.site}:{record.seq}+{record.length} por {record.dot}"
+    origin = 'início' if record.origin is None else f"{record.origin[0]}:{record.origin[1]}"
+    deleted = f" deletado por {record.deleted}" if record.deleted else ""
+    return f"BLOCO {record.site}:{record.seq} após {origin}{deleted} {record.value!r}"
+
+
+if __name__ == '__main__':
+    main()
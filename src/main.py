@@ -1,17 +1,28 @@
 """
 main.py - Interface CLI para o editor colaborativo
 """
+import argparse
+import os
 import sys
 import time
+from crdt_document import CRDTDocument
+from metrics import format_text
 from node import Node
 
 def print_help():
     """Imprime comandos disponíveis"""
     print("\n=== Comandos Disponíveis ===")
     print("  insert <pos> <texto> - Insere texto na posição (substitui o trecho atual)")
-    print("  delete <pos>         - Deleta caractere na posição")
+    print("  delete <pos> [n]     - Deleta n caracteres (padrão 1) a partir da posição")
     print("  show                 - Mostra documento atual")
+    print("  open [doc]           - Passa a editar o documento 'doc' (sem nome: o padrão)")
+    print("  docs                 - Lista os documentos em memória")
+    print("  export <arquivo>     - Grava o documento num arquivo (formato de snapshot)")
+    print("  import <arquivo>     - Incorpora ao documento um arquivo gravado por export")
     print("  log                  - Mostra últimas 10 operações")
+    print("  stats [profile]      - Métricas do nó (ou as funções mais caras amostradas)")
+    print("  members              - Lista os membros do cluster")
+    print("  leave                - Sai do cluster (avisa os peers) e encerra")
     print("  help                 - Mostra esta ajuda")
     print("  quit                 - Sai do programa")
     print("============================\n")
@@ -19,12 +30,37 @@ def print_help():
 def main():
     """Função principal do programa"""
     
-    if len(sys.argv) != 2:
-        print("Uso: python main.py <node_id>")
-        print("Node IDs disponíveis: node1, node2, node3")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Editor colaborativo com CRDT")
+    parser.add_argument('node_id', help="ID do nó (node1, node2 ou node3; outro com --port e --join)")
+    parser.add_argument('--port', type=int, default=None,
+                        help="Porta de um nó fora da configuração fixa")
+    parser.add_argument('--join', default=None,
+                        help="Nós já no cluster (separados por vírgula) pelos quais um nó novo entra")
+    parser.add_argument('--ids', choices=CRDTDocument.ID_MODES, default='vector',
+                        help="Formato dos position_id (igual em todos os nós)")
+    parser.add_argument('--transport', choices=sorted(Node.TRANSPORTS), default='thread',
+                        help="Camada de rede: uma thread por socket ou um event loop asyncio")
+    parser.add_argument('--wire', choices=Node.WIRE_FORMATS, default='binary',
+                        help="Formato das mensagens (binário é negociado no hello; JSON sempre funciona)")
+    parser.add_argument('--compress', action='store_true',
+                        help="Comprime (zlib) o envio aos peers que também usarem --compress")
+    parser.add_argument('--high-water', type=int, default=10000,
+                        help="Mensagens na fila de um peer lento até ele passar a ser atualizado por sync")
+    parser.add_argument('--data-dir', default=None,
+                        help="Diretório para persistir o documento (cada nó usa <dir>/<node_id>)")
+    parser.add_argument('--max-documents', type=int, default=256,
+                        help="Documentos (além do padrão) mantidos em memória com --data-dir")
+    parser.add_argument('--fanout', type=int, default=0,
+                        help="Peers que recebem cada operação diretamente (os demais, por repasse); 0 = todos")
+    parser.add_argument('--metrics', action='store_true',
+                        help="Liga contadores e histogramas dos caminhos quentes (comando 'stats')")
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help="Porta do endpoint HTTP local (/metrics, /stats.json, /profile)")
+    parser.add_argument('--profile-sample', type=int, default=0,
+                        help="Perfila com o cProfile um a cada N lotes de operações recebidas")
+    args = parser.parse_args()
     
-    node_id = sys.argv[1]
+    node_id = args.node_id
     
     # Configuração dos nós (hardcoded para 3 nós)
     nodes_config = {
@@ -33,18 +69,36 @@ def main():
         'node3': ('localhost', 5003, [('node1', 'localhost', 5001), ('node2', 'localhost', 5002)])
     }
     
+    if args.join:
+        # Nó novo: conecta aos nós indicados, que o apresentam aos demais
+        seeds = args.join.split(',')
+        if args.port is None or any(seed not in nodes_config for seed in seeds):
+            print("Erro: use --port <porta> --join <nó>[,<nó>...] (nós node1, node2, node3)")
+            sys.exit(1)
+        nodes_config[node_id] = ('localhost', args.port,
+                                 [(seed,) + nodes_config[seed][:2] for seed in seeds])
+    
     if node_id not in nodes_config:
         print(f"Erro: Node ID '{node_id}' inválido")
-        print("Node IDs disponíveis: node1, node2, node3")
+        print("Node IDs disponíveis: node1, node2, node3 (ou um novo com --port e --join)")
         sys.exit(1)
     
     # Cria e inicia o nó
     host, port, peers = nodes_config[node_id]
-    node = Node(node_id, host, port, peers)
+    data_dir = os.path.join(args.data_dir, node_id) if args.data_dir else None
+    node = Node(node_id, host, port, peers, id_mode=args.ids, transport=args.transport,
+                wire_format=args.wire, compress=args.compress, high_water=args.high_water,
+                data_dir=data_dir, max_documents=args.max_documents,
+                fanout=args.fanout, metrics=args.metrics, metrics_port=args.metrics_port,
+                profile_sample=args.profile_sample)
     
     print(f"\n{'='*50}")
     print(f"  Editor Colaborativo - Nó {node_id}")
     print(f"{'='*50}")
+    if node.recovery_stats is not None:
+        stats = node.recovery_stats
+        print(f"Recuperado do disco: snapshot com {stats['snapshot_blocks']} blocos + "
+              f"{stats['replayed']} operações do log em {stats['seconds']:.2f}s")
     
     node.start()
     
@@ -54,12 +108,15 @@ def main():
     
     print_help()
     
+    # Documento em edição (None = documento padrão do nó)
+    doc = None
+
     # Loop de comandos
     try:
         while True:
             try:
                 # Mostra texto atual e prompt
-                text = node.get_text()
+                text = node.get_text(doc=doc)
                 print(f"\nTexto atual: [{text}]")
                 print(f"Posições:     ", end="")
                 for i in range(len(text)):
@@ -67,7 +124,8 @@ def main():
                 print()
                 
                 try:
-                    command = input(f"\n[{node_id}]> ").strip()
+                    prompt = node_id if doc is None else f"{node_id}:{doc}"
+                    command = input(f"\n[{prompt}]> ").strip()
                 except EOFError:
                     break
                 if not command:
@@ -87,26 +145,94 @@ def main():
                         if not text_value:
                             print("Erro: texto vazio não é permitido")
                             continue
-                        node.insert(pos, text_value)
+                        node.insert(pos, text_value, doc=doc)
                         print(f"✓ Inserido '{text_value}' a partir da posição {pos}")
                     except (ValueError, IndexError):
                         print("Erro: posição inválida ou texto faltando")
                 
                 elif cmd == 'delete':
-                    if len(parts) != 2:
-                        print("Erro: use 'delete <pos>'")
+                    if len(parts) not in (2, 3):
+                        print("Erro: use 'delete <pos> [n]'")
                         continue
                     
                     try:
                         pos = int(parts[1])
-                        node.delete(pos)
-                        print(f"✓ Deletado caractere na posição {pos}")
+                        count = int(parts[2]) if len(parts) == 3 else 1
+                        if count < 1:
+                            print("Erro: use 'delete <pos> [n]' com n >= 1")
+                            continue
+                        if count == 1:
+                            node.delete(pos, doc=doc)
+                            print(f"✓ Deletado caractere na posição {pos}")
+                        else:
+                            node.delete_range(pos, count, doc=doc)
+                            print(f"✓ Deletados {count} caracteres a partir da posição {pos}")
                     except ValueError:
-                        print("Erro: posição inválida")
+                        print("Erro: posição ou quantidade inválida")
                 
                 elif cmd == 'show':
-                    print(f"\nDocumento completo: '{node.get_text()}'")
-                    print(f"Relógio vetorial: {node.vector_clock}")
+                    # Texto e relógio do mesmo estado publicado (sem o lock do nó)
+                    state = node.read_snapshot(doc=doc)
+                    print(f"\nDocumento completo: '{state.text}'")
+                    print(f"Relógio vetorial: {state.clock}")
+                    stats = node.buffer_stats(doc=doc)
+                    print(f"Operações aguardando dependências: {state.buffered} "
+                          f"(pico {stats['peak']}, {stats['waiting_on']} dots aguardados)")
+                    gc = node.garbage_stats(doc=doc)
+                    print(f"Tombstones coletados: {gc['blocks']} blocos, {gc['chars']} caracteres "
+                          f"(~{gc['bytes'] / 1024:.1f} KiB liberados)")
+                
+                elif cmd == 'open':
+                    try:
+                        name = parts[1] if len(parts) > 1 else None
+                        node.get_text(doc=name)   # Carrega (ou cria) o documento
+                        doc = name
+                        print(f"✓ Editando {'o documento padrão' if doc is None else doc}")
+                    except ValueError as e:
+                        print(f"Erro: {e}")
+                
+                elif cmd == 'docs':
+                    names = node.documents()
+                    print(f"Documentos em memória: {', '.join(names) if names else '(nenhum)'}")
+                    print(f"Carregados: {node.document_stats['loaded']}, "
+                          f"descartados: {node.document_stats['evicted']}")
+                
+                elif cmd == 'stats':
+                    if len(parts) > 1 and parts[1] == 'profile':
+                        if node.metrics is None:
+                            print("Métricas desligadas (use --profile-sample)")
+                        else:
+                            print(node.metrics.profile_report())
+                    else:
+                        print(format_text(node.stats()), end='')
+                        if node.metrics is None:
+                            print("(contadores e histogramas desligados; use --metrics)")
+                
+                elif cmd == 'members':
+                    print(f"Membros: {', '.join(node.members) if node.members else '(nenhum)'}")
+                    if node.departed:
+                        print(f"Saíram: {', '.join(node.departed)}")
+                
+                elif cmd == 'leave':
+                    print("\nSaindo do cluster...")
+                    node.leave()
+                    break
+                
+                elif cmd in ('export', 'import'):
+                    if len(parts) != 2:
+                        print(f"Erro: use '{cmd} <arquivo>'")
+                        continue
+                    try:
+                        if cmd == 'export':
+                            with open(parts[1], 'wb') as f:
+                                size = node.export(f, doc=doc)
+                            print(f"✓ Documento gravado em {parts[1]} ({size} bytes)")
+                        else:
+                            with open(parts[1], 'rb') as f:
+                                count = node.import_snapshot(f, doc=doc)
+                            print(f"✓ {count} registros incorporados de {parts[1]}")
+                    except (OSError, ValueError) as e:
+                        print(f"Erro: {e}")
                 
                 elif cmd == 'log':
                     print("\n--- Últimas 10 operações ---")
@@ -131,7 +257,8 @@ def main():
                 print(f"Erro: {e}")
     
     finally:
-        node.stop()
+        if node.running:   # Depois de 'leave' o nó já parou
+            node.stop()
         print("Nó encerrado.")
 
 if __name__ == '__main__':
@@ -0,0 +1,220 @@
+"""
+metrics.py - Instrumentação do nó: contadores, histogramas e endpoint local
+
+Com a instrumentação desligada (padrão) o nó não tem objeto Metrics e os
+pontos instrumentados custam só um teste de None. Ligada, ela registra:
+- rga_skip: blocos pulados pela varredura do RGA numa inserção
+- lookup_us: tempo da busca do origin no índice (e divisão do bloco)
+- cursor_hits: inserções cujo origin saiu do cursor do site (contador)
+- decode_us: tempo de decodificação de cada leitura do socket
+- lock_wait_us: espera para adquirir o lock de um documento
+- apply_batch / apply_us / inbox_depth: tamanho e tempo de cada lote da
+  thread de aplicação e mensagens ainda na fila de entrada depois dele
+- messages_in: mensagens recebidas (contador)
+Tamanhos de documento, filas de saída e bytes por peer são lidos na hora
+(ver Node.stats). Opcionalmente, um lote a cada 'profile_sample' da thread
+de aplicação roda sob o cProfile.
+
+O MetricsServer expõe as mesmas estatísticas em HTTP, só em localhost:
+/metrics (texto, uma linha 'chave valor' por métrica), /stats.json e
+/profile (funções mais caras amostradas pelo cProfile).
+"""
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Histogram:
+    """Distribuição de valores inteiros em baldes de potências de 2"""
+
+    __slots__ = ('buckets', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.buckets = [0] * 64   # Balde b: valores com b bits (0; 1; 2-3; 4-7; ...)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def observe(self, value):
+        value = int(value)
+        self.buckets[min(value.bit_length(), 63)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, fraction):
+        """Limite superior do balde que contém o percentil (aproximado)"""
+        if not self.count:
+            return 0
+        rank = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return min((1 << bucket) - 1, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0,
+            'p50': self.percentile(0.50),
+            'p99': self.percentile(0.99),
+            'max': self.max,
+        }
+
+
+class Metrics:
+    """
+    Contadores e histogramas de um nó (seguros entre threads).
+
+    Args:
+        profile_sample (int): Perfila um a cada N lotes da thread de
+            aplicação com o cProfile; 0 = sem perfilamento
+    """
+
+    def __init__(self, profile_sample=0):
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self.profile_sample = profile_sample
+        self.profiler = cProfile.Profile() if profile_sample > 0 else None
+        self._batches = 0
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, value):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value)
+
+    def profiled(self, run, *args):
+        """
+        Executa run(*args), sob o cProfile uma vez a cada profile_sample
+        chamadas (só na thread de aplicação)
+        """
+        profiler = self.profiler
+        if profiler is not None:
+            self._batches += 1
+            if self._batches % self.profile_sample == 0:
+                try:
+                    profiler.enable()
+                except ValueError:
+                    # Outro profiler já ativo no processo: desiste de amostrar
+                    self.profiler = None
+                    return run(*args)
+                try:
+                    return run(*args)
+                finally:
+                    profiler.disable()
+        return run(*args)
+
+    def profile_report(self, limit=25):
+        """Funções com maior tempo acumulado nos lotes amostrados (texto)"""
+        if self.profiler is None:
+            return "Perfilamento desligado (profile_sample=0)\n"
+        out = io.StringIO()
+        try:
+            pstats.Stats(self.profiler, stream=out).sort_stats('cumulative').print_stats(limit)
+        except TypeError:
+            return "Nenhum lote amostrado ainda\n"
+        return out.getvalue()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'histograms': {name: histogram.summary()
+                               for name, histogram in self.histograms.items()},
+            }
+
+
+class TimedLock:
+    """Lock que registra a espera para adquiri-lo (histograma 'lock_wait_us')"""
+
+    __slots__ = ('_lock', '_metrics')
+
+    def __init__(self, lock, metrics):
+        self._lock = lock
+        self._metrics = metrics
+
+    def __enter__(self):
+        lock = self._lock
+        if lock.acquire(False):
+            self._metrics.observe('lock_wait_us', 0)
+            return True
+        start = time.perf_counter()
+        lock.acquire()
+        self._metrics.observe('lock_wait_us', (time.perf_counter() - start) * 1e6)
+        return True
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+
+def format_text(stats, prefix=''):
+    """Estatísticas (dicts aninhados) como linhas 'chave valor', chaves com pontos"""
+    lines = []
+    for key, value in stats.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            lines.append(format_text(value, name + '.'))
+        elif isinstance(value, float):
+            lines.append(f"{name} {value:.3f}\n")
+        else:
+            lines.append(f"{name} {value}\n")
+    return ''.join(lines)
+
+
+class MetricsServer:
+    """Servidor HTTP local (thread de fundo) com as estatísticas do nó"""
+
+    def __init__(self, node, port, host='localhost'):
+        node_ref = node
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body, kind = format_text(node_ref.stats()), 'text/plain'
+                elif self.path == '/stats.json':
+                    body, kind = json.dumps(node_ref.stats(), indent=2), 'application/json'
+                elif self.path == '/profile' and node_ref.metrics is not None:
+                    body, kind = node_ref.metrics.profile_report(), 'text/plain'
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', f'{kind}; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass  # Sem uma linha no terminal por requisição
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.server.shutdown()
+        self.server.server_close()
@@ -1,275 +1,855 @@
 """
 node.py - Nó do editor colaborativo distribuído
+
+Um nó hospeda um documento padrão (sempre em memória) e, sob demanda,
+outros documentos identificados por ID (ver replica.py). Os documentos
+extras são carregados na primeira operação ou mensagem que os cita e, com
+persistência, os ociosos menos usados voltam para o disco quando há mais
+de 'max_documents' em memória.
+
+Disseminação: por padrão (malha completa) cada operação vai direto a
+todos os peers conectados. Com 'fanout', ela vai só a alguns peers
+sorteados, que a repassam uma vez, ao entregá-la, a outros sorteados
+(gossip); os peers passam a ser só os vizinhos do nó na topologia, e
+trocas periódicas de versão com um vizinho (anti-entropia) reparam as
+operações que o sorteio não levou a alguém.
+
+Membros: a lista inicial vem da configuração, mas um nó pode entrar
+depois (basta conhecer um membro: o hello leva o endereço dele e os
+membros que cada lado conhece, e quem o recebe anuncia o novo membro aos
+demais numa mensagem 'member') e sair com leave() (mensagem 'leave'; os
+demais tiram o nó da coleta de tombstones e aposentam o site dele nos
+relógios, ver vector_clock.py).
 """
-import socket
+import os
+import queue
+import random
+import re
 import threading
-import json
-from vector_clock import VectorClock
-from crdt_document import CRDTDocument
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from metrics import Metrics, MetricsServer
+from outbound import OutgoingMessage
+from replica import DocumentReplica
+from transport import ThreadedTransport
+from async_transport import AsyncioTransport
+
+# IDs de documento aceitos (viram nomes de diretório em <data_dir>/docs)
+_DOC_ID = re.compile(r'^[A-Za-z0-9_-][A-Za-z0-9_.-]{0,127}$')
+
 
 class Node:
     """
     Representa um nó no sistema distribuído.
-    Gerencia conexões TCP, operações CRDT e consistência eventual.
+    Gerencia operações CRDT e consistência eventual; as conexões ficam a
+    cargo do transporte escolhido ('thread' ou 'asyncio', ou uma fábrica,
+    como a da rede simulada de sim_transport.py).
     """
-    
-    def __init__(self, node_id, host, port, peers):
+
+    TRANSPORTS = {
+        'thread': ThreadedTransport,
+        'asyncio': AsyncioTransport,
+    }
+
+    WIRE_FORMATS = ('binary', 'json')
+
+    # Intervalo (s) entre verificações de checkpoint da thread de persistência
+    CHECKPOINT_CHECK = 1.0
+
+    # Máximo de mensagens aplicadas por aquisição do lock na thread de aplicação
+    APPLY_BATCH = 512
+
+    def __init__(self, node_id, host, port, peers, id_mode='vector',
+                 flush_interval=0.005, max_batch=256, transport='thread',
+                 wire_format='binary', reconnect_interval=2.0, gc_interval=1.0,
+                 data_dir=None, fsync_interval=0.005, checkpoint_ops=20000, log_size=1000,
+                 max_documents=256, fanout=0, members=None, anti_entropy_interval=1.0,
+                 metrics=False, metrics_port=None, profile_sample=0, compress=False,
+                 high_water=10000):
         """
         Args:
             node_id (str): ID único do nó
             host (str): IP para escutar
             port (int): Porta para escutar
             peers (list): Lista de (node_id, host, port) dos outros nós
+            id_mode (str): Formato dos position_id: 'vector' (relógio
+                vetorial completo) ou 'lamport' (dot compacto). Todos os
+                nós do cluster devem usar o mesmo modo.
+            flush_interval (float): Janela (s) para agrupar ops pendentes de
+                um peer num único frame; 0 envia assim que possível
+            max_batch (int): Máximo de ops por frame enviado
+            transport (str | callable): 'thread' (uma thread por socket),
+                'asyncio' (um único event loop para todas as conexões) ou
+                uma fábrica que recebe o nó e retorna um transporte com a
+                interface de transport.py (ex.: SimNetwork.transport)
+            wire_format (str): 'binary' (frames compactos com peers que
+                também anunciarem o formato no hello; JSON com os demais)
+                ou 'json' (sempre linhas JSON)
+            reconnect_interval (float): Intervalo (s) entre tentativas de
+                (re)conectar a peers sem conexão; 0 conecta uma única vez
+            gc_interval (float): Intervalo (s) entre passadas da coleta de
+                tombstones em segundo plano; 0 desliga (ver collect_garbage)
+            data_dir (str): Diretório do log de operações e dos snapshots
+                (ver wal.py); o estado é recuperado dele na criação do nó.
+                Os demais documentos ficam em <data_dir>/docs/<doc_id>.
+                None = sem persistência
+            fsync_interval (float): Janela (s) do group commit do log
+            checkpoint_ops (int): Operações no log que disparam um novo
+                snapshot compactado (e o descarte do log anterior)
+            log_size (int): Máximo de linhas guardadas em operation_log
+            max_documents (int): Máximo de documentos (além do padrão) em
+                memória; acima disso os ociosos menos usados são gravados
+                em disco e descarregados. Só vale com data_dir
+            fanout (int): Peers que recebem cada operação (e anúncio de
+                versão) diretamente; cada nó repassa o que entrega a outros
+                'fanout' peers. 0 = malha completa (envio a todos, sem
+                repasse)
+            members (list): IDs de todos os nós do cluster, para a coleta
+                de tombstones (que precisa da versão de todas as réplicas).
+                None = os IDs de 'peers' (malha completa). Nós que entram
+                depois são incluídos ao se anunciarem
+            anti_entropy_interval (float): Com fanout, intervalo (s) entre
+                trocas de versão com um vizinho sorteado; 0 desliga
+            metrics (bool): Liga os contadores e histogramas dos caminhos
+                quentes (ver metrics.py); desligados, custam um teste de None
+            metrics_port (int): Porta do endpoint HTTP local de estatísticas
+                (liga as métricas); None = sem endpoint
+            profile_sample (int): Perfila com o cProfile um a cada N lotes da
+                thread de aplicação (liga as métricas); 0 = sem perfilamento
+            compress (bool): Comprime com zlib o que é enviado aos peers que
+                também anunciarem a compressão no hello
+            high_water (int): Mensagens na fila de um peer a partir das quais
+                ele sai do fluxo de operações ao vivo e é atualizado por
+                sync quando a fila esvazia (ver outbound.py); 0 = sem limite
         """
         self.node_id = node_id
         self.host = host
+        # Instrumentação: criada antes das réplicas, que a repassam ao
+        # documento e ao lock
+        if metrics or metrics_port is not None or profile_sample > 0:
+            self.metrics = Metrics(profile_sample)
+        else:
+            self.metrics = None
+        self.metrics_port = metrics_port
+        self._metrics_server = None
         self.port = port
-        self.peers = peers
-        
-        # Inicializa relógio vetorial com todos os nós conhecidos
-        all_nodes = [node_id] + [p[0] for p in peers]
-        self.vector_clock = VectorClock(node_id, all_nodes)
-        
-        # Documento CRDT
-        self.document = CRDTDocument()
-        
-        # Conexões TCP
-        self.connections = {}  # {node_id: socket}
-        self.server_socket = None
+        # Peers e membros mudam com entradas e saídas: as listas são
+        # substituídas (com _membership_lock), nunca alteradas, e podem ser
+        # percorridas sem lock
+        self.peers = list(peers)
+        if members is None:
+            members = [p[0] for p in peers]
+        self.members = [m for m in members if m != node_id]
+        self.departed = {}   # Nós que saíram: {node_id: {doc_id: último seq}}
+        self._membership_lock = threading.Lock()
+        self._members_cache = None   # (membros, peers, entradas do hello)
+        self.id_mode = id_mode
+
+        # Rede: o transporte guarda conexões e filas de saída por peer
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        if wire_format not in self.WIRE_FORMATS:
+            raise ValueError(f"Formato de fio inválido: {wire_format}")
+        self.wire_format = wire_format
+        self.compress = compress
+        self.high_water = high_water
+        self.reconnect_interval = reconnect_interval
+        if callable(transport):
+            factory = transport
+        elif transport in self.TRANSPORTS:
+            factory = self.TRANSPORTS[transport]
+        else:
+            raise ValueError(f"Transporte inválido: {transport}")
+        self.transport = factory(self)
         self.running = False
-        
-        # Log de operações
-        self.operation_log = []
-        
-        # Lock para sincronização
-        self.lock = threading.Lock()
-    
+
+        # Gossip: vizinhos sorteados por mensagem
+        self.fanout = fanout
+        self.anti_entropy_interval = anti_entropy_interval
+        self._random = random.Random()
+
+        # Log de operações (texto, para o comando 'log'; só as mais recentes).
+        # Compartilhado pelos documentos e sem lock próprio (append do deque
+        # é atômico): quem faz o trabalho fora do lock da réplica, como
+        # export e checkpoint, registra também fora dele
+        self.operation_log = deque(maxlen=log_size)
+
+        self.gc_interval = gc_interval
+        self.data_dir = data_dir
+        self.fsync_interval = fsync_interval
+        self.checkpoint_ops = checkpoint_ops
+
+        # Mensagens recebidas: as threads de recepção só enfileiram, e uma
+        # única thread (iniciada em start) as aplica em lotes
+        self._inbox = queue.SimpleQueue()
+        self._applier = None
+
+        # Documentos: o padrão fica sempre em memória; os demais, em ordem
+        # de uso (LRU), são carregados sob demanda
+        self.max_documents = max_documents
+        self._documents = OrderedDict()
+        self._documents_lock = threading.Lock()
+        self.document_stats = {'loaded': 0, 'evicted': 0}
+        self._announced = set()     # Documentos cuja versão já anunciamos
+        self.replica = DocumentReplica(self, None, data_dir)
+
+    # Estado do documento padrão
+    @property
+    def document(self):
+        return self.replica.document
+
+    @property
+    def vector_clock(self):
+        return self.replica.vector_clock
+
+    @property
+    def applied(self):
+        return self.replica.applied
+
+    @property
+    def pending(self):
+        return self.replica.pending
+
+    @property
+    def wal(self):
+        return self.replica.wal
+
+    @property
+    def gc_stats(self):
+        return self.replica.gc_stats
+
+    @property
+    def recovery_stats(self):
+        return self.replica.recovery_stats
+
+    @property
+    def lock(self):
+        return self.replica.lock
+
     def start(self):
         """Inicia o nó: servidor TCP e conexões com peers"""
         self.running = True
-        
-        # Inicia servidor TCP
-        server_thread = threading.Thread(target=self._start_server, daemon=True)
-        server_thread.start()
-        
-        # Aguarda um pouco antes de conectar aos peers
-        threading.Timer(2.0, self._connect_to_peers).start()
-    
-    def _start_server(self):
-        """Thread que escuta por conexões de outros nós"""
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.server_socket.bind((self.host, self.port))
-        self.server_socket.listen(5)
-        
-        print(f"[Node {self.node_id}] Servidor escutando em {self.host}:{self.port}")
-        
-        while self.running:
-            try:
-                conn, addr = self.server_socket.accept()
-                self._send_handshake(conn)
-                thread = threading.Thread(target=self._handle_connection, args=(conn, None), daemon=True)
-                thread.start()
-            except:
-                break
-    
-    def _connect_to_peers(self):
-        """Conecta-se a todos os peers conhecidos"""
-        for peer_id, peer_host, peer_port in self.peers:
-            try:
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.connect((peer_host, peer_port))
-                
-                with self.lock:
-                    self.connections[peer_id] = sock
-                
-                print(f"[Node {self.node_id}] Conectado ao peer {peer_id}")
-                
-                self._send_handshake(sock)
-
-                # Thread para receber mensagens deste peer
-                thread = threading.Thread(target=self._handle_connection, args=(sock, peer_id), daemon=True)
-                thread.start()
-            except Exception as e:
-                print(f"[Node {self.node_id}] Erro ao conectar com {peer_id}: {e}")
-    
-    def _handle_connection(self, conn, peer_id=None):
-        """Thread que recebe mensagens de uma conexão"""
-        buffer = ""
-        remote_id = peer_id
-        while self.running:
-            try:
-                data = conn.recv(4096).decode('utf-8')
-                if not data:
-                    break
-                
-                buffer += data
-                while '\n' in buffer:
-                    line, buffer = buffer.split('\n', 1)
-                    if line:
-                        try:
-                            msg = json.loads(line)
-                        except json.JSONDecodeError:
-                            continue
-
-                        if msg.get('type') == 'hello':
-                            remote_id = msg.get('node_id')
-                            if remote_id:
-                                self._register_connection(remote_id, conn)
-                            continue
-
-                        self._process_message(msg)
-            except Exception as e:
-                print(f"[Node {self.node_id}] Erro na conexão: {e}")
-                break
-        
-        conn.close()
-        if remote_id:
-            with self.lock:
-                if self.connections.get(remote_id) is conn:
-                    del self.connections[remote_id]
-
-    def _register_connection(self, peer_id, conn):
-        """Garante que o socket esteja registrado para broadcasts"""
+        self._applier = threading.Thread(target=self._apply_loop, daemon=True)
+        self._applier.start()
+        self.transport.start()
+        if self.gc_interval > 0:
+            threading.Thread(target=self._gc_loop, daemon=True).start()
+        if self.fanout and self.anti_entropy_interval > 0:
+            threading.Thread(target=self._anti_entropy_loop, daemon=True).start()
+        if self.metrics_port is not None:
+            self._metrics_server = MetricsServer(self, self.metrics_port)
+            self._metrics_server.start()
+        if self.data_dir is not None:
+            threading.Thread(target=self._checkpoint_loop, daemon=True).start()
+            if self.fsync_interval > 0:
+                threading.Thread(target=self._flush_loop, daemon=True).start()
+
+    def connected_peers(self):
+        """IDs dos peers com conexão registrada"""
+        return self.transport.connected_peers()
+
+    def _hello_message(self):
+        """
+        Mensagem de identificação enviada ao abrir/aceitar uma conexão.
+        Leva a versão do documento padrão para o peer decidir se precisa
+        nos enviar um delta/snapshot, o nosso endereço e os membros que
+        conhecemos (com endereço, os que são peers), para um nó que acaba
+        de entrar conhecer o restante do cluster.
+        """
+        encodings = ['binary', 'json'] if self.wire_format == 'binary' else ['json']
         with self.lock:
-            self.connections[peer_id] = conn
+            version = self.applied.get_copy()
+        return {'type': 'hello', 'node_id': self.node_id, 'encodings': encodings,
+                'compression': ['zlib'] if self.compress else [],
+                'version': version, 'host': self.host, 'port': self.port,
+                'members': self._member_entries()}
+
+    def _member_entries(self):
+        """
+        Membros conhecidos como [id, host, porta] (os que são peers) ou
+        [id], para o hello. As listas de membros e peers são trocadas, não
+        alteradas, a cada mudança: a lista montada vale até a próxima.
+        """
+        members, peers = self.members, self.peers
+        cached = self._members_cache
+        if cached is None or cached[0] is not members or cached[1] is not peers:
+            addresses = {peer[0]: list(peer) for peer in peers}
+            entries = [addresses.get(member, [member]) for member in members]
+            cached = self._members_cache = (members, peers, entries)
+        return cached[2]
+
+    def _accepts_binary(self, hello):
+        """True se podemos enviar frames binários ao peer deste hello"""
+        return self.wire_format == 'binary' and 'binary' in hello.get('encodings', ())
+
+    def _accepts_compression(self, hello):
+        """True se podemos enviar frames comprimidos ao peer deste hello"""
+        return self.compress and 'zlib' in hello.get('compression', ())
+
+    def _on_peer_hello(self, peer_id, msg):
+        """Chamado pelo transporte quando um peer se identifica"""
+        entry = [peer_id, msg['host'], msg['port']] if 'port' in msg else [peer_id]
+        added = self._add_members([entry] + msg.get('members', []))
+        if added and added[0][0] == peer_id:
+            # Nó novo no cluster: os demais membros passam a conhecê-lo
+            self._broadcast({'type': 'member', 'site_id': self.node_id, 'members': [entry]})
+        version = msg.get('version')
+        if version is None:
+            return  # Peer sem suporte a sync
+        with self._documents_lock:
+            # Documentos em disco podem ter perdido operações do peer
+            # enquanto ele estava desconectado: voltam a ser anunciados
+            # na próxima carga
+            self._announced.clear()
+        with self._loaded() as replicas:
+            for replica in replicas:
+                with replica.lock:
+                    if replica.doc_id is None:
+                        replica._acked[peer_id] = version
+                        replica._send_sync(peer_id, version)
+                    else:
+                        # O hello só leva a versão do documento padrão: os
+                        # demais em memória são anunciados um a um
+                        replica._send(peer_id, replica.version_message(request=True))
+
+    def _on_peer_drained(self, peer_id):
+        """
+        Chamado pelo transporte quando um peer que saiu do fluxo ao vivo
+        (fila acima de high_water, operações descartadas) esvazia a fila:
+        cada documento em memória troca versões com ele e envia, como delta
+        ou snapshot, o que ficou faltando.
+        """
+        self.operation_log.append(f"CATCH-UP: {peer_id} voltou ao fluxo ao vivo")
+        with self._documents_lock:
+            # Os documentos em disco são anunciados de novo na próxima carga
+            self._announced.clear()
+        with self._loaded() as replicas:
+            for replica in replicas:
+                with replica.lock:
+                    replica._send(peer_id, replica.version_message(request=True))
+
+    def _on_peer_lost(self, peer_id):
+        """Chamado pelo transporte quando a conexão ativa com o peer cai"""
+        with self._loaded() as replicas:
+            for replica in replicas:
+                with replica.lock:
+                    replica._synced.pop(peer_id, None)
+
+    # ------------------------------------------------------------------
+    # Membros
+    # ------------------------------------------------------------------
+    def _add_members(self, entries):
+        """
+        Inclui no cluster os nós de 'entries' ([id, host, porta] ou [id])
+        ainda desconhecidos; com malha completa, os com endereço também
+        viram peers (o transporte conecta a eles na próxima rodada).
+        Nós que já saíram não voltam. Retorna as entradas novas.
+        """
+        added = []
+        with self._membership_lock:
+            # As listas só são copiadas (e trocadas) se algo mudar: a cada
+            # hello chegam todos os membros, quase sempre já conhecidos
+            members = peers = None
+            known_members = set(self.members)
+            known_peers = {peer[0] for peer in self.peers}
+            for entry in entries:
+                peer_id = entry[0]
+                if peer_id == self.node_id or peer_id in self.departed:
+                    continue
+                if peer_id not in known_members:
+                    if members is None:
+                        members = list(self.members)
+                    members.append(peer_id)
+                    known_members.add(peer_id)
+                    added.append(entry)
+                if not self.fanout and len(entry) == 3 and peer_id not in known_peers:
+                    if peers is None:
+                        peers = list(self.peers)
+                    peers.append(tuple(entry))
+                    known_peers.add(peer_id)
+            if members is not None:
+                self.members = members
+            if peers is not None:
+                self.peers = peers
+        for entry in added:
+            self.operation_log.append(f"MEMBER: {entry[0]} entrou no cluster")
+        return added
+
+    def _remove_member(self, msg):
+        """
+        Tira do cluster o nó que anunciou a saída ('leave') e aposenta o
+        site dele nas réplicas em memória (as demais o aposentam ao
+        carregar). Retorna False se a saída já era conhecida.
+        """
+        site = msg['site_id']
+        finals = dict(msg.get('docs', {}))
+        finals[None] = msg.get('final', 0)
+        with self._membership_lock:
+            if site == self.node_id or site in self.departed:
+                return False
+            self.departed[site] = finals
+            self.members = [m for m in self.members if m != site]
+            self.peers = [peer for peer in self.peers if peer[0] != site]
+        with self._loaded() as replicas:
+            for replica in replicas:
+                with replica.lock:
+                    replica.retire(site, finals.get(replica.doc_id, 0))
+        self.operation_log.append(f"MEMBER: {site} saiu do cluster")
+        return True
+
+    def _apply_membership(self, msg):
+        """Aplica um 'member' ou 'leave' recebido (repassado, com gossip, se novo)"""
+        if msg['type'] == 'member':
+            changed = self._add_members(msg.get('members', []))
+        else:
+            changed = self._remove_member(msg)
+        if changed and self.fanout:
+            self._relay(msg)
+
+    def leave(self, timeout=2.0):
+        """
+        Sai do cluster e para o nó: anuncia a saída com o seq da nossa
+        última operação em cada documento em memória e espera as filas de
+        envio esvaziarem (até 'timeout' s). Os demais deixam de esperar
+        pela nossa versão na coleta de tombstones e aposentam o nosso site
+        nos relógios. O ID não deve ser reutilizado depois.
+        """
+        final = 0
+        docs = {}
+        with self._loaded() as replicas:
+            for replica in replicas:
+                with replica.lock:
+                    if replica.wal is not None:
+                        # Libera as operações locais que esperam o fsync
+                        replica.wal.sync()
+                    seq = replica.applied.get(self.node_id)
+                    if replica.doc_id is None:
+                        final = seq
+                    elif seq:
+                        docs[replica.doc_id] = seq
+        self._broadcast({'type': 'leave', 'site_id': self.node_id, 'final': final, 'docs': docs})
+        deadline = time.monotonic() + timeout
+        # O transporte asyncio só enfileira no próximo passo do event loop,
+        # e o último frame ainda sai pelo socket depois de deixar a fila
+        time.sleep(self.flush_interval + 0.05)
+        while time.monotonic() < deadline:
+            if not any(sender.pending() for sender in list(self.transport.senders.values())):
+                break
+            time.sleep(0.01)
+        time.sleep(0.05)
+        self.stop()
+
+    # ------------------------------------------------------------------
+    # Documentos
+    # ------------------------------------------------------------------
+    def documents(self):
+        """IDs dos documentos em memória, além do padrão (do menos ao mais usado)"""
+        with self._documents_lock:
+            return list(self._documents)
+
+    @contextmanager
+    def _using(self, doc):
+        """
+        Réplica do documento 'doc' (None = padrão), carregada se preciso.
+        Enquanto o bloco executa, o documento não sai da memória.
+        """
+        if doc is None:
+            yield self.replica
+            return
+        with self._documents_lock:
+            replica = self._documents.get(doc)
+            if replica is None:
+                replica = self._load_document(doc)
+            else:
+                self._documents.move_to_end(doc)
+            replica.users += 1
+        try:
+            yield replica
+        finally:
+            with self._documents_lock:
+                replica.users -= 1
 
-    def _send_handshake(self, conn):
-        """Envia mensagem de identificação do nó"""
+    @contextmanager
+    def _loaded(self):
+        """Réplicas em memória (a padrão primeiro), sem alterar a ordem de uso"""
+        with self._documents_lock:
+            replicas = [self.replica]
+            replicas.extend(self._documents.values())
+            for replica in replicas[1:]:
+                replica.users += 1
         try:
-            handshake = json.dumps({'type': 'hello', 'node_id': self.node_id}) + '\n'
-            conn.sendall(handshake.encode('utf-8'))
-        except Exception as e:
-            print(f"[Node {self.node_id}] Erro enviando handshake: {e}")
+            yield replicas
+        finally:
+            with self._documents_lock:
+                for replica in replicas[1:]:
+                    replica.users -= 1
+
+    def _load_document(self, doc):
+        """Carrega do disco (ou cria) a réplica do documento; chamado com _documents_lock"""
+        if not isinstance(doc, str) or not _DOC_ID.match(doc):
+            raise ValueError(f"ID de documento inválido: {doc!r}")
+        data_dir = None
+        if self.data_dir is not None:
+            data_dir = os.path.join(self.data_dir, 'docs', doc)
+        replica = DocumentReplica(self, doc, data_dir, flusher=False)
+        self._documents[doc] = replica
+        self.document_stats['loaded'] += 1
+        self._evict()
+        # Na primeira carga anunciamos a versão: os peers enviam o que nos
+        # falta (ex.: o que perdemos fora do ar) e pedimos a deles para
+        # enviar o que falta a eles. Depois de um descarte não é preciso:
+        # enquanto o documento estava em disco, toda mensagem dele o teria
+        # carregado de volta.
+        if doc not in self._announced:
+            self._announced.add(doc)
+            with replica.lock:
+                replica._broadcast(replica.version_message(request=True))
+        return replica
 
-    def insert(self, position, text_value):
-        if not text_value:
+    def _evict(self):
+        """
+        Grava em disco e descarrega os documentos ociosos menos usados até
+        voltar a max_documents (chamado com _documents_lock). Documentos em
+        uso, com assinantes, com operações no buffer causal ou recebendo um
+        sync ficam, mesmo acima do limite.
+        """
+        if self.data_dir is None:
             return
-        with self.lock:
-            self.vector_clock.increment()
-            
-            # Loop para inserir caractere por caractere (RGA trabalha melhor char a char)
-            current_pos = position
-            for char in text_value:
-                # Chama o CRDT atualizado
-                new_char_obj, origin_id = self.document.local_insert(
-                    current_pos, char, self.node_id, self.vector_clock
-                )
-                
-                # Prepara mensagem
-                origin_serialized = self._serialize_id(origin_id)
-                
-                message = {
-                    'type': 'insert',
-                    'op_id': self.vector_clock.get_copy(),
-                    'site_id': self.node_id,
-                    'char': new_char_obj.to_dict(),
-                    'origin_id': origin_serialized
-                }
-                self._broadcast(message)
-                
-                self.operation_log.append(f"Local INSERT '{char}' after {origin_serialized}")
-                current_pos += 1
-
-    def delete(self, position):
-        with self.lock:
-            self.vector_clock.increment()
-            target_char = self.document.local_delete(position)
-            
-            if target_char:
-                target_id_ser = self._serialize_id(target_char.position_id)
-                
-                message = {
-                    'type': 'delete',
-                    'site_id': self.node_id,
-                    'target_id': target_id_ser
-                }
-                self._broadcast(message)
-                self.operation_log.append(f"Local DELETE char {target_id_ser}")
+        excess = len(self._documents) - self.max_documents
+        # O último é o que acabou de ser usado
+        for doc, replica in list(self._documents.items())[:-1]:
+            if excess <= 0:
+                break
+            if not replica.idle():
+                continue
+            # Sem uso e com _documents_lock: ninguém mais alcança a réplica
+            replica.close()
+            del self._documents[doc]
+            self.document_stats['evicted'] += 1
+            excess -= 1
+
+    # ------------------------------------------------------------------
+    # Operações locais
+    # ------------------------------------------------------------------
+    def insert(self, position, text_value, doc=None):
+        with self._using(doc) as replica:
+            replica.insert(position, text_value)
 
+    def delete(self, position, doc=None):
+        with self._using(doc) as replica:
+            replica.delete(position)
+
+    def delete_range(self, start, length, doc=None):
+        """
+        Deleta 'length' caracteres a partir da posição 'start' numa única
+        operação (ver DocumentReplica.delete_range)
+        """
+        with self._using(doc) as replica:
+            replica.delete_range(start, length)
+
+    def import_operations(self, messages, doc=None, processes=0):
+        """
+        Aplica em lote um log de operações em ordem causal (ex.: o log em
+        disco de outro nó, ver OperationLog.replay), com o mesmo resultado
+        de recebê-las uma a uma mas montando o RGA de uma vez (ver
+        DocumentReplica._apply_bulk); 'processes' > 1 ordena lotes grandes
+        num pool de processos. Depois a versão é anunciada aos peers, que
+        respondem com a deles para receber o que foi importado por sync.
+        """
+        with self._using(doc) as replica:
+            with replica.lock:
+                replica._apply_bulk(messages, processes)
+                replica._publish()
+                replica._broadcast(replica.version_message(request=True))
+
+    def export(self, out, doc=None):
+        """
+        Grava o documento inteiro num arquivo ou socket aberto, no formato
+        de snapshot.py, sem montá-lo em memória (ver DocumentReplica.export).
+        Retorna o total de bytes.
+        """
+        with self._using(doc) as replica:
+            return replica.export(out)
+
+    def import_snapshot(self, source, doc=None):
+        """
+        Incorpora ao documento um fluxo gravado por export, lido de um
+        arquivo ou socket, e anuncia a nova versão aos peers. Retorna o
+        número de registros lidos.
+        """
+        with self._using(doc) as replica:
+            count = replica.import_snapshot(source)
+            with replica.lock:
+                replica._broadcast(replica.version_message(request=True))
+            return count
+
+    # ------------------------------------------------------------------
+    # Mensagens recebidas
+    # ------------------------------------------------------------------
     def _process_message(self, msg):
-        try:
-            with self.lock:
-                # Atualiza relógio (se houver campo op_id no topo)
-                if 'op_id' in msg:
-                    self.vector_clock.update(msg['op_id'])
-                
-                if msg['type'] == 'insert':
-                    # Desserializa o origin ID
-                    origin_id = self._deserialize_id(msg['origin_id'])
-                    # O char vem como dict no campo 'char'
-                    self.document.remote_insert(msg['char'], origin_id)
-                    
-                    self.operation_log.append(f"Remote INSERT from {msg['site_id']}")
-                
-                elif msg['type'] == 'delete':
-                    target_id = self._deserialize_id(msg['target_id'])
-                    self.document.remote_delete(target_id)
-                    self.operation_log.append(f"Remote DELETE from {msg['site_id']}")
-                    
-        except Exception as e:
-            print(f"[Node {self.node_id}] Erro processando msg: {e}")
-            import traceback
-            traceback.print_exc()
-
-    # Métodos auxiliares para serializar a tupla (VectorClock, site_id)
-    def _serialize_id(self, pos_id):
-        if pos_id is None: return None
-        # pos_id é ({'node': 1}, 'site')
-        # JSON não aceita chaves que não sejam string
-        clock, site = pos_id
-        # Garante que o clock seja serializável
-        if isinstance(clock, dict):
-            clock_list = list(clock.items())
+        """
+        Chamado pelo transporte para cada mensagem recebida. Com o nó
+        iniciado só enfileira para a thread de aplicação (as threads de
+        recepção não disputam o lock); antes disso aplica na hora.
+        """
+        if self._applier is not None:
+            self._inbox.put(msg)
         else:
-            clock_list = clock
-        return [clock_list, site]
-
-    def _deserialize_id(self, list_data):
-        if list_data is None: return None
-        clock_list, site = list_data
-        
-        # CORREÇÃO CRÍTICA AQUI:
-        # O JSON traz listas de listas [[k,v], [k,v]].
-        # Precisamos converter as listas internas [k,v] em tuplas (k,v)
-        # para bater com o formato interno do Character.
-        
-        clock_tuple = tuple(sorted(tuple(item) for item in clock_list))
-        
-        return (clock_tuple, site)
-    
-    def _broadcast(self, message):
-        """Envia mensagem para todos os peers conectados"""
-        msg_str = json.dumps(message) + '\n'
-        
-        for peer_id, conn in list(self.connections.items()):
+            self._apply_batch([msg])
+
+    def _apply_loop(self):
+        """
+        Thread de aplicação: drena a fila de entrada e aplica o que se
+        acumulou com uma única aquisição do lock (por documento) e uma
+        única publicação.
+        """
+        inbox = self._inbox
+        while True:
+            batch = [inbox.get()]
             try:
-                conn.sendall(msg_str.encode('utf-8'))
-            except Exception as e:
-                print(f"[Node {self.node_id}] Erro enviando para {peer_id}: {e}")
-    
-    def get_text(self):
-        """Retorna texto atual do documento"""
-        with self.lock:
-            return self.document.get_text()
-    
+                while len(batch) < self.APPLY_BATCH:
+                    batch.append(inbox.get_nowait())
+            except queue.Empty:
+                pass
+            if None in batch:
+                # Sentinela de stop(): aplica o que veio antes e encerra
+                self._apply_batch(batch[:batch.index(None)])
+                return
+            metrics = self.metrics
+            if metrics is None:
+                self._apply_batch(batch)
+            else:
+                start = time.perf_counter()
+                metrics.profiled(self._apply_batch, batch)
+                metrics.observe('apply_us', (time.perf_counter() - start) * 1e6)
+                metrics.observe('apply_batch', len(batch))
+                metrics.observe('inbox_depth', inbox.qsize())
+
+    def _apply_batch(self, messages):
+        # Frames em lote carregam várias operações, de qualquer documento;
+        # a ordem é mantida dentro de cada documento
+        by_doc = {}
+        membership = []
+        for msg in messages:
+            ops = msg.get('ops', []) if msg.get('type') == 'batch' else (msg,)
+            for op in ops:
+                if op.get('type') in ('member', 'leave'):
+                    membership.append(op)
+                else:
+                    by_doc.setdefault(op.get('doc'), []).append(op)
+        for doc, ops in by_doc.items():
+            try:
+                with self._using(doc) as replica:
+                    with replica.lock:
+                        for op in ops:
+                            replica._apply_message(op)
+                        replica._publish()
+            except ValueError as e:
+                print(f"[Node {self.node_id}] {len(ops)} mensagens descartadas: {e}")
+        # Depois das operações do lote: uma saída chega depois das últimas
+        # operações do nó que saiu (mesma conexão)
+        for msg in membership:
+            self._apply_membership(msg)
+
+    # ------------------------------------------------------------------
+    # Persistência e coleta (todos os documentos em memória)
+    # ------------------------------------------------------------------
+    def checkpoint(self, doc=None):
+        """Snapshot do documento e rotação do log (ver DocumentReplica.checkpoint)"""
+        with self._using(doc) as replica:
+            replica.checkpoint()
+
+    def _checkpoint_loop(self):
+        """Thread de fundo: checkpoint quando o log acumula checkpoint_ops operações"""
+        while self.running:
+            time.sleep(self.CHECKPOINT_CHECK)
+            if not self.running:
+                break
+            with self._loaded() as replicas:
+                for replica in replicas:
+                    wal = replica.wal
+                    if wal is not None and wal.since_snapshot >= self.checkpoint_ops:
+                        replica.checkpoint()
+
+    def _flush_loop(self):
+        """
+        Thread de fundo: group commit dos logs dos documentos carregados sob
+        demanda (uma thread para todos, em vez de uma por documento)
+        """
+        while self.running:
+            time.sleep(self.fsync_interval)
+            with self._loaded() as replicas:
+                for replica in replicas[1:]:
+                    wal = replica.wal
+                    if wal.appended > wal.durable:
+                        wal.sync()
+
+    def collect_garbage(self, budget=1000, doc=None):
+        """Coleta de tombstones estáveis (ver DocumentReplica.collect_garbage)"""
+        with self._using(doc) as replica:
+            return replica.collect_garbage(budget)
+
+    def _gc_loop(self):
+        """Thread de fundo: anuncia as versões aos peers e coleta tombstones"""
+        while self.running:
+            time.sleep(self.gc_interval)
+            if not self.running:
+                break
+            self._gc_round()
+
+    def _gc_round(self):
+        """Uma rodada da coleta: anúncio das versões e passada nos documentos em memória"""
+        with self._loaded() as replicas:
+            for replica in replicas:
+                replica._send_ack()
+                replica.collect_garbage()
+
+    def _anti_entropy_loop(self):
+        """Thread de fundo (com fanout): uma rodada de anti-entropia por intervalo"""
+        while self.running:
+            time.sleep(self.anti_entropy_interval)
+            if not self.running:
+                break
+            self._anti_entropy()
+
+    def _anti_entropy(self):
+        """
+        Troca as versões dos documentos em memória com um vizinho sorteado
+        ('version' com request): cada lado envia ao outro, como delta, o que
+        o repasse não levou até ele.
+        """
+        peers = self.connected_peers()
+        if not peers:
+            return
+        peer_id = self._random.choice(peers)
+        with self._loaded() as replicas:
+            for replica in replicas:
+                with replica.lock:
+                    replica._send(peer_id, replica.version_message(request=True))
+
+    def garbage_stats(self, doc=None):
+        """Totais da coleta de tombstones do documento (ver gc_stats)"""
+        with self._using(doc) as replica:
+            return dict(replica.gc_stats)
+
+    def buffer_stats(self, doc=None):
+        """Métricas do buffer causal (profundidade atual, pico, totais)"""
+        with self._using(doc) as replica:
+            return replica.buffer_stats()
+
+    def stats(self):
+        """
+        Estatísticas do nó: tamanhos dos documentos em memória, filas,
+        tráfego por peer e, com as métricas ligadas, contadores e
+        histogramas (ver metrics.py). Percorre uma cópia da lista de
+        documentos, fora de _documents_lock; cada documento custa O(1).
+        """
+        documents = {}
+        with self._loaded() as replicas:
+            for replica in replicas:
+                name = 'default' if replica.doc_id is None else replica.doc_id
+                documents[name] = replica.stats()
+        transport = self.transport
+        peers = {}
+        for peer_id, sender in list(transport.senders.items()):
+            peers[peer_id] = {'bytes_out': sender.bytes_sent, 'frames_out': sender.frames_sent,
+                              'ops_out': sender.ops_sent, 'queued': sender.pending(),
+                              'bytes_raw_out': sender.bytes_raw, 'dropped': sender.dropped,
+                              'lags': sender.lags, 'lagging': sender.lagging}
+        for peer_id, size in list(transport.received.items()):
+            peers.setdefault(peer_id, {})['bytes_in'] = size
+        stats = {
+            'node': self.node_id,
+            'documents': documents,
+            'document_stats': dict(self.document_stats),
+            'inbox': self._inbox.qsize(),
+            'peers': peers,
+        }
+        if self.metrics is not None:
+            stats.update(self.metrics.snapshot())
+        return stats
+
+    # ------------------------------------------------------------------
+    # Rede
+    # ------------------------------------------------------------------
+    def _broadcast(self, message):
+        """
+        Enfileira a mensagem para todos os peers conectados (com fanout, só
+        para alguns deles, que a repassam).
+        O envio (serialização + escrita no socket) acontece no transporte,
+        fora do lock do nó.
+        """
+        if self.fanout:
+            self._gossip(message)
+        else:
+            self.transport.broadcast(OutgoingMessage(message))
+
+    def _relay(self, message):
+        """Repassa uma mensagem recebida (com fanout) a outros peers, menos a origem"""
+        self._gossip(message, message.get('site_id'))
+
+    def _gossip(self, message, exclude=None):
+        """Enfileira a mensagem para até 'fanout' peers conectados, sorteados"""
+        peers = [peer_id for peer_id in self.transport.connected_peers() if peer_id != exclude]
+        if len(peers) > self.fanout:
+            peers = self._random.sample(peers, self.fanout)
+        outgoing = OutgoingMessage(message)
+        for peer_id in peers:
+            self.transport.send(peer_id, outgoing)
+
+    def _send(self, peer_id, message):
+        """Enfileira a mensagem só para um peer (na mesma fila dos broadcasts)"""
+        self.transport.send(peer_id, OutgoingMessage(message))
+
+    # ------------------------------------------------------------------
+    # Leitura
+    # ------------------------------------------------------------------
+    def read_snapshot(self, doc=None):
+        """Último estado publicado (ReadSnapshot) do documento, sem adquirir o lock"""
+        with self._using(doc) as replica:
+            return replica.read_snapshot()
+
+    def get_text(self, start=0, end=None, doc=None):
+        """
+        Retorna o texto atual do documento (ou o trecho [start, end)), a
+        partir do último estado publicado, sem adquirir o lock.
+        """
+        with self._using(doc) as replica:
+            return replica.get_text(start, end)
+
+    def subscribe(self, callback, doc=None):
+        """
+        Assina as mudanças do texto visível do documento (ver
+        DocumentReplica.subscribe). Um documento com assinantes não sai da
+        memória.
+        """
+        with self._using(doc) as replica:
+            return replica.subscribe(callback)
+
+    def unsubscribe(self, callback, doc=None):
+        """Cancela uma assinatura feita com subscribe"""
+        with self._using(doc) as replica:
+            replica.unsubscribe(callback)
+
     def get_log(self, last_n=10):
-        """Retorna últimas N operações do log"""
-        with self.lock:
-            return self.operation_log[-last_n:]
-    
+        """Retorna últimas N operações do log (sem adquirir o lock)"""
+        while True:
+            try:
+                return list(self.operation_log)[-last_n:]
+            except RuntimeError:
+                continue  # deque alterado durante a cópia; tenta de novo
+
     def stop(self):
         """Para o nó e fecha conexões"""
         self.running = False
-        
-        for conn in self.connections.values():
-            try:
-                conn.close()
-            except:
-                pass
-        
-        if self.server_socket:
-            try:
-                self.server_socket.close()
-            except:
-                pass
+        self.transport.stop()
+        if self._metrics_server is not None:
+            self._metrics_server.stop()
+        if self._applier is not None:
+            self._inbox.put(None)
+            self._applier.join()
+        with self._loaded() as replicas:
+            for replica in replicas:
+                if replica.wal is not None:
+                    replica.wal.close()
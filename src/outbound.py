@@ -0,0 +1,223 @@
+"""
+outbound.py - Fila de saída por peer com envio em lotes
+
+Cada peer conectado tem um PeerSender: o nó apenas enfileira as mensagens
+(sem serializar nem tocar no socket enquanto segura o lock) e uma thread
+dedicada drena a fila, agrupando as operações pendentes num único frame
+{"type": "batch", "ops": [...]}. Um peer lento só atrasa a própria fila.
+Peers que negociaram o formato binário (ver wire.py) recebem o mesmo lote
+como um frame binário, codificado por conexão, e os que negociaram
+compressão recebem o frame dentro de um fluxo zlib da conexão.
+
+Controle de fluxo: a fila de um peer tem um limite ('high_water'). Quando
+ela passa dele (peer lento ou travado, ex.: um link WAN), as operações
+pendentes para ele são descartadas e as seguintes deixam de ser
+enfileiradas: o peer sai do fluxo de operações ao vivo. As mensagens de
+controle (sync, version, membros) continuam. Quando a fila esvazia, o nó é
+avisado (on_drained) e traz o peer de volta por delta/snapshot, como num
+reconnect; as operações ao vivo voltam a ser enviadas a partir daí.
+"""
+import json
+import threading
+from collections import deque
+from wire import BinaryEncoder, FrameCompressor
+
+# Mensagens que podem ser descartadas de uma fila cheia: o sync repõe o efeito delas
+LIVE_TYPES = frozenset(('insert', 'delete', 'delete_range'))
+
+
+class OutgoingMessage:
+    """
+    Mensagem compartilhada entre as filas de todos os peers.
+    A serialização acontece uma única vez, na primeira thread que precisar.
+    """
+
+    __slots__ = ('message', '_payload')
+
+    def __init__(self, message):
+        self.message = message
+        self._payload = None
+
+    @property
+    def payload(self):
+        if self._payload is None:
+            self._payload = json.dumps(self.message)
+        return self._payload
+
+
+def encode_batch(payloads):
+    """Monta o frame (linha JSON) de uma ou mais mensagens já serializadas"""
+    if len(payloads) == 1:
+        return (payloads[0] + '\n').encode('utf-8')
+    return ('{"type": "batch", "ops": [' + ', '.join(payloads) + ']}\n').encode('utf-8')
+
+
+def encode_frame(batch, encoder=None):
+    """
+    Monta o frame de um lote de OutgoingMessage: linha JSON (payload
+    compartilhado entre os peers) ou, com um BinaryEncoder, frame binário
+    """
+    if encoder is None:
+        return encode_batch([item.payload for item in batch])
+    return encoder.encode_frames([item.message for item in batch])
+
+
+def admit(peer, outgoing, high_water):
+    """
+    Decide se 'outgoing' entra na fila do peer (PeerSender ou a fila do
+    transporte asyncio: 'queue', 'lagging' e 'dropped'). Acima de
+    'high_water' mensagens (0 = sem limite) o peer passa a 'lagging' e as
+    operações ao vivo pendentes saem da fila. Retorna True se a mensagem
+    deve ser enfileirada.
+    """
+    if outgoing.message.get('type') not in LIVE_TYPES:
+        return True
+    if peer.lagging:
+        peer.dropped += 1
+        return False
+    if high_water and len(peer.queue) >= high_water:
+        queue = peer.queue
+        kept = [item for item in queue if item.message.get('type') not in LIVE_TYPES]
+        peer.dropped += len(queue) - len(kept) + 1
+        queue.clear()
+        queue.extend(kept)
+        peer.lagging = True
+        peer.lags += 1
+        return False
+    return True
+
+
+class PeerSender:
+    """
+    Fila de saída de um peer drenada por uma thread própria.
+
+    Args:
+        peer_id (str): ID do peer (para logs)
+        conn (socket): Socket de destino (pode ser trocado via retarget())
+        flush_interval (float): Tempo (s) que o primeiro op pendente espera
+            por outros antes do envio; 0 envia assim que possível
+        max_batch (int): Máximo de ops por frame
+        on_error (callable): Chamado com (peer_id, exceção) em falha de envio
+        high_water (int): Mensagens na fila a partir das quais o peer sai
+            do fluxo ao vivo (ver admit); 0 = sem limite
+        on_drained (callable): Chamado com (peer_id) quando a fila de um
+            peer que saiu do fluxo ao vivo esvazia
+    """
+
+    def __init__(self, peer_id, conn, flush_interval=0.005, max_batch=256, on_error=None,
+                 high_water=0, on_drained=None):
+        self.peer_id = peer_id
+        self.conn = conn
+        # Codificador binário e compressão da conexão atual (None = linhas
+        # JSON, sem compressão)
+        self.encoder = None
+        self.compressor = None
+        self.flush_interval = flush_interval
+        self.max_batch = max(1, max_batch)
+        self.on_error = on_error
+        self.high_water = high_water
+        self.on_drained = on_drained
+
+        self.queue = deque()
+        self.cond = threading.Condition()
+        self.running = True
+        self.lagging = False
+
+        # Estatísticas simples de envio
+        self.frames_sent = 0
+        self.ops_sent = 0
+        self.bytes_sent = 0
+        self.bytes_raw = 0      # Antes da compressão
+        self.dropped = 0        # Operações descartadas (peer fora do fluxo ao vivo)
+        self.lags = 0           # Vezes em que o peer saiu do fluxo ao vivo
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def enqueue(self, outgoing):
+        """Enfileira uma OutgoingMessage (não bloqueia)"""
+        with self.cond:
+            if not admit(self, outgoing, self.high_water):
+                if not self.queue:
+                    self.cond.notify()  # Fila vazia: o peer já pode voltar
+                return
+            self.queue.append(outgoing)
+            if len(self.queue) == 1 or len(self.queue) >= self.max_batch:
+                self.cond.notify()
+
+    def retarget(self, conn, binary=False, compress=False):
+        """
+        Aponta a fila para 'conn' (nova conexão com o mesmo peer mantém a
+        fila pendente). A tabela de sites do formato binário e o fluxo zlib
+        são por conexão, então são recriados quando o socket muda.
+        """
+        with self.cond:
+            if conn is not self.conn:
+                self.conn = conn
+                self.encoder = BinaryEncoder() if binary else None
+                self.compressor = FrameCompressor() if compress else None
+            else:
+                if binary and self.encoder is None:
+                    self.encoder = BinaryEncoder()
+                if compress and self.compressor is None:
+                    self.compressor = FrameCompressor()
+
+    def pending(self):
+        """Quantidade de mensagens aguardando envio"""
+        return len(self.queue)
+
+    def close(self):
+        """Para a thread de envio (mensagens ainda pendentes são descartadas)"""
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+
+    def _next_batch(self):
+        """Espera ops pendentes e retira até max_batch deles da fila"""
+        with self.cond:
+            while self.running and not self.queue and not self.lagging:
+                self.cond.wait()
+            if not self.running:
+                return None
+            # Dá uma janela para coalescer uma rajada num único frame
+            if self.flush_interval > 0 and len(self.queue) < self.max_batch:
+                self.cond.wait(self.flush_interval)
+                if not self.running:
+                    return None
+            count = min(len(self.queue), self.max_batch)
+            batch = [self.queue.popleft() for _ in range(count)]
+            # O peer volta ao fluxo ao vivo com a fila vazia (o nó o traz
+            # de volta por sync ao ser avisado)
+            drained = self.lagging and not self.queue
+            if drained:
+                self.lagging = False
+            # Socket, codificador e compressão são lidos juntos: um frame
+            # só pode ir para a conexão cujo estado o gerou
+            return batch, self.conn, self.encoder, self.compressor, drained
+
+    def _run(self):
+        while True:
+            item = self._next_batch()
+            if item is None:
+                break
+            batch, conn, encoder, compressor, drained = item
+            if not batch:
+                if drained and self.on_drained is not None:
+                    self.on_drained(self.peer_id)
+                continue
+            data = encode_frame(batch, encoder)
+            raw = len(data)
+            if compressor is not None:
+                data = compressor.compress(data)
+            try:
+                conn.sendall(data)
+            except Exception as e:
+                if self.on_error is not None:
+                    self.on_error(self.peer_id, e)
+                continue
+            self.frames_sent += 1
+            self.ops_sent += len(batch)
+            self.bytes_sent += len(data)
+            self.bytes_raw += raw
+            if drained and self.on_drained is not None:
+                self.on_drained(self.peer_id)
@@ -0,0 +1,903 @@
+"""
+replica.py - Réplica de um documento dentro de um nó
+
+Um Node hospeda vários documentos; cada um é uma DocumentReplica com o
+seu próprio estado de CRDT: documento, relógio vetorial, versão aplicada,
+buffer causal, sync com os peers, coleta de tombstones, log em disco e o
+estado publicado para leituras. A rede (transporte, fila de entrada,
+threads de fundo) é do nó e é compartilhada por todos os documentos.
+
+As mensagens de um documento levam o campo 'doc' com o ID dele; o
+documento padrão (doc_id None) não leva o campo, o que mantém o
+protocolo de um nó com um único documento.
+"""
+import base64
+import itertools
+import threading
+import time
+from vector_clock import SiteTable, VectorClock
+from crdt_document import CRDTDocument
+from character import Character
+from text_view import ReadSnapshot
+from causal_buffer import CausalBuffer
+from snapshot import SnapshotReader, SnapshotWriter, encode_stream, write_stream
+from wal import OperationLog
+from metrics import TimedLock
+
+
+class DocumentReplica:
+    """
+    Estado e operações de um documento replicado.
+
+    Args:
+        node (Node): Nó que hospeda o documento (rede, peers, log de operações)
+        doc_id (str): ID do documento; None = documento padrão do nó
+        data_dir (str): Diretório do log e dos snapshots do documento;
+            None = sem persistência
+        flusher (bool): True = o log tem a sua própria thread de group
+            commit; False = o nó faz o fsync de todos os documentos
+    """
+
+    def __init__(self, node, doc_id=None, data_dir=None, flusher=True):
+        self.node = node
+        self.doc_id = doc_id
+        self.node_id = node.node_id
+        self.id_mode = node.id_mode
+        self.operation_log = node.operation_log
+
+        # Relógio vetorial do documento, com todos os nós conhecidos. Os
+        # dois relógios compartilham a numeração dos sites (ver SiteTable)
+        all_nodes = [node.node_id] + node.members
+        self.sites = SiteTable()
+        self.vector_clock = VectorClock(node.node_id, all_nodes, self.sites)
+        # Versão do documento: por site, o maior seq (contador do site nos
+        # position_id) já aplicado. É o que o sync compara entre réplicas.
+        self.applied = VectorClock(node.node_id, all_nodes, self.sites)
+
+        # Documento CRDT
+        self.document = CRDTDocument(self.id_mode)
+        self.document.metrics = node.metrics
+
+        # Sync: fluxos recebidos em andamento {peer: (leitor, registros)} e
+        # versão já enviada a cada peer conectado
+        self._sync_readers = {}
+        self._synced = {}
+
+        # Operações remotas aguardando dependências causais
+        self.pending = CausalBuffer()
+        # Com gossip: (site, contador inicial) das operações já repassadas
+        # e ainda não entregues
+        self._relayed = set()
+
+        # Coleta de tombstones: última versão anunciada por cada peer (hello,
+        # 'version' ou 'ack'), última versão que anunciamos e totais removidos
+        self._acked = {}
+        self._ack_sent = None
+        # Nós que saíram do cluster: seq da última operação de cada um
+        # neste documento, enquanto ela ainda não foi aplicada aqui
+        self._departed = {}
+        for site, finals in node.departed.items():
+            self.retire(site, finals.get(doc_id, 0))
+        self.gc_stats = {'passes': 0, 'blocks': 0, 'chars': 0, 'bytes': 0}
+
+        # Lock dos escritores (operações locais e a thread de aplicação).
+        # Leituras usam o último ReadSnapshot publicado, sem o lock.
+        self.lock = threading.Lock()
+        if node.metrics is not None:
+            self.lock = TimedLock(self.lock, node.metrics)
+        self._published = None
+        # Um checkpoint por vez: o snapshot é gravado fora do lock, e os
+        # commits de dois checkpoints simultâneos chegariam fora de ordem
+        self._checkpoint_lock = threading.Lock()
+
+        # Referências em uso (ver Node._using): só um documento sem uso
+        # pode sair da memória
+        self.users = 0
+
+        # Persistência: recupera o estado do disco antes de registrar
+        # qualquer operação nova
+        self.wal = None
+        self.recovery_stats = None
+        if data_dir is not None:
+            wal = OperationLog(data_dir, node.fsync_interval)
+            self._recover(wal)
+            wal.open(flusher)
+            self.wal = wal
+        with self.lock:
+            self._publish()
+
+    def _broadcast(self, message):
+        """Envia a mensagem do documento a todos os peers (via nó)"""
+        if self.doc_id is not None:
+            message['doc'] = self.doc_id
+        self.node._broadcast(message)
+
+    def _send(self, peer_id, message):
+        """Envia a mensagem do documento só para um peer (via nó)"""
+        if self.doc_id is not None:
+            message['doc'] = self.doc_id
+        self.node._send(peer_id, message)
+
+    def version_message(self, request=False):
+        """
+        Anúncio da versão do documento ('version'), o equivalente ao hello
+        por documento: quem recebe envia o que nos falta e, com 'request',
+        responde com a própria versão para receber o que falta a ele.
+        Chamado com o lock adquirido.
+        """
+        return {'type': 'version', 'site_id': self.node_id,
+                'version': self.applied.get_copy(), 'request': request}
+
+    def idle(self):
+        """True se o documento pode sair da memória sem perder nada"""
+        return (not self.users and not self.document.listeners
+                and not len(self.pending) and not self._sync_readers)
+
+    def close(self):
+        """Grava um snapshot do documento (se mudou) e fecha o log"""
+        if self.wal is None:
+            return
+        if self.wal.since_snapshot:
+            self.checkpoint()
+        self.wal.close()
+
+    def insert(self, position, text_value):
+        if not text_value:
+            return
+        with self.lock:
+            # O texto inteiro vira um único bloco (run) no CRDT e uma única
+            # mensagem. Cada caractere ainda tem um position_id único: o bloco
+            # usa o relógio atual para o primeiro caractere e os demais ocupam
+            # os contadores seguintes do nosso site.
+            self.vector_clock.increment()
+            new_char_obj, origin_id = self.document.local_insert(
+                position, text_value, self.node_id, self.vector_clock
+            )
+            self.vector_clock.increment(len(text_value) - 1)
+            self.applied.update({self.node_id: new_char_obj.last_seq})
+            self.pending.deliver(self.node_id, self.vector_clock.get(self.node_id))
+            
+            # Prepara mensagem
+            origin_serialized = self._serialize_id(origin_id)
+            
+            message = {
+                'type': 'insert',
+                'op_id': self.vector_clock.delta(),
+                'site_id': self.node_id,
+                'char': new_char_obj.to_dict(),
+                'origin_id': origin_serialized
+            }
+            if self.id_mode == 'lamport':
+                message['lamport'] = self.vector_clock.lamport
+            self._log_local(message)
+            
+            self.operation_log.append(f"Local INSERT '{text_value}' after {origin_serialized}")
+            self._publish()
+
+    def delete(self, position):
+        with self.lock:
+            # Posição inválida não consome contador: os peers entregam as
+            # operações de cada site em sequência contígua (ver CausalBuffer)
+            if not 0 <= position < len(self.document):
+                return
+            self.vector_clock.increment()
+            dot = self._local_dot()
+            target_char = self.document.local_delete(position, dot)
+            
+            if target_char:
+                self.applied.update({self.node_id: dot[1]})
+                self.pending.deliver(self.node_id, self.vector_clock.get(self.node_id))
+                target_id_ser = self._serialize_id(target_char.position_id)
+                
+                message = {
+                    'type': 'delete',
+                    'op_id': self.vector_clock.delta(),
+                    'site_id': self.node_id,
+                    'target_id': target_id_ser
+                }
+                if self.id_mode == 'lamport':
+                    message['lamport'] = self.vector_clock.lamport
+                self._log_local(message)
+                self.operation_log.append(f"Local DELETE char {target_id_ser}")
+                self._publish()
+
+    def delete_range(self, start, length):
+        """
+        Deleta 'length' caracteres a partir da posição 'start' numa única
+        operação: um tick do relógio e uma mensagem com as runs
+        (site, seq, tamanho) atingidas, em vez de uma por caractere.
+        """
+        with self.lock:
+            if length <= 0 or not 0 <= start < len(self.document):
+                return
+            self.vector_clock.increment()
+            dot = self._local_dot()
+            runs = self.document.local_delete_range(start, length, dot)
+            self.applied.update({self.node_id: dot[1]})
+            self.pending.deliver(self.node_id, self.vector_clock.get(self.node_id))
+
+            message = {
+                'type': 'delete_range',
+                'op_id': self.vector_clock.delta(),
+                'site_id': self.node_id,
+                'runs': [list(run) for run in runs]
+            }
+            if self.id_mode == 'lamport':
+                message['lamport'] = self.vector_clock.lamport
+            self._log_local(message)
+            self.operation_log.append(
+                f"Local DELETE_RANGE {sum(run[2] for run in runs)} chars em {len(runs)} runs")
+            self._publish()
+
+    def _publish(self):
+        """Publica o estado atual para as leituras sem lock (chamado com o lock)"""
+        previous = self._published
+        self._published = ReadSnapshot(
+            previous.seq + 1 if previous is not None else 0,
+            self.document.text_handle(),
+            self.vector_clock.frozen(),
+            self.vector_clock.lamport,
+            self.applied.frozen(),
+            len(self.pending),
+        )
+
+    def _apply_message(self, msg):
+        """
+        Recebe uma operação remota (chamado com o lock adquirido).
+        Operações que chegam antes das anteriores do seu site, ou cuja
+        dependência (origin da inserção, alvo da deleção) ainda não está no
+        documento, esperam no buffer causal.
+        """
+        try:
+            if msg['type'] == 'sync':
+                self._apply_sync(msg)
+                self._log(msg)
+            elif msg['type'] == 'ack':
+                site = msg['site_id']
+                if self.node.fanout:
+                    # Com gossip o anúncio chega por vários caminhos, fora
+                    # de ordem: só o mais novo é guardado e repassado
+                    known = self._acked.get(site)
+                    if known is not None and all(seq <= known.get(s, 0)
+                                                 for s, seq in msg['version'].items()):
+                        return
+                    self.node._relay(msg)
+                self._acked[site] = msg['version']
+            elif msg['type'] == 'version':
+                peer_id = msg['site_id']
+                self._acked[peer_id] = msg['version']
+                self._send_sync(peer_id, msg['version'])
+                if msg.get('request'):
+                    self._send(peer_id, self.version_message())
+            else:
+                if self.node.fanout:
+                    self._relay_once(msg)
+                self._deliver([msg])
+                
+        except Exception as e:
+            print(f"[Node {self.node_id}] Erro processando msg: {e}")
+            import traceback
+            traceback.print_exc()
+
+    def _relay_once(self, msg):
+        """
+        Com gossip, repassa a operação na primeira vez que ela chega, antes
+        mesmo de ser entregue: uma lacuna na sequência de um site (operação
+        que o sorteio não trouxe até aqui) não pode segurar o repasse das
+        seguintes. As cópias param aqui, pelo contador do site no op_id (já
+        entregue ou já repassado).
+        """
+        span = self._op_span(msg)
+        if span is None:
+            return
+        site, start, end = span
+        delivered = self.pending.delivered
+        relayed = self._relayed
+        if end <= delivered.get(site, 0) or (site, start) in relayed:
+            return
+        if len(relayed) > 2 * len(self.pending) + 1024:
+            # Só interessam as ainda não entregues (as demais param acima)
+            relayed = self._relayed = {key for key in relayed
+                                       if key[1] > delivered.get(key[0], 0)}
+        relayed.add((site, start))
+        self.node._relay(msg)
+
+    def _deliver(self, work):
+        """Entrega as operações e, em cascata, as que elas liberarem do buffer"""
+        pending = self.pending
+        while work:
+            msg = work.pop()
+            span = self._op_span(msg)
+            if span is not None:
+                site, start, end = span
+                position = pending.position(site, start, end)
+                if position == 'duplicate':
+                    pending.duplicates += 1
+                    continue
+                if position == 'early':
+                    pending.hold_early(site, start, msg)
+                    continue
+            dependency = self._missing_dependency(msg)
+            if dependency is not None:
+                pending.wait(dependency, msg)
+                self.operation_log.append(
+                    f"Remote {msg['type'].upper()} from {msg['site_id']} aguardando {dependency}")
+                continue
+            try:
+                arrived = self._apply_operation(msg)
+            except Exception as e:
+                print(f"[Node {self.node_id}] Erro processando msg: {e}")
+                continue
+            self._log(msg)
+            if span is not None:
+                following = pending.deliver(site, end)
+                if following is not None:
+                    work.append(following)
+            if arrived is not None:
+                work.extend(pending.arrived(*arrived))
+
+    def _apply_bulk(self, messages, processes=0):
+        """
+        Aplica em lote operações já em ordem causal (a cauda do log em
+        disco, um log importado), com o mesmo resultado de _apply_message
+        uma a uma: relógio, versão e contadores entregues avançam a cada
+        mensagem, os blocos de todas as inserções entram de uma vez
+        (CRDTDocument.bulk_insert) e as deleções são aplicadas depois deles.
+        Inserções seguidas de um site, cada uma com origin no último
+        caractere da anterior (digitação), viram um único bloco.
+        Uma operação fora da vez, com dependência fora do documento e do
+        lote, ou uma mensagem de outro tipo (sync) descarrega o lote e segue
+        pelo caminho normal. Chamado com o lock adquirido.
+        """
+        pending = self.pending
+        index = self.document.index
+        chars = []
+        deletes = []
+        batched = {}   # Site -> maior seq inserido pelo lote
+        runs = {}      # Site -> [bloco, partes do texto, último seq]: digitação contínua
+
+        def ready(dot):
+            return dot is None or dot in index or dot[1] <= batched.get(dot[0], 0)
+
+        def flush():
+            if not chars and not deletes:
+                return
+            for char, parts, last in runs.values():
+                if len(parts) > 1:
+                    char.value = ''.join(parts)
+            runs.clear()
+            inserted = self.document.bulk_insert(chars, processes)
+            for msg in deletes:
+                self._apply_operation(msg)
+            self.operation_log.append(
+                f"BULK: {len(inserted)} blocos e {len(deletes)} deleções aplicados em lote")
+            chars.clear()
+            deletes.clear()
+            batched.clear()
+            # Operações no buffer que esperavam por blocos do lote
+            released = []
+            for char in inserted:
+                released.extend(pending.arrived(char.site, char.seq, char.last_seq))
+            if released:
+                self._deliver(released)
+
+        for msg in messages:
+            kind = msg.get('type')
+            span = self._op_span(msg) if kind in ('insert', 'delete', 'delete_range') else None
+            if span is not None and pending.position(*span) == 'next':
+                if kind == 'insert':
+                    fits = ready(Character.dot_of(msg['origin_id']))
+                elif kind == 'delete':
+                    fits = ready(Character.dot_of(msg['target_id']))
+                else:
+                    fits = all(ready((site, seq + length - 1)) for site, seq, length in msg['runs'])
+            else:
+                fits = False
+            if not fits:
+                flush()
+                self._apply_message(msg)
+                continue
+            if kind == 'insert':
+                char = Character.from_dict(msg['char'])
+                char.origin = Character.dot_of(msg['origin_id'])
+                site = char.site
+                run = runs.get(site)
+                if (run is not None and char.origin == (site, run[2]) and char.seq == run[2] + 1
+                        and char.deleted == run[0].deleted
+                        and (char.clock is None
+                             or char.clock == run[0].id_at(char.seq - run[0].seq)[0])):
+                    # Continua o bloco anterior do site (o origin é o último
+                    # caractere dele): junta os dois, como num bloco digitado
+                    run[1].append(char.value)
+                    run[2] = char.last_seq
+                else:
+                    if run is not None and len(run[1]) > 1:
+                        run[0].value = ''.join(run[1])
+                    chars.append(char)
+                    runs[site] = [char, [char.value], char.last_seq]
+                batched[site] = char.last_seq
+                self.vector_clock.update(msg['op_id'], msg.get('lamport'))
+                self.applied.update({char.site: char.last_seq})
+            else:
+                deletes.append(msg)
+            self._log(msg)
+            following = pending.deliver(span[0], span[2])
+            if following is not None:
+                flush()
+                self._deliver([following])
+        flush()
+
+    def _op_span(self, msg):
+        """
+        (site, primeiro, último) contadores do site (no op_id) consumidos
+        pela operação, ou None se a mensagem não traz op_id.
+        """
+        site = msg.get('site_id')
+        end = msg.get('op_id', {}).get(site)
+        if end is None:
+            return None
+        size = len(msg['char']['value']) if msg['type'] == 'insert' else 1
+        return site, end - size + 1, end
+
+    def _missing_dependency(self, msg):
+        """Dot do qual a operação depende e que ainda não está no documento (ou None)"""
+        if msg['type'] == 'insert':
+            dependency = Character.dot_of(msg['origin_id'])
+        elif msg['type'] == 'delete':
+            dependency = Character.dot_of(msg['target_id'])
+        elif msg['type'] == 'delete_range':
+            # As inserções de cada site chegam em ordem, então basta o
+            # último caractere de cada run estar no documento
+            index = self.document.index
+            for site, seq, length in msg['runs']:
+                if (site, seq + length - 1) not in index:
+                    return (site, seq + length - 1)
+            return None
+        else:
+            return None
+        if dependency is None or dependency in self.document.index:
+            return None
+        return dependency
+
+    def _apply_operation(self, msg):
+        """
+        Aplica uma operação remota com as dependências satisfeitas.
+        Retorna os dots (site, primeiro, último) inseridos, ou None.
+        """
+        # Atualiza relógio (se houver campo op_id no topo)
+        if 'op_id' in msg:
+            self.vector_clock.update(msg['op_id'], msg.get('lamport'))
+        elif 'lamport' in msg:
+            self.vector_clock.update({}, msg['lamport'])
+        
+        if msg['type'] == 'insert':
+            # Desserializa o origin ID
+            origin_id = self._deserialize_id(msg['origin_id'])
+            # O char vem como dict no campo 'char'
+            char = self.document.remote_insert(msg['char'], origin_id)
+            self.operation_log.append(f"Remote INSERT from {msg['site_id']}")
+            if char is not None:
+                self.applied.update({char.site: char.last_seq})
+                return char.site, char.seq, char.last_seq
+        
+        elif msg['type'] == 'delete':
+            target_id = self._deserialize_id(msg['target_id'])
+            dot = self._message_dot(msg)
+            self.document.remote_delete(target_id, dot)
+            if dot is not True:
+                self.applied.update({dot[0]: dot[1]})
+            self.operation_log.append(f"Remote DELETE from {msg['site_id']}")
+
+        elif msg['type'] == 'delete_range':
+            dot = self._message_dot(msg)
+            self.document.remote_delete_range(msg['runs'], dot)
+            if dot is not True:
+                self.applied.update({dot[0]: dot[1]})
+            self.operation_log.append(f"Remote DELETE_RANGE from {msg['site_id']}")
+        return None
+
+    # ------------------------------------------------------------------
+    # Persistência (ver wal.py)
+    # ------------------------------------------------------------------
+    def _log(self, msg):
+        """Registra no log em disco uma operação que acabou de ser aplicada"""
+        if self.wal is not None:
+            self.wal.append(msg)
+
+    def _log_local(self, message):
+        """
+        Registra uma operação local e a envia aos peers só depois do fsync
+        do registro: se o nó cair antes, ninguém recebeu o (site, seq) que
+        ele vai reutilizar ao voltar. Sem log, envia na hora.
+        """
+        if self.wal is None:
+            self._broadcast(message)
+        else:
+            self.wal.after_durable(self.wal.append(message), self._broadcast, message)
+
+    def _recover(self, wal):
+        """Carrega o snapshot mais recente e reaplica a cauda do log"""
+        start = time.perf_counter()
+        header, records = wal.load_snapshot()
+        if header is not None:
+            if header['id_mode'] != self.id_mode:
+                raise ValueError(f"Dados em disco usam o modo de ID {header['id_mode']}")
+            self.document.load(records)
+            self.applied.update(header['version'])
+            self.vector_clock.update(header['clock'], header['lamport'])
+            self.pending.advance(header.get('delivered', {}))
+        loaded = time.perf_counter() - start
+        tail = list(wal.replay())
+        self._apply_bulk(tail)
+        replayed = len(tail)
+        self.operation_log.clear()
+        self.recovery_stats = {
+            'snapshot_blocks': len(records),
+            'replayed': replayed,
+            'snapshot_seconds': loaded,
+            'seconds': time.perf_counter() - start,
+        }
+        if header is not None or replayed:
+            self.operation_log.append(
+                f"RECOVERY: snapshot com {len(records)} blocos + {replayed} operações do log "
+                f"({self.recovery_stats['seconds']:.2f}s)")
+
+    def _stream(self, records=None):
+        """
+        Fluxo (formato de snapshot.py, em pedaços de bytes) do documento
+        inteiro ou de 'records', com a versão, o relógio e os contadores
+        entregues da réplica (lidos na chamada). Gerado à medida que é
+        consumido, o que deve acontecer com o lock adquirido, salvo se
+        'records' é uma cópia dos blocos (ver export).
+        """
+        writer = SnapshotWriter(self.id_mode, self.applied.clock, self.vector_clock.clock,
+                                self.vector_clock.lamport, self.pending.delivered)
+        return encode_stream(writer, self.document.tree if records is None else records)
+
+    def checkpoint(self):
+        """
+        Grava um snapshot compactado do documento e passa a registrar num
+        novo segmento do log; os segmentos anteriores são apagados. Com o
+        lock só se roda o log e se tira uma cópia consistente com a rotação
+        (versão, relógios e a lista de blocos, como em export); o snapshot
+        é gerado, gravado e sincronizado depois, sem fazer operações novas
+        esperarem. Até o commit_snapshot, o snapshot anterior e todos os
+        segmentos continuam no disco.
+        """
+        if self.wal is None:
+            return
+        with self._checkpoint_lock:
+            with self.lock:
+                segment = self.wal.rotate()
+                blocks = [char.copy() for char in self.document.tree]
+                stream = self._stream(blocks)
+            size = self.wal.write_snapshot(segment, stream)
+            self.wal.commit_snapshot(segment)
+        self.operation_log.append(f"CHECKPOINT: snapshot {segment} ({size} bytes)")
+
+    # ------------------------------------------------------------------
+    # Coleta de tombstones
+    # ------------------------------------------------------------------
+    def _stable_version(self):
+        """
+        Por site, o maior seq que todas as réplicas já aplicaram: o mínimo
+        entre a nossa versão e a última anunciada por cada membro do cluster.
+        Vazia (nada estável) enquanto faltar o anúncio de algum peer ou
+        enquanto não tivermos aplicado todas as operações que o próprio peer
+        já tinha gerado ao anunciar: uma delas, ainda em trânsito ou no
+        buffer causal, pode ter como origin um tombstone que o peer já viu
+        ser deletado. O mesmo vale para a última operação de um nó que
+        saiu do cluster (ver retire).
+        """
+        mine = self.applied.clock
+        departed = self._departed
+        for site in list(departed):
+            if mine.get(site, 0) < departed[site]:
+                return {}
+            del departed[site]
+        stable = dict(mine)
+        for peer_id in self.node.members:
+            version = self._acked.get(peer_id)
+            if version is None or version.get(peer_id, 0) > mine.get(peer_id, 0):
+                return {}
+            for site, seq in stable.items():
+                stable[site] = min(seq, version.get(site, 0))
+        return stable
+
+    def _send_ack(self):
+        """Anuncia aos peers a nossa versão, se ela mudou desde o último anúncio"""
+        with self.lock:
+            version = self.applied.get_copy()
+            if version == self._ack_sent:
+                return
+            self._ack_sent = version
+            self._broadcast({'type': 'ack', 'site_id': self.node_id, 'version': version})
+
+    def collect_garbage(self, budget=1000):
+        """
+        Uma passada completa da coleta de tombstones estáveis pelo documento,
+        em passos de até 'budget' blocos; o lock é liberado entre os passos
+        para não travar as operações. Retorna (blocos, caracteres, bytes)
+        removidos.
+        """
+        blocks = chars = size = 0
+        done = False
+        while not done:
+            with self.lock:
+                stable = self._stable_version()
+                if not stable:
+                    break
+                removed_blocks, removed_chars, removed_size, done = \
+                    self.document.collect_tombstones(stable, budget)
+                blocks += removed_blocks
+                chars += removed_chars
+                size += removed_size
+        with self.lock:
+            stats = self.gc_stats
+            stats['passes'] += 1
+            stats['blocks'] += blocks
+            stats['chars'] += chars
+            stats['bytes'] += size
+            if blocks:
+                self.operation_log.append(
+                    f"GC: {blocks} tombstones ({chars} caracteres, ~{size} bytes) removidos")
+        return blocks, chars, size
+
+    def retire(self, site, final=0):
+        """
+        Aposenta o site de um nó que saiu do cluster (chamado com o lock):
+        o contador dele sai das listas densas dos relógios (ver
+        vector_clock.py) e ele deixa de ter versão anunciada. 'final' é o
+        seq da última operação do nó neste documento; até ela ser aplicada
+        aqui nada é coletado (ver _stable_version).
+        """
+        if site == self.node_id:
+            return
+        self.sites.retire(site)
+        self._acked.pop(site, None)
+        self._synced.pop(site, None)
+        if final > self.applied.get(site):
+            self._departed[site] = max(final, self._departed.get(site, 0))
+
+    def buffer_stats(self):
+        """Métricas do buffer causal (profundidade atual, pico, totais)"""
+        with self.lock:
+            return self.pending.stats()
+
+    def stats(self):
+        """Tamanhos do documento (para Node.stats; contadores mantidos pelo documento, O(1))"""
+        with self.lock:
+            document = self.document
+            tombstone_blocks, tombstone_chars = document.tombstones()
+            return {
+                'visible': len(document),
+                'blocks': len(document.tree),
+                'tombstone_blocks': tombstone_blocks,
+                'tombstone_chars': tombstone_chars,
+                'buffered': len(self.pending),
+                'log_since_snapshot': self.wal.since_snapshot if self.wal is not None else 0,
+            }
+
+    def _local_dot(self):
+        """Dot (site, seq) da operação local corrente, no espaço de seq dos IDs"""
+        if self.id_mode == 'lamport':
+            return (self.node_id, self.vector_clock.lamport)
+        return (self.node_id, self.vector_clock.get(self.node_id))
+
+    def _message_dot(self, msg):
+        """Dot de uma operação recebida (True se a mensagem não o traz)"""
+        site = msg['site_id']
+        if self.id_mode == 'lamport':
+            seq = msg.get('lamport')
+        else:
+            seq = msg.get('op_id', {}).get(site)
+        return True if seq is None else (site, seq)
+
+    # ------------------------------------------------------------------
+    # Sync (delta ou snapshot, ver snapshot.py)
+    # ------------------------------------------------------------------
+    def _send_sync(self, peer_id, peer_version):
+        """
+        Envia ao peer o que ele não tem, a partir da versão anunciada no
+        hello: o delta (blocos e deleções posteriores à versão dele) ou o
+        snapshot completo, o que for menor. O snapshot só é opção quando o
+        peer não tem nada que nós não tenhamos, pois ele substitui o
+        documento de lá. Chamado com o lock adquirido.
+        """
+        if self.wal is not None:
+            # O delta não pode levar operações locais ainda fora do disco
+            # (ver _log_local); o fsync também libera os envios delas
+            self.wal.sync()
+        mine = self.applied.clock
+        # O que já enviamos nesta conexão chega antes (mesma fila)
+        sent = self._synced.get(peer_id, {})
+        version = {site: max(seq, sent.get(site, 0)) for site, seq in peer_version.items()}
+        for site, seq in sent.items():
+            version.setdefault(site, seq)
+        if not any(seq > version.get(site, 0) for site, seq in mine.items()):
+            return
+
+        records = self.document.delta(version)
+        kind = 'delta'
+        behind = all(seq <= mine.get(site, 0) for site, seq in peer_version.items())
+        if behind and len(self.document.tree) <= len(records):
+            kind = 'snapshot'
+            records = self.document.tree
+        count = len(records)
+
+        # Cada pedaço sai assim que o seguinte é gerado (o último vai com 'done')
+        size = 0
+        part = 0
+        previous = None
+        for chunk in self._stream(records):
+            if previous is not None:
+                self._send_part(peer_id, kind, part, False, previous)
+                part += 1
+            previous = chunk
+            size += len(chunk)
+        self._send_part(peer_id, kind, part, True, previous)
+        self._synced[peer_id] = dict(mine)
+        self.operation_log.append(f"SYNC {kind} -> {peer_id} ({count} registros, {size} bytes)")
+
+    def _send_part(self, peer_id, kind, part, done, chunk):
+        self._send(peer_id, {
+            'type': 'sync',
+            'site_id': self.node_id,
+            'kind': kind,
+            'part': part,
+            'done': done,
+            'data': base64.b64encode(chunk).decode('ascii')
+        })
+
+    def _apply_sync(self, msg):
+        """Consome uma parte de um fluxo de sync (chamado com o lock adquirido)"""
+        sender = msg['site_id']
+        if msg['part'] == 0:
+            self._sync_readers[sender] = (SnapshotReader(), [])
+        elif sender not in self._sync_readers:
+            return  # Início do fluxo perdido (conexão caiu no meio)
+        reader, pending = self._sync_readers[sender]
+        records = reader.feed(base64.b64decode(msg['data']))
+
+        header = reader.header
+        if msg['part'] == 0:
+            if header is None or header['id_mode'] != self.id_mode:
+                print(f"[Node {self.node_id}] Sync de {sender} ignorado (modo de ID diferente)")
+                del self._sync_readers[sender]
+                return
+            # Operações locais daqui em diante são causalmente posteriores
+            # a tudo que o fluxo traz
+            self.vector_clock.update(header['clock'], header['lamport'])
+
+        if msg['kind'] == 'delta':
+            # Registros em ordem do documento: podem ser aplicados já
+            self.document.merge(records, self.applied.clock)
+        else:
+            pending.extend(records)
+
+        if not msg['done']:
+            return
+        del self._sync_readers[sender]
+        self.operation_log.append(f"SYNC {msg['kind']} <- {sender} ({msg['part'] + 1} partes)")
+        self._finish_stream(header, pending if msg['kind'] == 'snapshot' else None)
+
+    def _finish_stream(self, header, records=None):
+        """
+        Conclui a aplicação de um fluxo completo: 'records' (os blocos de um
+        snapshot) substituem o documento ou são mesclados a ele, e a versão
+        e os contadores entregues do remetente são incorporados.
+        """
+        version = header['version']
+        if records is not None:
+            # Sem nada que o remetente não tenha: o snapshot substitui o documento
+            if all(seq <= version.get(site, 0) for site, seq in self.applied.clock.items()):
+                self.document.load(records)
+            else:
+                self.document.merge(records, self.applied.clock)
+        self.applied.update(version)
+        # O fluxo traz tudo que o remetente entregou: operações adiantadas
+        # podem ter virado a vez (ou duplicatas), e dependências em espera
+        # podem ter chegado
+        ready = self.pending.advance(header.get('delivered', {}))
+        self._deliver(ready + self.pending.waiting())
+
+    def export(self, out):
+        """
+        Grava o estado completo do documento (o mesmo fluxo do snapshot)
+        num arquivo ou socket. Com o lock só se tira uma cópia consistente
+        (versão, relógios e a lista de blocos, ver Character.copy); o fluxo
+        é gerado e gravado depois, sem fazer operações novas esperarem pela
+        gravação. Retorna o total de bytes.
+        """
+        with self.lock:
+            blocks = [char.copy() for char in self.document.tree]
+            stream = self._stream(blocks)
+        size = write_stream(out, stream)
+        self.operation_log.append(f"EXPORT: {len(blocks)} blocos ({size} bytes)")
+        return size
+
+    def import_snapshot(self, source):
+        """
+        Lê de um arquivo ou socket um fluxo gravado por export (ou um
+        snapshot do log em disco) e o incorpora como um sync recebido. Os
+        blocos vão, à medida que são lidos, para um documento à parte,
+        montado fora do lock; com o lock ele substitui o documento em O(1)
+        ou, se temos operações que o fluxo não traz, é mesclado a ele.
+        Retorna o número de registros.
+        """
+        reader = SnapshotReader()
+        records = reader.stream(source)
+        first = next(records, None)    # Lê o cabeçalho
+        header = reader.header
+        if header['id_mode'] != self.id_mode:
+            raise ValueError(f"Fluxo usa o modo de ID {header['id_mode']}")
+        staged = CRDTDocument(self.id_mode)
+        staged.load(itertools.chain(() if first is None else (first,), records))
+        count = len(staged.tree)
+        with self.lock:
+            self.vector_clock.update(header['clock'], header['lamport'])
+            version = header['version']
+            if all(seq <= version.get(site, 0) for site, seq in self.applied.clock.items()):
+                self.document.swap(staged)
+            else:
+                self.document.merge(staged.tree, self.applied.clock)
+            self._finish_stream(header)
+            self.operation_log.append(f"IMPORT: {count} registros")
+            self._publish()
+        # Não passa pelo log em disco: o snapshot registra o estado importado
+        self.checkpoint()
+        return count
+
+    # Métodos auxiliares para serializar a tupla (VectorClock, site_id)
+    def _serialize_id(self, pos_id):
+        if pos_id is None: return None
+        # pos_id é ({'node': 1}, 'site')
+        # JSON não aceita chaves que não sejam string
+        clock, site = pos_id
+        # Garante que o clock seja serializável
+        if isinstance(clock, dict):
+            clock_list = list(clock.items())
+        else:
+            clock_list = clock
+        return [clock_list, site]
+
+    def _deserialize_id(self, list_data):
+        if list_data is None: return None
+        
+        # CORREÇÃO CRÍTICA AQUI:
+        # O JSON traz listas de listas [[k,v], [k,v]].
+        # Precisamos converter as listas internas [k,v] em tuplas (k,v)
+        # para bater com o formato interno do Character.
+        # (Dots Lamport [contador, site] já chegam no formato final.)
+        return Character.normalize_id(list_data)
+
+    def read_snapshot(self):
+        """Último estado publicado (ReadSnapshot), sem adquirir o lock"""
+        return self._published
+
+    def get_text(self, start=0, end=None):
+        """
+        Retorna o texto atual do documento (ou o trecho [start, end)), a
+        partir do último estado publicado, sem adquirir o lock.
+        """
+        text = self._published.text
+        if start == 0 and end is None:
+            return text
+        return text[start:end]
+
+    def subscribe(self, callback):
+        """
+        Assina as mudanças do texto visível: callback(índice, removidos,
+        inseridos) é chamado a cada mudança, local ou remota, com o lock do
+        nó adquirido (deve ser rápido, ex.: enfileirar o delta). Retorna o
+        texto no momento da assinatura; aplicar os deltas em ordem sobre
+        ele reproduz o texto do nó.
+        """
+        with self.lock:
+            self.document.listeners.append(callback)
+            return self.document.get_text()
+
+    def unsubscribe(self, callback):
+        """Cancela uma assinatura feita com subscribe"""
+        with self.lock:
+            self.document.listeners.remove(callback)
@@ -0,0 +1,93 @@
+"""
+run_index.py - Índice (site, seq) -> bloco do documento
+
+Cada bloco (Character) cobre os contadores [seq, seq + len) do seu site.
+O índice guarda, por site, os contadores iniciais dos blocos em ordem:
+- ID que é início de bloco: consulta direta no dicionário, O(1)
+- ID no meio de um bloco: busca binária nos inícios, O(log b)
+"""
+from bisect import bisect_right, insort
+
+
+class _SiteRuns:
+    __slots__ = ('starts', 'nodes')
+
+    def __init__(self):
+        self.starts = []   # Contadores iniciais ordenados
+        self.nodes = {}    # contador inicial -> nó da árvore
+
+
+class RunIndex:
+    """Localiza o nó da árvore (e o deslocamento) de qualquer caractere"""
+
+    def __init__(self):
+        self._sites = {}
+        self._count = 0
+
+    def __len__(self):
+        """Número de blocos indexados"""
+        return self._count
+
+    def add(self, site, seq, node):
+        runs = self._sites.get(site)
+        if runs is None:
+            runs = self._sites[site] = _SiteRuns()
+        starts = runs.starts
+        # Caso comum: contadores crescentes (anexa no fim)
+        if not starts or seq > starts[-1]:
+            starts.append(seq)
+        else:
+            insort(starts, seq)
+        runs.nodes[seq] = node
+        self._count += 1
+
+    def add_many(self, entries):
+        """
+        Adiciona vários (site, seq, nó) de uma vez, em qualquer ordem
+        (ex.: na ordem do documento, ao carregar um snapshot): os inícios de
+        cada site são ordenados uma única vez no final.
+        """
+        touched = set()
+        sites = self._sites
+        count = 0
+        for site, seq, node in entries:
+            runs = sites.get(site)
+            if runs is None:
+                runs = sites[site] = _SiteRuns()
+            runs.starts.append(seq)
+            runs.nodes[seq] = node
+            touched.add(site)
+            count += 1
+        for site in touched:
+            sites[site].starts.sort()
+        self._count += count
+
+    def remove(self, site, seq):
+        runs = self._sites.get(site)
+        if runs is None or runs.nodes.pop(seq, None) is None:
+            return
+        starts = runs.starts
+        i = bisect_right(starts, seq) - 1
+        del starts[i]
+        self._count -= 1
+
+    def find(self, site, seq):
+        """Retorna (nó, deslocamento) do caractere (site, seq) ou (None, 0)"""
+        runs = self._sites.get(site)
+        if runs is None:
+            return None, 0
+        node = runs.nodes.get(seq)
+        if node is not None:
+            return node, 0
+        starts = runs.starts
+        i = bisect_right(starts, seq) - 1
+        if i < 0:
+            return None, 0
+        start = starts[i]
+        node = runs.nodes[start]
+        if seq < start + len(node.item):
+            return node, seq - start
+        return None, 0
+
+    def __contains__(self, dot):
+        return self.find(*dot)[0] is not None
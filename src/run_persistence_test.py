@@ -0,0 +1,125 @@
+"""
+run_persistence_test.py - Testes de regressão da persistência
+
+Cenários (nós sem rede, em diretórios temporários, nos dois modos de ID):
+1. Cauda rasgada do log: a última escrita é cortada no meio (como numa
+   queda) e o nó, ao reiniciar, volta ao estado do último registro
+   completo, mesmo com um checkpoint no meio do histórico
+2. export -> import_snapshot: outro nó recebe o fluxo e fica com o mesmo
+   texto e a mesma versão
+3. Fluxo vazio ou truncado: import_snapshot levanta ValueError e o
+   documento do nó não muda
+Termina com código 1 se algum cenário falhar. Roda também no fim de
+run_test.sh.
+
+Uso: python3 run_persistence_test.py
+"""
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+from node import Node
+
+EDITS = 300
+
+
+def make_node(node_id, mode, data_dir=None):
+    node = Node(node_id, 'localhost', 0, [], id_mode=mode, data_dir=data_dir,
+                fsync_interval=0, checkpoint_ops=10 ** 9)
+    node._broadcast = lambda msg: None
+    return node
+
+
+def edit(node, rnd):
+    length = len(node.get_text())
+    if length > 10 and rnd.random() < 0.3:
+        node.delete(rnd.randrange(length))
+    else:
+        node.insert(rnd.randint(0, length), ''.join(rnd.choice('abcdefgh ')
+                                                   for _ in range(rnd.randint(1, 3))))
+
+
+def version(node):
+    return {site: seq for site, seq in node.applied.clock.items() if seq}
+
+
+def torn_tail(mode, directory):
+    rnd = random.Random(1)
+    node = make_node('node1', mode, directory)
+    for i in range(EDITS):
+        edit(node, rnd)
+        if i == EDITS // 2:
+            node.checkpoint()
+    expected = node.get_text()
+    node.insert(0, 'X')               # Último registro: será cortado
+    node.wal.close()
+
+    segment = max(name for name in os.listdir(directory) if name.startswith('wal-'))
+    path = os.path.join(directory, segment)
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - 3)
+
+    restarted = make_node('node1', mode, directory)
+    ok = restarted.get_text() == expected
+    restarted.insert(0, 'Y')          # O log continua gravável depois do corte
+    restarted.wal.close()
+    again = make_node('node1', mode, directory)
+    ok = ok and again.get_text() == 'Y' + expected
+    again.wal.close()
+    return ok
+
+
+def round_trip(mode):
+    rnd = random.Random(2)
+    source = make_node('node1', mode)
+    for _ in range(EDITS):
+        edit(source, rnd)
+    out = io.BytesIO()
+    size = source.export(out)
+    data = out.getvalue()
+
+    target = make_node('node2', mode)
+    target.import_snapshot(io.BytesIO(data))
+    ok = (size == len(data) and target.get_text() == source.get_text()
+          and version(target) == version(source))
+    return ok, data
+
+
+def rejected(mode, data):
+    ok = True
+    for name, stream in (('vazio', b''), ('truncado', data[:len(data) // 2])):
+        node = make_node('node3', mode)
+        node.insert(0, 'abc')
+        try:
+            node.import_snapshot(io.BytesIO(stream))
+            print(f"   fluxo {name} aceito")
+            ok = False
+        except ValueError:
+            pass
+        if node.get_text() != 'abc':
+            print(f"   fluxo {name} alterou o documento")
+            ok = False
+    return ok
+
+
+def main():
+    failed = 0
+    for mode in ('lamport', 'vector'):
+        directory = tempfile.mkdtemp()
+        try:
+            results = [('cauda rasgada do log', torn_tail(mode, directory))]
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        ok, data = round_trip(mode)
+        results.append(('export -> import', ok))
+        results.append(('fluxo vazio ou truncado rejeitado', rejected(mode, data)))
+        for name, ok in results:
+            print(f"[{mode}] {name}: {'ok' if ok else 'FALHOU'}")
+            failed += not ok
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
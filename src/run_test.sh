@@ -139,6 +139,13 @@ echo "show" >&5
 sleep 1
 show_state
 
+# ==============================================================================
+# CENÁRIO 6: Persistência (sem rede, ver run_persistence_test.py)
+# Cauda rasgada do log, export -> import e fluxos vazio/truncado rejeitados
+# ==============================================================================
+echo "--- CENÁRIO 6: Persistência (log e export/import) ---"
+python3 run_persistence_test.py
+
 # ==============================================================================
 # ENCERRAMENTO
 # ==============================================================================
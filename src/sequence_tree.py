@@ -0,0 +1,300 @@
+"""
+sequence_tree.py - Árvore de estatística de ordem para a sequência do RGA
+
+Treap implícita (sem chaves): a ordem dos nós é a ordem do documento e cada
+nó guarda a soma dos pesos (caracteres visíveis) da sua subárvore. Com isso:
+- índice visual -> nó e nó -> índice visual custam O(log n)
+- inserir depois de um nó conhecido custa O(log n) esperado
+- sucessor/antecessor custam O(1) amortizado
+"""
+import random
+
+
+class TreeNode:
+    """Nó da árvore. 'item' é o elemento do documento (Character)."""
+
+    __slots__ = ('item', 'weight', 'size', 'prio', 'left', 'right', 'parent')
+
+    def __init__(self, item, weight, prio):
+        self.item = item
+        self.weight = weight      # Caracteres visíveis neste nó
+        self.size = weight        # Soma dos pesos da subárvore
+        self.prio = prio
+        self.left = None
+        self.right = None
+        self.parent = None
+
+    def __repr__(self):
+        return f"TreeNode({self.item!r}, weight={self.weight})"
+
+
+def _size(node):
+    return node.size if node is not None else 0
+
+
+class SequenceTree:
+    """
+    Sequência ordenada de itens com pesos, indexável pelo peso acumulado.
+    O documento usa peso = número de caracteres visíveis do item.
+    """
+
+    def __init__(self, seed=None):
+        self.root = None
+        self.count = 0
+        self._rand = random.Random(seed).random
+
+    def __len__(self):
+        """Número de nós (inclui itens com peso zero, ex.: tombstones)"""
+        return self.count
+
+    @property
+    def weight(self):
+        """Peso total da sequência (caracteres visíveis)"""
+        return _size(self.root)
+
+    # ------------------------------------------------------------------
+    # Navegação
+    # ------------------------------------------------------------------
+    def first(self):
+        node = self.root
+        if node is None:
+            return None
+        while node.left is not None:
+            node = node.left
+        return node
+
+    def last(self):
+        node = self.root
+        if node is None:
+            return None
+        while node.right is not None:
+            node = node.right
+        return node
+
+    def next(self, node):
+        """Sucessor em ordem (None no fim)"""
+        if node.right is not None:
+            node = node.right
+            while node.left is not None:
+                node = node.left
+            return node
+        parent = node.parent
+        while parent is not None and parent.right is node:
+            node = parent
+            parent = node.parent
+        return parent
+
+    def prev(self, node):
+        """Antecessor em ordem (None no início)"""
+        if node.left is not None:
+            node = node.left
+            while node.right is not None:
+                node = node.right
+            return node
+        parent = node.parent
+        while parent is not None and parent.left is node:
+            node = parent
+            parent = node.parent
+        return parent
+
+    def nodes(self, start=None):
+        """Itera os nós em ordem, a partir de 'start' (inclusive) ou do início"""
+        node = self.first() if start is None else start
+        while node is not None:
+            yield node
+            node = self.next(node)
+
+    def __iter__(self):
+        for node in self.nodes():
+            yield node.item
+
+    def find(self, index):
+        """
+        Localiza o nó que contém a posição visual 'index'.
+        Retorna (nó, deslocamento dentro do nó) ou (None, 0) se fora da faixa.
+        """
+        if index < 0 or index >= _size(self.root):
+            return None, 0
+        node = self.root
+        while True:
+            left_size = _size(node.left)
+            if index < left_size:
+                node = node.left
+                continue
+            index -= left_size
+            if index < node.weight:
+                return node, index
+            index -= node.weight
+            node = node.right
+
+    def rank(self, node):
+        """Peso acumulado antes de 'node' (= índice visual do seu início)"""
+        total = _size(node.left)
+        while node.parent is not None:
+            parent = node.parent
+            if parent.right is node:
+                total += _size(parent.left) + parent.weight
+            node = parent
+        return total
+
+    # ------------------------------------------------------------------
+    # Modificação
+    # ------------------------------------------------------------------
+    def insert_after(self, ref, item, weight):
+        """
+        Insere 'item' logo após o nó 'ref' (ref=None insere no início).
+        Retorna o novo nó.
+        """
+        new = TreeNode(item, weight, self._rand())
+        self.count += 1
+
+        if self.root is None:
+            self.root = new
+            return new
+
+        if ref is None:
+            parent = self.first()
+            parent.left = new
+        elif ref.right is None:
+            parent = ref
+            parent.right = new
+        else:
+            parent = ref.right
+            while parent.left is not None:
+                parent = parent.left
+            parent.left = new
+        new.parent = parent
+
+        # Atualiza somas até a raiz e depois restaura a propriedade de heap
+        node = parent
+        while node is not None:
+            node.size += weight
+            node = node.parent
+        self._bubble_up(new)
+        return new
+
+    def set_weight(self, node, weight):
+        """Altera o peso de um nó propagando a diferença até a raiz"""
+        delta = weight - node.weight
+        if delta == 0:
+            return
+        node.weight = weight
+        while node is not None:
+            node.size += delta
+            node = node.parent
+
+    def remove(self, node):
+        """Remove fisicamente um nó da árvore"""
+        # Desce o nó por rotações até virar folha (ou ter um único filho)
+        while node.left is not None and node.right is not None:
+            if node.left.prio > node.right.prio:
+                self._rotate_right(node)
+            else:
+                self._rotate_left(node)
+
+        child = node.left if node.left is not None else node.right
+        parent = node.parent
+        if child is not None:
+            child.parent = parent
+        if parent is None:
+            self.root = child
+        elif parent.left is node:
+            parent.left = child
+        else:
+            parent.right = child
+
+        # Tombstones têm peso zero: nada a descontar nos ancestrais
+        if node.weight:
+            while parent is not None:
+                parent.size -= node.weight
+                parent = parent.parent
+
+        node.left = node.right = node.parent = None
+        self.count -= 1
+
+    def build(self, items_with_weights):
+        """
+        Substitui o conteúdo por uma sequência já ordenada de (item, peso),
+        em O(n) (construção de árvore cartesiana com pilha).
+        Retorna a lista de nós criados, na ordem.
+        """
+        rand = self._rand
+        created = []
+        stack = []
+        for item, weight in items_with_weights:
+            node = TreeNode(item, weight, rand())
+            last = None
+            while stack and stack[-1].prio < node.prio:
+                last = stack.pop()
+            if last is not None:
+                node.left = last
+                last.parent = node
+            if stack:
+                stack[-1].right = node
+                node.parent = stack[-1]
+            stack.append(node)
+            created.append(node)
+
+        self.root = stack[0] if stack else None
+        self.count = len(created)
+        # Somas calculadas de baixo para cima (ordem pós-fixada)
+        if self.root is not None:
+            self._recompute_sizes(self.root)
+        return created
+
+    # ------------------------------------------------------------------
+    # Internos
+    # ------------------------------------------------------------------
+    def _recompute_sizes(self, root):
+        stack = [(root, False)]
+        while stack:
+            node, visited = stack.pop()
+            if visited:
+                node.size = node.weight + _size(node.left) + _size(node.right)
+                continue
+            stack.append((node, True))
+            if node.left is not None:
+                stack.append((node.left, False))
+            if node.right is not None:
+                stack.append((node.right, False))
+
+    def _bubble_up(self, node):
+        while node.parent is not None and node.parent.prio < node.prio:
+            if node.parent.left is node:
+                self._rotate_right(node.parent)
+            else:
+                self._rotate_left(node.parent)
+
+    def _rotate_left(self, x):
+        """Rotaciona x com seu filho direito (o filho sobe)"""
+        y = x.right
+        x.right = y.left
+        if y.left is not None:
+            y.left.parent = x
+        self._replace_child(x, y)
+        y.left = x
+        x.parent = y
+        x.size = x.weight + _size(x.left) + _size(x.right)
+        y.size = y.weight + _size(y.left) + _size(y.right)
+
+    def _rotate_right(self, x):
+        """Rotaciona x com seu filho esquerdo (o filho sobe)"""
+        y = x.left
+        x.left = y.right
+        if y.right is not None:
+            y.right.parent = x
+        self._replace_child(x, y)
+        y.right = x
+        x.parent = y
+        x.size = x.weight + _size(x.left) + _size(x.right)
+        y.size = y.weight + _size(y.left) + _size(y.right)
+
+    def _replace_child(self, old, new):
+        parent = old.parent
+        new.parent = parent
+        if parent is None:
+            self.root = new
+        elif parent.left is old:
+            parent.left = new
+        else:
+            parent.right = new
@@ -0,0 +1,356 @@
+"""
+sim_transport.py - Rede simulada em memória, em tempo virtual
+
+Alternativa aos transportes TCP para testes e benchmarks com centenas de
+nós num único processo: em vez de sockets e threads, uma fila de eventos
+em tempo virtual entrega as mensagens entre os nós, de forma
+determinística para uma mesma semente (e o mesmo PYTHONHASHSEED). O
+tempo virtual não espera o relógio (intervalos ociosos, como os de
+reconexão e anti-entropia, não custam nada) nem atrasa com a carga da
+máquina: as latências medidas são só as sorteadas. O nó recebe o
+transporte pela fábrica (Node(..., transport=network.transport)) e é
+iniciado por network.start(node), não por Node.start(): as operações
+recebidas são aplicadas na hora, e as rodadas de reconexão
+(reconnect_interval), de coleta (gc_interval) e, com fanout, de
+anti-entropia são agendadas em tempo virtual.
+
+Cada conexão faz o handshake real (hello, negociação de formato e de
+compressão, sync). Cada mensagem é codificada (frames binários ou linhas
+JSON, ver outbound.encode_frame, e zlib se negociado) e decodificada uma
+única vez por formato, com codificadores da rede em regime (tabela de
+sites já preenchida, como numa conexão aberta há algum tempo). Os bytes
+contados são uma estimativa desse regime, não o tráfego de cada conexão:
+a tabela de sites e o dicionário do zlib são da rede, compartilhados por
+todas, e a primeira mensagem de uma conexão nova sai menor que na
+conexão real. Quem recebe ganha a mensagem decodificada, com o
+frame guardado: repassá-la (gossip) não passa pelo codec de novo, e o
+custo de um salto fica no nó, não na serialização. Falhas, sorteadas com
+a semente da rede:
+- latency: latência (s) de cada mensagem, sorteada no intervalo
+- reorder: probabilidade de uma operação ao vivo (insert, delete,
+  delete_range) ignorar a ordem da conexão e passar à frente das
+  operações enviadas antes dela, como se viesse por outro caminho. Ela
+  nunca passa à frente de uma mensagem de controle (hello, sync, version):
+  o sync conta com o que já foi enviado na conexão chegando antes
+- duplicate: probabilidade de uma operação ao vivo chegar duas vezes
+- loss: probabilidade de uma mensagem se perder. Como no TCP, que não
+  perde dados com a conexão aberta, a conexão cai junto (os dois lados
+  veem a queda, e o que estava em trânsito nela se perde); o nó reconecta
+  na rodada seguinte e o hello dispara o sync
+- partition(grupos) derruba as conexões entre grupos e recusa as novas
+  até heal()
+"""
+import heapq
+import json
+import random
+from outbound import LIVE_TYPES, encode_frame
+from wire import BinaryEncoder, FrameCompressor, FrameDecoder
+
+
+class _SimMessage(dict):
+    """
+    Mensagem entregue pela rede, compartilhada (sem cópia) pelos nós que a
+    recebem e repassam. 'frames' guarda, por formato, o frame dela já
+    codificado: ela não é codificada de novo a cada salto.
+    """
+
+    __slots__ = ('frames',)
+
+
+class _SimPeer:
+    """Um sentido de uma conexão: formato negociado e contadores (os de PeerSender)"""
+
+    def __init__(self, connection, binary, compress):
+        self.connection = connection
+        self.encoding = (binary, compress)
+        # Maior chegada agendada no sentido e a da última mensagem de
+        # controle: nada passa à frente dela
+        self.last = 0.0
+        self.barrier = 0.0
+        self.lagging = False
+
+        self.frames_sent = 0
+        self.ops_sent = 0
+        self.bytes_sent = 0
+        self.bytes_raw = 0
+        self.dropped = 0
+        self.lags = 0
+
+    def pending(self):
+        return 0
+
+
+class SimTransport:
+    """Transporte do nó sobre a SimNetwork (mesma interface de transport.py)"""
+
+    def __init__(self, network, node):
+        self.network = network
+        self.node = node
+        self.senders = {}    # {node_id: _SimPeer} dos peers com hello recebido
+        self.received = {}   # Bytes recebidos por peer
+
+    def start(self):
+        network = self.network
+        for peer in self.node.peers:
+            network.connect(self.node.node_id, peer[0])
+
+    def stop(self):
+        self.network.disconnect_all(self.node.node_id)
+
+    def broadcast(self, outgoing):
+        for peer_id in list(self.senders):
+            self.network.transmit(self.node.node_id, peer_id, outgoing)
+
+    def send(self, peer_id, outgoing):
+        if peer_id in self.senders:
+            self.network.transmit(self.node.node_id, peer_id, outgoing)
+
+    def connected_peers(self):
+        return list(self.senders)
+
+
+class SimNetwork:
+    """
+    Fila de eventos em tempo virtual e conexões entre os nós.
+
+    Args:
+        seed (int): Semente dos sorteios (latência, falhas, gossip)
+        latency (tuple): Intervalo (s) da latência de cada mensagem
+        reorder (float): Probabilidade de uma operação ao vivo furar a
+            ordem da conexão
+        duplicate (float): Probabilidade de uma operação ao vivo chegar
+            duas vezes
+        loss (float): Probabilidade de uma mensagem se perder, derrubando
+            a conexão
+    """
+
+    def __init__(self, seed=0, latency=(0.001, 0.010), reorder=0.0, duplicate=0.0, loss=0.0):
+        self.rnd = random.Random(seed)
+        self.latency = latency
+        self.reorder = reorder
+        self.duplicate = duplicate
+        self.loss = loss
+        self.now = 0.0
+        self.events = []
+        self.count = 0
+        self.nodes = {}
+        self.connections = {}   # frozenset((a, b)) -> ID da conexão
+        self.groups = {}        # node_id -> grupo da partição atual
+        self._epochs = {}       # node_id -> inícios (invalida rodadas antigas)
+        # Codificação por formato (binário, comprimido): (encoder,
+        # compressor, decoder) em regime, compartilhados pelas conexões
+        self._codecs = {}
+        # Frames da última mensagem criada por um nó (broadcast: a mesma
+        # OutgoingMessage vai a todos os peers)
+        self._outgoing = None
+        self._outgoing_frames = None
+
+        self.messages = 0
+        self.bytes = 0
+        self.syncs = 0
+        self.lost = 0
+        self.duplicated = 0
+        self.reordered = 0
+        self.resets = 0
+
+    def transport(self, node):
+        """Fábrica para Node(transport=...): registra o nó na rede"""
+        self.nodes[node.node_id] = node
+        return SimTransport(self, node)
+
+    # ------------------------------------------------------------------
+    # Tempo virtual
+    # ------------------------------------------------------------------
+    def schedule(self, at, action, *args):
+        self.count += 1
+        heapq.heappush(self.events, (at, self.count, action, args))
+
+    def run_until(self, deadline):
+        events = self.events
+        while events and events[0][0] <= deadline:
+            self.now, _, action, args = heapq.heappop(events)
+            action(*args)
+        self.now = max(self.now, deadline)
+
+    # ------------------------------------------------------------------
+    # Nós
+    # ------------------------------------------------------------------
+    def start(self, node):
+        """Inicia o nó (no lugar de Node.start): conexões e rodadas periódicas"""
+        node_id = node.node_id
+        epoch = self._epochs[node_id] = self._epochs.get(node_id, 0) + 1
+        node.running = True
+        node._random.seed(self.rnd.random())
+        node.transport.start()
+        if node.reconnect_interval > 0:
+            self._every(node, epoch, node.reconnect_interval, node.transport.start)
+        if node.gc_interval > 0:
+            self._every(node, epoch, node.gc_interval, node._gc_round)
+        if node.fanout and node.anti_entropy_interval > 0:
+            self._every(node, epoch, node.anti_entropy_interval, node._anti_entropy)
+
+    def stop(self, node):
+        """Para o nó (queda): conexões caem, rodadas param; start() o retoma"""
+        node.running = False
+        self._epochs[node.node_id] = self._epochs.get(node.node_id, 0) + 1
+        node.transport.stop()
+
+    def _every(self, node, epoch, interval, action):
+        def tick():
+            if self._epochs.get(node.node_id) != epoch:
+                return
+            action()
+            self.schedule(self.now + interval, tick)
+        # Fase sorteada: os nós não agem todos no mesmo instante
+        self.schedule(self.now + self.rnd.uniform(0, interval), tick)
+
+    # ------------------------------------------------------------------
+    # Conexões
+    # ------------------------------------------------------------------
+    def partition(self, *groups):
+        """
+        Separa os nós em grupos (listas de IDs; os não citados formam um
+        grupo à parte): as conexões entre grupos caem e novas são recusadas
+        """
+        self.groups = {node_id: i for i, group in enumerate(groups) for node_id in group}
+        for key in list(self.connections):
+            a, b = key
+            if not self._reachable(a, b):
+                self.disconnect(a, b)
+
+    def heal(self):
+        """Desfaz a partição: os nós reconectam na próxima rodada"""
+        self.groups = {}
+
+    def _reachable(self, a, b):
+        return self.groups.get(a) == self.groups.get(b)
+
+    def connect(self, a, b):
+        """'a' abre uma conexão com 'b' (se ainda não há uma e 'b' está ativo e alcançável)"""
+        key = frozenset((a, b))
+        node, peer = self.nodes.get(a), self.nodes.get(b)
+        if (key in self.connections or peer is None or not node.running or not peer.running
+                or not self._reachable(a, b)):
+            return
+        self.count += 1
+        connection = self.connections[key] = self.count
+        # Cada lado envia o hello assim que a conexão abre
+        for source, target in ((node, peer), (peer, node)):
+            hello = json.loads(json.dumps(source._hello_message()))
+            self.schedule(self.now + self.rnd.uniform(*self.latency),
+                          self._hello, connection, target, source.node_id, hello)
+
+    def _hello(self, connection, node, peer_id, hello):
+        if self.connections.get(frozenset((node.node_id, peer_id))) != connection:
+            return
+        node.transport.senders[peer_id] = _SimPeer(
+            connection, node._accepts_binary(hello), node._accepts_compression(hello))
+        node._on_peer_hello(peer_id, hello)
+
+    def disconnect(self, a, b):
+        """Derruba a conexão entre 'a' e 'b': os dois lados veem a queda"""
+        connection = self.connections.pop(frozenset((a, b)), None)
+        if connection is not None:
+            self._closed(connection, a, b)
+
+    def _closed(self, connection, a, b):
+        for node_id, peer_id in ((a, b), (b, a)):
+            node = self.nodes[node_id]
+            sender = node.transport.senders.get(peer_id)
+            if sender is not None and sender.connection == connection:
+                del node.transport.senders[peer_id]
+                node._on_peer_lost(peer_id)
+
+    def disconnect_all(self, node_id):
+        for key in [key for key in self.connections if node_id in key]:
+            a, b = key
+            self.disconnect(a, b)
+
+    # ------------------------------------------------------------------
+    # Mensagens
+    # ------------------------------------------------------------------
+    def transmit(self, source, target, outgoing):
+        """Envia uma mensagem de 'source' a 'target' pela conexão entre eles"""
+        peer = self.nodes[source].transport.senders[target]
+        key = frozenset((source, target))
+        if self.connections.get(key) != peer.connection:
+            return   # Conexão caída, queda ainda não vista pelos nós
+        rnd = self.rnd
+        if self.loss and rnd.random() < self.loss:
+            # A queda é vista depois, como a do socket na thread do
+            # transporte (o nó pode estar no meio de uma aplicação)
+            self.lost += 1
+            self.resets += 1
+            del self.connections[key]
+            self.schedule(self.now, self._closed, peer.connection, source, target)
+            return
+
+        size, raw, received = self._frame(outgoing, peer.encoding)
+        peer.frames_sent += 1
+        peer.ops_sent += 1
+        peer.bytes_sent += size
+        peer.bytes_raw += raw
+        self.messages += 1
+        self.bytes += size
+        message = outgoing.message
+        kind = message.get('type')
+        if kind == 'sync' and message.get('part') == 0:
+            self.syncs += 1
+
+        arrival = self.now + rnd.uniform(*self.latency)
+        if kind in LIVE_TYPES:
+            if self.reorder and rnd.random() < self.reorder:
+                self.reordered += 1
+                arrival = max(arrival, peer.barrier)
+            else:
+                arrival = max(arrival, peer.last)
+        else:
+            arrival = max(arrival, peer.last)
+            peer.barrier = arrival
+        peer.last = max(peer.last, arrival)
+        self.schedule(arrival, self._receive, peer.connection, target, source, received, size)
+        if kind in LIVE_TYPES and self.duplicate and rnd.random() < self.duplicate:
+            self.duplicated += 1
+            self.schedule(arrival + rnd.uniform(*self.latency), self._receive,
+                          peer.connection, target, source, received, 0)
+
+    def _frame(self, outgoing, encoding):
+        """
+        (bytes enviados, bytes antes da compressão, mensagem decodificada)
+        de 'outgoing' no formato (binário, comprimido), calculados na
+        primeira vez que a mensagem sai nesse formato
+        """
+        message = outgoing.message
+        if isinstance(message, _SimMessage):
+            frames = message.frames
+        elif outgoing is self._outgoing:
+            frames = self._outgoing_frames
+        else:
+            frames = {}
+            self._outgoing, self._outgoing_frames = outgoing, frames
+        cached = frames.get(encoding)
+        if cached is not None:
+            return cached
+        codec = self._codecs.get(encoding)
+        if codec is None:
+            binary, compress = encoding
+            codec = self._codecs[encoding] = (BinaryEncoder() if binary else None,
+                                              FrameCompressor() if compress else None,
+                                              FrameDecoder())
+        encoder, compressor, decoder = codec
+        frame = encode_frame([outgoing], encoder)
+        raw = len(frame)
+        if compressor is not None:
+            frame = compressor.compress(frame)
+        received = _SimMessage(decoder.feed(frame)[0])
+        received.frames = frames
+        cached = frames[encoding] = (len(frame), raw, received)
+        return cached
+
+    def _receive(self, connection, target, source, msg, size):
+        # O que estava em trânsito numa conexão que caiu se perde com ela
+        if self.connections.get(frozenset((target, source))) != connection:
+            return
+        transport = self.nodes[target].transport
+        transport.received[source] = transport.received.get(source, 0) + size
+        self.nodes[target]._process_message(msg)
@@ -0,0 +1,355 @@
+"""
+snapshot.py - Formato de snapshot/delta do documento
+
+Um snapshot (estado completo) e um delta (só o que falta a outra réplica)
+usam o mesmo fluxo de bytes:
+
+    'RGAS' varint(tam) cabeçalho-JSON
+    varint(tam) registro
+    ...
+    varint(0)                         -> fim do fluxo
+
+O cabeçalho traz o id_mode, a versão da réplica que gerou o fluxo (por site,
+o maior seq aplicado), o relógio vetorial/Lamport dela e, por site, o
+contador da última operação entregue (ver CausalBuffer). Cada registro é
+um bloco (Character, na ordem do documento, com origin e dot da deleção)
+ou um DeleteRun (deleção de caracteres que o destino já tem). Como os
+registros são prefixados pelo tamanho, o fluxo pode ser cortado em
+pedaços arbitrários e lido incrementalmente (SnapshotReader.feed), ou lido
+de uma vez direto de um arquivo mapeado em memória (SnapshotReader.read).
+
+O mesmo fluxo serve ao sync entre nós, aos checkpoints do log em disco e à
+exportação de um documento (Node.export): encode_stream gera os pedaços
+enquanto percorre o documento e write_stream os grava num arquivo ou
+socket, e SnapshotReader.stream lê de um deles registro a registro, então
+a memória usada não depende do tamanho do documento. dump_snapshot.py
+mostra o conteúdo de um fluxo gravado.
+
+Dentro dos registros, IDs de site são internados (o texto só na primeira
+ocorrência), inteiros são varints e, no modo vetorial, o relógio de cada
+bloco é codificado como diferença em relação ao bloco anterior.
+"""
+import json
+from character import Character
+from wire import read_varint, write_varint
+
+MAGIC = b'RGAS'
+
+# Flags do registro
+F_DELETED = 1
+F_DELETE_DOT = 2
+F_ORIGIN = 4
+F_DELETE_RUN = 8
+
+
+class DeleteRun:
+    """Deleção dos caracteres [seq, seq + length) do site, feita pela operação 'dot'"""
+
+    __slots__ = ('site', 'seq', 'length', 'dot')
+
+    def __init__(self, site, seq, length, dot=True):
+        self.site = site
+        self.seq = seq
+        self.length = length
+        self.dot = dot
+
+    def __repr__(self):
+        return f"DeleteRun({self.site!r}, {self.seq}, {self.length}, {self.dot!r})"
+
+
+class SnapshotWriter:
+    """
+    Codifica registros num fluxo de snapshot. Os bytes se acumulam em
+    memória até serem retirados com take(), o que permite enviar/gravar em
+    pedaços (ver encode_stream).
+    """
+
+    def __init__(self, id_mode, version, clock=None, lamport=0, delivered=None):
+        self.id_mode = id_mode
+        self.buffer = bytearray(MAGIC)
+        self.strings = {}
+        self._clock = ()        # Relógio do bloco anterior (modo vetorial)
+        self._clock_map = {}
+        header = json.dumps({
+            'id_mode': id_mode,
+            'version': dict(version),
+            'clock': dict(clock or {}),
+            'lamport': lamport,
+            'delivered': dict(delivered or {}),
+        }).encode('utf-8')
+        write_varint(self.buffer, len(header))
+        self.buffer += header
+        self._body = bytearray()
+
+    def take(self):
+        """Retorna (e descarta) os bytes acumulados"""
+        data = bytes(self.buffer)
+        self.buffer = bytearray()
+        return data
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def write(self, record):
+        """Codifica um Character ou DeleteRun"""
+        body = self._body
+        body.clear()
+        if isinstance(record, DeleteRun):
+            flags = F_DELETE_RUN | F_DELETED
+            dot = record.dot
+            if dot is not True:
+                flags |= F_DELETE_DOT
+            body.append(flags)
+            self._str(body, record.site)
+            write_varint(body, record.seq)
+            write_varint(body, record.length)
+        else:
+            dot = record.deleted
+            flags = 0
+            if dot:
+                flags |= F_DELETED
+                if dot is not True:
+                    flags |= F_DELETE_DOT
+            if record.origin is not None:
+                flags |= F_ORIGIN
+            body.append(flags)
+            self._str(body, record.site)
+            write_varint(body, record.seq)
+            data = record.value.encode('utf-8')
+            write_varint(body, len(data))
+            body += data
+            if record.clock is not None:
+                self._write_clock(body, record.clock)
+            if flags & F_ORIGIN:
+                self._str(body, record.origin[0])
+                write_varint(body, record.origin[1])
+        if flags & F_DELETE_DOT:
+            self._str(body, dot[0])
+            write_varint(body, dot[1])
+        write_varint(self.buffer, len(body))
+        self.buffer += body
+
+    def end(self):
+        """Marca o fim do fluxo"""
+        self.buffer.append(0)
+
+    # ------------------------------------------------------------------
+    def _str(self, out, text):
+        index = self.strings.get(text)
+        if index is not None:
+            write_varint(out, index << 1)
+            return
+        self.strings[text] = len(self.strings)
+        data = text.encode('utf-8')
+        write_varint(out, (len(data) << 1) | 1)
+        out += data
+
+    def _write_clock(self, out, clock):
+        """Relógio como diferença do anterior: entradas alteradas e removidas"""
+        if clock is self._clock:
+            out.append(0)
+            out.append(0)
+            return
+        previous = self._clock_map
+        current = dict(clock)
+        changed = [(k, v) for k, v in clock if previous.get(k) != v]
+        removed = [k for k in previous if k not in current]
+        write_varint(out, len(changed))
+        for site, counter in changed:
+            self._str(out, site)
+            write_varint(out, counter)
+        write_varint(out, len(removed))
+        for site in removed:
+            self._str(out, site)
+        self._clock = clock
+        self._clock_map = current
+
+
+def encode_stream(writer, records, chunk_size=65536):
+    """Gera o fluxo completo (cabeçalho, registros e fim) em pedaços de ~chunk_size bytes"""
+    for record in records:
+        writer.write(record)
+        if len(writer) >= chunk_size:
+            yield writer.take()
+    writer.end()
+    yield writer.take()
+
+
+def write_stream(out, chunks):
+    """
+    Grava os pedaços de um fluxo, um por vez, num arquivo (write) ou socket
+    (sendall). Retorna o total de bytes.
+    """
+    send = getattr(out, 'sendall', None) or out.write
+    size = 0
+    for chunk in chunks:
+        send(chunk)
+        size += len(chunk)
+    return size
+
+
+class SnapshotReader:
+    """
+    Decodificador incremental de um fluxo de snapshot/delta.
+    feed(bytes) retorna os registros completos; 'header' fica disponível
+    assim que o cabeçalho chega e 'done' indica que o fim foi lido.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.header = None
+        self.done = False
+        self.strings = []
+        self._clock = ()
+        self._clock_map = {}
+
+    @property
+    def id_mode(self):
+        return self.header['id_mode']
+
+    @property
+    def version(self):
+        return self.header['version']
+
+    def feed(self, data):
+        buf = self.buffer
+        buf += data
+        view = memoryview(buf)
+        try:
+            records, pos = self._parse(view, len(buf))
+        finally:
+            view.release()
+        if pos:
+            del buf[:pos]
+        return records
+
+    def stream(self, source, chunk_size=65536):
+        """
+        Gera os registros de um fluxo lido aos pedaços de um arquivo (read)
+        ou socket (recv), até o fim do fluxo; 'header' já está disponível
+        quando o primeiro registro é gerado. Bytes lidos além do fim ficam
+        em 'buffer'.
+        """
+        receive = getattr(source, 'recv', None) or source.read
+        while not self.done:
+            data = receive(chunk_size)
+            if not data:
+                raise ValueError("Fluxo de snapshot incompleto")
+            yield from self.feed(data)
+
+    def read(self, data):
+        """
+        Decodifica um fluxo completo que já está em memória (bytes ou mmap)
+        direto do buffer recebido, sem copiá-lo. Retorna os registros.
+        """
+        view = memoryview(data)
+        try:
+            records, _ = self._parse(view, len(view))
+        finally:
+            view.release()
+        if not self.done:
+            raise ValueError("Fluxo de snapshot incompleto")
+        return records
+
+    def _parse(self, view, size):
+        """Registros completos em view[:size] e a posição até onde foi lido"""
+        records = []
+        pos = 0
+        if self.header is None:
+            if size < len(MAGIC) + 1:
+                return records, pos
+            if bytes(view[:len(MAGIC)]) != MAGIC:
+                raise ValueError("Fluxo de snapshot inválido")
+            try:
+                length, start = read_varint(view, len(MAGIC))
+            except IndexError:
+                return records, pos
+            if start + length > size:
+                return records, pos
+            self.header = json.loads(str(view[start:start + length], 'utf-8'))
+            pos = start + length
+        while pos < size and not self.done:
+            try:
+                length, start = read_varint(view, pos)
+            except IndexError:
+                break
+            if length == 0:
+                self.done = True
+                pos = start
+                break
+            end = start + length
+            if end > size:
+                break
+            records.append(self._record(view, start))
+            pos = end
+        return records, pos
+
+    # ------------------------------------------------------------------
+    def _str(self, view, pos):
+        ref = view[pos]
+        if ref < 0x80:
+            pos += 1
+        else:
+            ref, pos = read_varint(view, pos)
+        if not ref & 1:
+            return self.strings[ref >> 1], pos
+        length = ref >> 1
+        text = str(view[pos:pos + length], 'utf-8')
+        self.strings.append(text)
+        return text, pos + length
+
+    def _read_clock(self, view, pos):
+        changed, pos = read_varint(view, pos)
+        updates = []
+        for _ in range(changed):
+            site, pos = self._str(view, pos)
+            counter, pos = read_varint(view, pos)
+            updates.append((site, counter))
+        removed, pos = read_varint(view, pos)
+        if not changed and not removed:
+            return self._clock, pos
+        current = self._clock_map = dict(self._clock_map)
+        for _ in range(removed):
+            site, pos = self._str(view, pos)
+            del current[site]
+        current.update(updates)
+        self._clock = tuple(sorted(current.items()))
+        return self._clock, pos
+
+    def _record(self, view, pos):
+        flags = view[pos]
+        pos += 1
+        site, pos = self._str(view, pos)
+        seq, pos = read_varint(view, pos)
+        if flags & F_DELETE_RUN:
+            length, pos = read_varint(view, pos)
+            record = DeleteRun(site, seq, length)
+        else:
+            # Caso comum: texto curto (tamanho num único byte)
+            length = view[pos]
+            if length < 0x80:
+                pos += 1
+            else:
+                length, pos = read_varint(view, pos)
+            value = str(view[pos:pos + length], 'utf-8')
+            pos += length
+            if self.header['id_mode'] == 'lamport':
+                record = Character(value, (seq, site))
+            else:
+                clock, pos = self._read_clock(view, pos)
+                record = Character(value, (clock, site))
+            if flags & F_ORIGIN:
+                origin_site, pos = self._str(view, pos)
+                origin_seq, pos = read_varint(view, pos)
+                record.origin = (origin_site, origin_seq)
+        if flags & F_DELETED:
+            dot = True
+            if flags & F_DELETE_DOT:
+                dot_site, pos = self._str(view, pos)
+                dot_seq, pos = read_varint(view, pos)
+                dot = (dot_site, dot_seq)
+            if isinstance(record, DeleteRun):
+                record.dot = dot
+            else:
+                record.deleted = dot
+        return record
@@ -0,0 +1,241 @@
+"""
+text_view.py - Texto visível materializado do documento
+
+O CRDTDocument avisa cada mudança do texto visível como um delta
+(índice, removidos, inseridos): a partir de 'índice', 'removidos'
+caracteres saem e o texto 'inseridos' entra. A view guarda o texto já
+montado e aplica os deltas só quando alguém lê, então leituras seguidas
+sem mudanças custam O(1) e não varrem os blocos (nem os tombstones).
+
+Os deltas pendentes são aplicados juntos, numa única passada (ver
+apply_deltas): uma leitura custa uma cópia do texto, não uma por delta.
+O texto fica guardado em pedaços de até ~CHUNK caracteres, e a passada
+só recopia os pedaços que algum delta tocou.
+
+O estado publicado para as leituras sem lock leva um TextHandle (pedaços
+e deltas até ali), montado em O(1) por quem escreve; o texto só é
+materializado na primeira leitura, por quem lê e fora do lock. A cada
+MAX_PENDING deltas a view aproveita os pedaços que uma leitura já montou
+ou, sem leituras, aplica os deltas ela mesma: quem escreve nunca copia o
+texto inteiro por causa de uma operação.
+"""
+
+# Tamanho (caracteres) dos pedaços em que o texto é guardado
+CHUNK = 65536
+# Abaixo deste tamanho, copiar o texto a cada delta (em C) sai mais barato
+# que cortar pedaços em Python
+SMALL_TEXT = 16384
+
+
+class TextView:
+    """Cache do texto visível, atualizado incrementalmente pelos deltas"""
+
+    # Deltas pendentes a partir dos quais os pedaços são atualizados
+    MAX_PENDING = 64
+
+    def __init__(self):
+        self._chunks = ()
+        # Só recebe append: os handles guardam a lista e quantos deltas
+        # dela valem para eles, então ela é trocada por uma nova, nunca
+        # esvaziada
+        self._pending = []
+        self._text = ''       # Texto inteiro, se já montado (None: não)
+        self._stale = False   # True: o texto precisa ser remontado
+        self._handle = None   # Último TextHandle entregue
+
+    @property
+    def fresh(self):
+        """True se a leitura não precisa remontar o texto"""
+        return not self._stale
+
+    def change(self, index, deleted, inserted):
+        """Registra um delta do texto visível"""
+        if self._stale:
+            return
+        self._text = None
+        pending = self._pending
+        pending.append((index, deleted, inserted))
+        if len(pending) > self.MAX_PENDING:
+            self._adopt()
+            if len(self._pending) > self.MAX_PENDING:
+                self._compact()
+
+    def invalidate(self):
+        """Descarta o texto: a próxima leitura o remonta"""
+        self._stale = True
+        self._chunks = ()
+        self._pending = []
+        self._text = None
+        self._handle = None
+
+    def text(self, rebuild):
+        """Texto visível atual; 'rebuild()' monta o texto do zero se necessário"""
+        if self._stale:
+            text = rebuild()
+            self._chunks = _rechunk([(text, 0, len(text))])
+            self._text = text
+            self._stale = False
+        elif self._text is None:
+            self._adopt()
+            if self._pending:
+                self._compact()
+            if self._text is None:
+                self._text = ''.join(self._chunks)
+        return self._text
+
+    def handle(self, rebuild):
+        """
+        TextHandle do texto atual, para leituras fora do lock. O(1), salvo
+        se o texto precisar ser remontado (depois de invalidate).
+        """
+        if self._stale:
+            self.text(rebuild)
+        handle = self._handle
+        count = len(self._pending)
+        if handle is None or handle.base is not self._chunks or handle.count != count:
+            handle = self._handle = TextHandle(self._chunks, self._pending, count,
+                                               self._text)
+        return handle
+
+    def _adopt(self):
+        """Passa a usar como base os pedaços que uma leitura já montou do último handle"""
+        handle = self._handle
+        if handle is None or handle.base is not self._chunks or handle.chunks is None:
+            return
+        self._chunks = handle.chunks
+        self._pending = self._pending[handle.count:]
+        if not self._pending and handle.materialized is not None:
+            self._text = handle.materialized
+
+    def _compact(self):
+        self._chunks = apply_deltas(self._chunks, self._pending)
+        self._pending = []
+
+
+def apply_deltas(chunks, deltas):
+    """
+    Aplica os deltas, em ordem, ao texto em pedaços 'chunks' numa única
+    passada: cada delta só corta e troca trechos (dos pedaços e dos
+    inseridos, como (texto, início, fim), sem copiar nada), e os pedaços
+    novos são montados no fim. Os que nenhum delta tocou são reaproveitados
+    sem cópia. O(pedaços + deltas * trechos + tamanho dos pedaços tocados).
+    """
+    if not deltas:
+        return chunks
+    if len(chunks) <= 1 and (not chunks or len(chunks[0]) < SMALL_TEXT):
+        text = chunks[0] if chunks else ''
+        for index, deleted, inserted in deltas:
+            text = text[:index] + inserted + text[index + deleted:]
+        return _rechunk([(text, 0, len(text))]) if text else ()
+    pieces = [(chunk, 0, len(chunk)) for chunk in chunks]
+    for index, deleted, inserted in deltas:
+        first = _split(pieces, index)
+        last = _split(pieces, index + deleted) if deleted else first
+        pieces[first:last] = [(inserted, 0, len(inserted))] if inserted else []
+    return _rechunk(pieces)
+
+
+def _split(pieces, index):
+    """Corta os trechos na posição 'index'; retorna quantos ficam antes dela"""
+    pos = 0
+    for i, (source, start, end) in enumerate(pieces):
+        if pos == index:
+            return i
+        size = end - start
+        if index < pos + size:
+            cut = start + index - pos
+            pieces[i:i + 1] = [(source, start, cut), (source, cut, end)]
+            return i + 1
+        pos += size
+    return len(pieces)
+
+
+def _rechunk(pieces):
+    """
+    Pedaços do texto formado pelos trechos: um pedaço inteiro de tamanho
+    razoável é mantido como está; os trechos menores são juntados aos
+    vizinhos até ~CHUNK, e um texto grande (remontagem, colagem) é cortado
+    """
+    chunks = []
+    group = []
+    size = 0
+    for source, start, end in pieces:
+        length = end - start
+        if not group and start == 0 and end == len(source) and CHUNK // 2 <= length <= 2 * CHUNK:
+            chunks.append(source)
+            continue
+        if length > 2 * CHUNK:
+            for cut in range(start, end - CHUNK, CHUNK):
+                group.append(source[cut:cut + CHUNK])
+                chunks.append(''.join(group))
+                group = []
+                size = 0
+            start = cut + CHUNK
+            length = end - start
+        group.append(source[start:end])
+        size += length
+        if size >= CHUNK:
+            chunks.append(''.join(group))
+            group = []
+            size = 0
+    if group:
+        chunks.append(''.join(group))
+    return tuple(chunks)
+
+
+class TextHandle:
+    """
+    Texto visível num instante: os pedaços 'base' e os primeiros 'count'
+    deltas de 'pending'. Imutável para quem lê (a view só acrescenta
+    deltas depois deles); o texto é montado na primeira leitura e guardado.
+    """
+
+    __slots__ = ('base', 'pending', 'count', 'chunks', 'materialized')
+
+    def __init__(self, base, pending, count, text=None):
+        self.base = base
+        self.pending = pending
+        self.count = count
+        self.chunks = None if count else base
+        self.materialized = text
+
+    @property
+    def text(self):
+        text = self.materialized
+        if text is None:
+            # Leituras concorrentes podem montar o mesmo texto duas vezes;
+            # qualquer uma das atribuições serve
+            chunks = self.chunks
+            if chunks is None:
+                chunks = apply_deltas(self.base, self.pending[:self.count])
+            text = ''.join(chunks)
+            self.chunks = chunks
+            self.materialized = text
+        return text
+
+
+class ReadSnapshot:
+    """
+    Estado do nó publicado para leitura sem lock. Imutável: quem escreve
+    monta um novo a cada lote de operações aplicadas e troca a referência
+    (atribuição atômica), então quem lê sempre vê um estado consistente,
+    ainda que possivelmente um lote atrasado.
+    """
+
+    __slots__ = ('seq', '_text', 'clock', 'lamport', 'applied', 'buffered')
+
+    def __init__(self, seq, text, clock, lamport, applied, buffered):
+        self.seq = seq              # Número da publicação (cresce a cada lote)
+        self._text = text           # Texto visível (TextHandle, montado ao ler)
+        self.clock = clock          # Relógio vetorial (FrozenClock, lido como dict)
+        self.lamport = lamport
+        self.applied = applied      # Versão do documento (idem, ver Node.applied)
+        self.buffered = buffered    # Operações aguardando no buffer causal
+
+    @property
+    def text(self):
+        """Texto visível (montado na primeira leitura, fora do lock de quem escreve)"""
+        return self._text.text
+
+    def __repr__(self):
+        return f"ReadSnapshot(seq={self.seq}, {len(self.text)} caracteres)"
@@ -0,0 +1,233 @@
+"""
+transport.py - Camada de rede do nó (modo com threads)
+
+O Node cuida do CRDT e do relógio; o transporte cuida de aceitar/abrir
+conexões, ler frames e entregar mensagens ao nó. Todo transporte oferece:
+- start() / stop()
+- broadcast(outgoing): envia uma OutgoingMessage a todos os peers
+- send(peer_id, outgoing): envia a um único peer (mesma fila do broadcast)
+- connected_peers(): IDs dos peers com conexão registrada
+- senders: {peer_id: fila de saída} com pending() e os contadores de
+  PeerSender (lidos por Node.stats e Node.leave)
+- received: {peer_id: bytes recebidos}
+e chama de volta no nó:
+- node._hello_message(): conteúdo do handshake (sempre uma linha JSON)
+- node._accepts_binary(hello): se o peer recebe frames binários
+- node._accepts_compression(hello): se o peer recebe frames comprimidos
+- node._on_peer_hello(peer_id, msg): peer identificado
+- node._on_peer_lost(peer_id): a conexão ativa com o peer caiu
+- node._on_peer_drained(peer_id): o peer saiu do fluxo ao vivo (fila
+  acima de node.high_water) e a fila dele esvaziou (ver outbound.py)
+- node._process_message(msg): operação recebida
+Peers sem conexão são procurados de novo a cada node.reconnect_interval.
+Além deste, há o AsyncioTransport (async_transport.py) e, para testes e
+benchmarks em tempo virtual, o SimTransport (sim_transport.py).
+"""
+import json
+import socket
+import threading
+import time
+from outbound import PeerSender
+from wire import FrameDecoder
+
+
+def encode_line(message):
+    """Serializa uma mensagem como linha JSON"""
+    return (json.dumps(message) + '\n').encode('utf-8')
+
+
+class ThreadedTransport:
+    """
+    Transporte TCP com uma thread por conexão (aceite, leitura) e uma
+    thread de envio por peer (PeerSender).
+    """
+
+    def __init__(self, node):
+        self.node = node
+        self.connections = {}  # {node_id: socket}
+        # Filas de saída (uma thread de envio por peer)
+        self.senders = {}      # {node_id: PeerSender}
+        self.server_socket = None
+        self.lock = threading.Lock()
+        # Peers cuja última tentativa de conexão falhou (evita repetir o log)
+        self._unreachable = set()
+        # Bytes recebidos por peer (os enviados ficam em cada PeerSender)
+        self.received = {}
+
+    def start(self):
+        # Inicia servidor TCP
+        server_thread = threading.Thread(target=self._start_server, daemon=True)
+        server_thread.start()
+
+        # Aguarda um pouco antes de conectar aos peers
+        threading.Thread(target=self._connect_loop, daemon=True).start()
+
+    def _start_server(self):
+        """Thread que escuta por conexões de outros nós"""
+        node = self.node
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind((node.host, node.port))
+        self.server_socket.listen(5)
+
+        print(f"[Node {node.node_id}] Servidor escutando em {node.host}:{node.port}")
+
+        while node.running:
+            try:
+                conn, addr = self.server_socket.accept()
+                self._send_handshake(conn)
+                thread = threading.Thread(target=self._handle_connection, args=(conn, None), daemon=True)
+                thread.start()
+            except:
+                break
+
+    def _connect_loop(self):
+        """Conecta aos peers e, periodicamente, reconecta aos que caíram"""
+        node = self.node
+        time.sleep(2.0)
+        while node.running:
+            self._connect_to_peers()
+            if not node.reconnect_interval:
+                break
+            time.sleep(node.reconnect_interval)
+
+    def _connect_to_peers(self):
+        """Conecta-se aos peers conhecidos que estão sem conexão"""
+        node = self.node
+        for peer_id, peer_host, peer_port in node.peers:
+            if peer_id in self.senders or not node.running:
+                continue
+            sock = None
+            try:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                sock.connect((peer_host, peer_port))
+
+                print(f"[Node {node.node_id}] Conectado ao peer {peer_id}")
+                self._unreachable.discard(peer_id)
+
+                self._send_handshake(sock)
+                self._register_connection(peer_id, sock)
+
+                # Thread para receber mensagens deste peer
+                thread = threading.Thread(target=self._handle_connection, args=(sock, peer_id), daemon=True)
+                thread.start()
+            except Exception as e:
+                # Sem socket se a própria criação falhou
+                if sock is not None:
+                    sock.close()
+                if peer_id not in self._unreachable:
+                    self._unreachable.add(peer_id)
+                    print(f"[Node {node.node_id}] Erro ao conectar com {peer_id}: {e}")
+
+    def _handle_connection(self, conn, peer_id=None):
+        """Thread que recebe mensagens de uma conexão"""
+        node = self.node
+        decoder = FrameDecoder()
+        remote_id = peer_id
+        while node.running:
+            try:
+                chunk = conn.recv(65536)
+                if not chunk:
+                    break
+
+                metrics = node.metrics
+                if metrics is None:
+                    messages = decoder.feed(chunk)
+                else:
+                    start = time.perf_counter()
+                    messages = decoder.feed(chunk)
+                    metrics.observe('decode_us', (time.perf_counter() - start) * 1e6)
+                    metrics.count('messages_in', len(messages))
+                for msg in messages:
+                    if msg.get('type') == 'hello':
+                        remote_id = msg.get('node_id')
+                        if remote_id:
+                            self._register_connection(remote_id, conn, node._accepts_binary(msg),
+                                                      node._accepts_compression(msg))
+                            node._on_peer_hello(remote_id, msg)
+                        continue
+
+                    node._process_message(msg)
+                if remote_id:
+                    self.received[remote_id] = self.received.get(remote_id, 0) + len(chunk)
+            except Exception as e:
+                print(f"[Node {node.node_id}] Erro na conexão: {e}")
+                break
+
+        conn.close()
+        lost = False
+        if remote_id:
+            with self.lock:
+                if self.connections.get(remote_id) is conn:
+                    del self.connections[remote_id]
+                    sender = self.senders.pop(remote_id, None)
+                    if sender is not None:
+                        sender.close()
+                    lost = True
+        if lost:
+            node._on_peer_lost(remote_id)
+
+    def _register_connection(self, peer_id, conn, binary=False, compress=False):
+        """
+        Garante que o socket esteja registrado para broadcasts.
+        'binary' e 'compress' indicam que o hello recebido nesta conexão
+        aceita frames binários e comprimidos; até lá o peer recebe linhas
+        JSON sem compressão.
+        """
+        node = self.node
+        with self.lock:
+            self.connections[peer_id] = conn
+            sender = self.senders.get(peer_id)
+            if sender is None:
+                sender = self.senders[peer_id] = PeerSender(
+                    peer_id, conn, node.flush_interval, node.max_batch,
+                    on_error=self._on_send_error, high_water=node.high_water,
+                    on_drained=node._on_peer_drained
+                )
+            # Nova conexão com o mesmo peer: a fila pendente é mantida
+            sender.retarget(conn, binary, compress)
+
+    def _on_send_error(self, peer_id, error):
+        print(f"[Node {self.node.node_id}] Erro enviando para {peer_id}: {error}")
+
+    def _send_handshake(self, conn):
+        """Envia mensagem de identificação do nó"""
+        try:
+            conn.sendall(encode_line(self.node._hello_message()))
+        except Exception as e:
+            print(f"[Node {self.node.node_id}] Erro enviando handshake: {e}")
+
+    def broadcast(self, outgoing):
+        """Enfileira a mensagem na fila de cada peer conectado"""
+        for sender in list(self.senders.values()):
+            sender.enqueue(outgoing)
+
+    def send(self, peer_id, outgoing):
+        """Enfileira a mensagem na fila de um único peer"""
+        sender = self.senders.get(peer_id)
+        if sender is not None:
+            sender.enqueue(outgoing)
+
+    def connected_peers(self):
+        return list(self.senders)
+
+    def stop(self):
+        for sender in list(self.senders.values()):
+            sender.close()
+
+        for conn in list(self.connections.values()):
+            try:
+                conn.close()
+            except:
+                pass
+
+        if self.server_socket:
+            try:
+                # Libera a porta mesmo com a thread ainda bloqueada no accept()
+                self.server_socket.shutdown(socket.SHUT_RDWR)
+            except:
+                pass
+            try:
+                self.server_socket.close()
+            except:
+                pass
@@ -1,43 +1,264 @@
 """
 vector_clock.py - Implementação de Relógio Vetorial
+
+Os contadores ficam numa lista densa, indexada pelo número de cada site na
+SiteTable do documento (compartilhada pelos relógios dele). Um site que
+saiu do cluster é aposentado: o seu contador final passa para um pequeno
+dict e a posição na lista fica livre (as listas são compactadas quando
+sobram muitas livres). Copiar, mesclar e comparar relógios custa então
+proporcional aos membros atuais, não a todos os nós que já passaram pelo
+cluster.
+
+Nas operações o relógio vai como delta (ver VectorClock.delta): só as
+entradas que mudaram desde a operação anterior do mesmo site. Nos
+position_ids (modo vetorial) os aposentados viram uma única entrada,
+FLOOR, com a soma dos contadores deles (ver VectorClock.id_clock).
 """
+from collections.abc import Mapping
+
+# Site reservado dos position_ids: soma dos contadores dos sites aposentados
+FLOOR = ''
+
+
+class SiteTable:
+    """
+    Numeração dos sites de um documento: site -> posição nas listas de
+    contadores dos relógios que usam a tabela.
+    """
+
+    def __init__(self):
+        self.sites = []         # Número -> site (None = posição livre)
+        self.numbers = {}       # Site -> número
+        self.retired = set()    # Sites aposentados (não voltam a ser numerados)
+        self.clocks = []        # Relógios que usam a tabela
+        self.free = 0
+
+    def number(self, site):
+        """Número do site, atribuído no primeiro uso"""
+        n = self.numbers.get(site)
+        if n is None:
+            n = len(self.sites)
+            self.sites.append(site)
+            self.numbers[site] = n
+        return n
+
+    def retire(self, site):
+        """
+        Aposenta o site em todos os relógios da tabela. Retorna False se
+        ele já estava aposentado.
+        """
+        if site in self.retired:
+            return False
+        self.retired.add(site)
+        n = self.numbers.get(site)
+        for clock in self.clocks:
+            clock._retire(site, n)
+        if n is not None:
+            # Cópias novas: relógios congelados (frozen) seguem com as antigas
+            numbers = dict(self.numbers)
+            del numbers[site]
+            sites = list(self.sites)
+            sites[n] = None
+            self.numbers, self.sites = numbers, sites
+            self.free += 1
+            if self.free * 2 > len(sites):
+                self._compact()
+        return True
+
+    def _compact(self):
+        """Renumera os sites ativos, removendo as posições livres"""
+        live = [n for n, site in enumerate(self.sites) if site is not None]
+        self.sites = [self.sites[n] for n in live]
+        self.numbers = {site: i for i, site in enumerate(self.sites)}
+        self.free = 0
+        for clock in self.clocks:
+            counters = clock.counters
+            size = len(counters)
+            clock.counters = [counters[n] if n < size else 0 for n in live]
+
 
 class VectorClock:
     """
     Relógio vetorial para rastreamento causal de eventos.
     Mantém um contador para cada nó no sistema.
     """
-    
-    def __init__(self, node_id, known_nodes):
+
+    def __init__(self, node_id, known_nodes, sites=None):
         """
         Args:
             node_id (str): ID do nó local
             known_nodes (list): Lista de IDs de todos os nós conhecidos
+            sites (SiteTable): Numeração compartilhada com os outros
+                relógios do documento; None = uma só deste relógio
         """
         self.node_id = node_id
-        self.clock = {node: 0 for node in known_nodes}
-    
-    def increment(self):
-        """Incrementa o contador do nó local antes de uma operação"""
-        self.clock[self.node_id] += 1
-    
-    def update(self, received_clock):
+        self.sites = sites if sites is not None else SiteTable()
+        self.sites.clocks.append(self)
+        self.counters = []
+        # Contadores finais dos sites aposentados (substituído, nunca
+        # alterado: relógios congelados guardam a referência) e a soma deles
+        self.retired = {}
+        self.floor = 0
+        # Sites alterados desde o último delta(); None = todos (o primeiro
+        # delta leva o relógio inteiro)
+        self._changed = None
+        for node in known_nodes:
+            self._index(node)
+        # Contador de Lamport (escalar), usado nos IDs compactos (dots).
+        # O vetor continua sendo a referência para causalidade.
+        self.lamport = 0
+
+    def _index(self, site):
+        n = self.sites.number(site)
+        counters = self.counters
+        if n >= len(counters):
+            counters.extend([0] * (n + 1 - len(counters)))
+        return n
+
+    def increment(self, count=1):
+        """
+        Incrementa o contador do nó local antes de uma operação.
+        Uma inserção de bloco com N caracteres consome N contadores.
+        """
+        self.counters[self._index(self.node_id)] += count
+        self.lamport += count
+        if self._changed is not None:
+            self._changed.add(self.node_id)
+
+    def get(self, site, default=0):
+        """Contador do site (ativo ou aposentado)"""
+        n = self.sites.numbers.get(site)
+        if n is not None:
+            counters = self.counters
+            return counters[n] if n < len(counters) else 0
+        return self.retired.get(site, default)
+
+    def update(self, received_clock, received_lamport=None):
         """
         Atualiza o relógio ao receber uma mensagem.
         Pega o máximo entre o clock local e o recebido para cada entrada.
-        
+
         Args:
-            received_clock (dict): Relógio vetorial recebido
-        """
-        for node_id, timestamp in received_clock.items():
-            if node_id in self.clock:
-                self.clock[node_id] = max(self.clock[node_id], timestamp)
-            else:
-                self.clock[node_id] = timestamp
-    
+            received_clock (dict): Relógio vetorial recebido (ou um delta)
+            received_lamport (int): Contador de Lamport recebido (opcional)
+        """
+        table = self.sites
+        counters = self.counters
+        changed = self._changed
+        for site, timestamp in received_clock.items():
+            n = table.numbers.get(site)
+            if n is None:
+                if site in table.retired:
+                    # Operação atrasada de um site que já saiu
+                    previous = self.retired.get(site, 0)
+                    if timestamp > previous:
+                        self.retired = {**self.retired, site: timestamp}
+                        self.floor += timestamp - previous
+                        if changed is not None:
+                            changed.add(site)
+                    continue
+                n = self._index(site)
+            elif n >= len(counters):
+                self._index(site)
+            if timestamp > counters[n]:
+                counters[n] = timestamp
+                if changed is not None:
+                    changed.add(site)
+        if received_lamport is not None and received_lamport > self.lamport:
+            self.lamport = received_lamport
+
+    def delta(self):
+        """
+        Entradas alteradas desde o último delta(), sempre com a do nó local:
+        o op_id das operações. Basta para quem recebe, que entrega as
+        operações de cada site em ordem (e recebe o relógio inteiro no
+        sync): tem o relógio da operação anterior do site ao receber esta.
+        """
+        changed = self._changed
+        self._changed = set()
+        if changed is None:
+            return self.get_copy()
+        changed.add(self.node_id)
+        return {site: self.get(site) for site in changed}
+
+    def _retire(self, site, n):
+        """Passa o contador do site para 'retired' (chamado pela SiteTable)"""
+        counters = self.counters
+        value = counters[n] if n is not None and n < len(counters) else 0
+        if n is not None and n < len(counters):
+            counters[n] = 0
+        previous = self.retired.get(site, 0)
+        if value > previous:
+            self.floor += value - previous
+        self.retired = {**self.retired, site: max(value, previous)}
+
     def get_copy(self):
-        """Retorna uma cópia do relógio atual"""
-        return self.clock.copy()
-    
+        """
+        Retorna uma cópia do relógio atual (dict com os sites aposentados),
+        sem as entradas zeradas: quem lê usa get(site, 0), e os membros vêm
+        do hello e das mensagens 'member', não das chaves do relógio. Assim
+        o primeiro op_id e os anúncios de versão crescem com os sites que
+        já operaram, não com o tamanho do cluster.
+        """
+        copy = {site: counter for site, counter in zip(self.sites.sites, self.counters)
+                if counter}
+        copy.pop(None, None)
+        copy.update((site, counter) for site, counter in self.retired.items() if counter)
+        return copy
+
+    def id_clock(self):
+        """
+        Relógio para os position_ids (modo vetorial): os sites ativos e, no
+        lugar dos aposentados, FLOOR com a soma dos contadores deles. A
+        soma do relógio continua a do relógio inteiro, e os IDs são
+        comparados primeiro por ela (ver Character.clock_less).
+        """
+        copy = {site: counter for site, counter in zip(self.sites.sites, self.counters)
+                if counter}
+        copy.pop(None, None)
+        if self.floor:
+            copy[FLOOR] = self.floor
+        return copy
+
+    @property
+    def clock(self):
+        """Relógio como dict (cópia; ver get_copy)"""
+        return self.get_copy()
+
+    def frozen(self):
+        """Cópia imutável e barata (só a lista densa é copiada)"""
+        return FrozenClock(self.sites.sites, self.sites.numbers, tuple(self.counters),
+                           self.retired)
+
+    def __repr__(self):
+        return f"VectorClock({self.get_copy()})"
+
+
+class FrozenClock(Mapping):
+    """Relógio congelado (somente leitura), com a interface de um dict"""
+
+    __slots__ = ('_sites', '_numbers', '_counters', '_retired')
+
+    def __init__(self, sites, numbers, counters, retired):
+        self._sites = sites
+        self._numbers = numbers
+        self._counters = counters
+        self._retired = retired
+
+    def __getitem__(self, site):
+        n = self._numbers.get(site)
+        if n is not None and n < len(self._counters):
+            return self._counters[n]
+        return self._retired[site]
+
+    def __iter__(self):
+        for site in self._sites[:len(self._counters)]:
+            if site is not None:
+                yield site
+        yield from self._retired
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
     def __repr__(self):
-        return f"VectorClock({self.clock})"
+        return repr(dict(self))
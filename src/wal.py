@@ -0,0 +1,323 @@
+"""
+wal.py - Log de operações em disco (write-ahead log) e checkpoints
+
+Diretório de dados de um nó:
+    snapshot-<n>.rgas   documento completo (formato de snapshot.py) com
+                        tudo que foi aplicado antes do segmento n
+    wal-<n>.log         operações aplicadas depois do snapshot n, na ordem
+                        em que foram aplicadas
+
+Cada segmento começa com 'RGAL' e segue com registros
+
+    varint(tam) crc32(4 bytes, little-endian) payload
+
+em que o payload é a mensagem no formato binário de wire.py (IDs de site
+internados por segmento). Um registro incompleto ou com CRC errado (queda
+no meio de uma escrita) encerra a leitura do segmento.
+
+Group commit: append() só acumula o registro em memória; uma thread grava
+e faz um único fsync para tudo que se acumulou a cada 'fsync_interval'
+segundos (uma rajada de operações custa um fsync). sync() força a
+gravação de tudo que já foi anexado. append() retorna o número do
+registro, e after_durable() adia uma ação (o envio da operação aos peers)
+até o fsync que o inclui: um nó que cai antes dele não reutiliza, depois
+de recuperado, um (site, seq) que os peers já aplicaram.
+
+Na recuperação, o snapshot mais recente é lido via mmap (o custo depende
+do tamanho do documento compactado, não do histórico de edições) e só os
+segmentos posteriores a ele são reaplicados.
+"""
+import mmap
+import os
+import re
+import threading
+import time
+import zlib
+from collections import deque
+from snapshot import SnapshotReader, write_stream
+from wire import BinaryDecoder, BinaryEncoder, read_varint, write_varint
+
+MAGIC = b'RGAL'
+
+_SEGMENT = re.compile(r'^wal-(\d+)\.log$')
+_SNAPSHOT = re.compile(r'^snapshot-(\d+)\.rgas$')
+
+
+class OperationLog:
+    """Log de operações de um nó, em segmentos, com checkpoints por snapshot"""
+
+    def __init__(self, directory, fsync_interval=0.005):
+        """
+        Args:
+            directory (str): Diretório de dados do nó (criado se não existir)
+            fsync_interval (float): Janela (s) do group commit; 0 grava e
+                faz fsync a cada append
+        """
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+        os.makedirs(directory, exist_ok=True)
+
+        segments, snapshots = self._scan(cleanup=True)
+        # Snapshot mais recente e segmentos a reaplicar depois dele
+        self.snapshot = max(snapshots) if snapshots else None
+        base = self.snapshot or 0
+        self.segments = sorted(n for n in segments if n >= base)
+        self._next_segment = max(segments + snapshots + [0]) + 1
+
+        self._lock = threading.Lock()       # Buffer pendente e codificador
+        self._io_lock = threading.Lock()    # Escrita, fsync e rotação
+        self._pending = bytearray()
+        self._waiting = deque()             # (registro, ação, args) até o fsync
+        self._releasing = False             # Um commit executando as ações prontas
+        self._encoder = None
+        self._file = None
+        self.segment = None
+        self._thread = None
+        self._closed = False
+
+        # Métricas
+        self.appended = 0       # Registros anexados
+        self.durable = 0        # Registros já gravados com fsync
+        self.fsyncs = 0
+        self.bytes_written = 0
+        self.since_snapshot = 0  # Registros desde o último checkpoint
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _scan(self, cleanup=False):
+        """
+        Números dos segmentos e snapshots no diretório. Com 'cleanup' (na
+        abertura) remove snapshots incompletos e segmentos sem registros.
+        """
+        segments, snapshots = [], []
+        for name in os.listdir(self.directory):
+            match = _SEGMENT.match(name)
+            if match:
+                path = self._path(name)
+                if cleanup and os.path.getsize(path) <= len(MAGIC):
+                    os.remove(path)
+                else:
+                    segments.append(int(match.group(1)))
+                continue
+            match = _SNAPSHOT.match(name)
+            if match:
+                snapshots.append(int(match.group(1)))
+            elif cleanup and name.endswith('.tmp'):
+                os.remove(self._path(name))
+        return segments, snapshots
+
+    # ------------------------------------------------------------------
+    # Recuperação
+    # ------------------------------------------------------------------
+    def load_snapshot(self):
+        """(cabeçalho, registros) do snapshot mais recente, ou (None, [])"""
+        if self.snapshot is None:
+            return None, []
+        path = self._path(f'snapshot-{self.snapshot:08d}.rgas')
+        with open(path, 'rb') as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                reader = SnapshotReader()
+                records = reader.read(data)
+        return reader.header, records
+
+    def replay(self):
+        """Mensagens dos segmentos posteriores ao snapshot, na ordem em que foram aplicadas"""
+        for segment in self.segments:
+            with open(self._path(f'wal-{segment:08d}.log'), 'rb') as f:
+                data = f.read()
+            if data[:len(MAGIC)] != MAGIC:
+                continue
+            decoder = BinaryDecoder()
+            view = memoryview(data)
+            pos = len(MAGIC)
+            try:
+                while pos < len(data):
+                    try:
+                        length, start = read_varint(view, pos)
+                    except IndexError:
+                        break
+                    end = start + 4 + length
+                    if end > len(data):
+                        break  # Registro incompleto
+                    crc = int.from_bytes(view[start:start + 4], 'little')
+                    if zlib.crc32(view[start + 4:end]) != crc:
+                        break  # Registro corrompido
+                    yield decoder.decode(view, start + 4, end)
+                    pos = end
+            finally:
+                view.release()
+
+    # ------------------------------------------------------------------
+    # Escrita
+    # ------------------------------------------------------------------
+    def open(self, flusher=True):
+        """
+        Começa um novo segmento para as operações desta execução. Com
+        'flusher', uma thread própria faz o group commit; sem ela, quem
+        abriu o log chama sync() periodicamente.
+        """
+        with self._io_lock:
+            self._start_segment()
+        if flusher and self.fsync_interval > 0:
+            self._thread = threading.Thread(target=self._flush_loop, daemon=True)
+            self._thread.start()
+
+    def _start_segment(self):
+        """Fecha o segmento atual e abre o próximo (chamado com _io_lock)"""
+        if self._file is not None:
+            self._file.close()
+        self.segment = self._next_segment
+        self._next_segment += 1
+        self._file = open(self._path(f'wal-{self.segment:08d}.log'), 'ab')
+        self._file.write(MAGIC)
+        with self._lock:
+            self._encoder = BinaryEncoder()
+
+    def append(self, message):
+        """
+        Anexa uma operação ao log (gravada no próximo group commit).
+        Retorna o número do registro (ver after_durable).
+        """
+        with self._lock:
+            payload = self._encoder.encode(message)
+            pending = self._pending
+            write_varint(pending, len(payload))
+            pending += zlib.crc32(payload).to_bytes(4, 'little')
+            pending += payload
+            self.appended += 1
+            self.since_snapshot += 1
+            record = self.appended
+        if self.fsync_interval <= 0:
+            self.sync()
+        return record
+
+    def after_durable(self, record, action, *args):
+        """
+        Executa action(*args) quando o registro estiver em disco: na hora,
+        se já estiver, ou logo depois do fsync que o grava (na thread dele,
+        na ordem das chamadas)
+        """
+        with self._lock:
+            # Com ações anteriores ainda saindo, entra na fila atrás delas
+            if self.durable < record or self._releasing:
+                self._waiting.append((record, action, args))
+                return
+        action(*args)
+
+    def sync(self):
+        """Grava e faz fsync de tudo que já foi anexado"""
+        with self._io_lock:
+            self._commit()
+
+    def _commit(self):
+        """Grava o buffer pendente no segmento atual (chamado com _io_lock)"""
+        with self._lock:
+            data = self._pending
+            self._pending = bytearray()
+            target = self.appended
+        if data:
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.fsyncs += 1
+            self.bytes_written += len(data)
+        with self._lock:
+            self.durable = target
+            self._releasing = True
+        # Ainda com _io_lock: commits concorrentes não trocam a ordem
+        waiting = self._waiting
+        while True:
+            with self._lock:
+                if not waiting or waiting[0][0] > self.durable:
+                    self._releasing = False
+                    break
+                _, action, args = waiting.popleft()
+            action(*args)
+
+    def _flush_loop(self):
+        while not self._closed:
+            time.sleep(self.fsync_interval)
+            if self._pending:
+                self.sync()
+
+    # ------------------------------------------------------------------
+    # Checkpoint
+    # ------------------------------------------------------------------
+    def rotate(self):
+        """
+        Grava o que está pendente e passa a escrever num novo segmento.
+        Retorna o número dele: o snapshot do estado atual deve ser gravado
+        com esse número (write_snapshot). Chamado sem operações sendo
+        aplicadas entre a captura do snapshot e a rotação.
+        """
+        with self._io_lock:
+            self._commit()
+            self._start_segment()
+            self.since_snapshot = 0
+            return self.segment
+
+    def write_snapshot(self, segment, chunks):
+        """
+        Grava o snapshot (pedaços de bytes, consumidos um a um) num arquivo
+        temporário. Ele só substitui os anteriores em commit_snapshot.
+        Retorna o tamanho gravado.
+        """
+        tmp = self._path(f'snapshot-{segment:08d}.rgas.tmp')
+        with open(tmp, 'wb') as f:
+            return write_stream(f, chunks)
+
+    def commit_snapshot(self, segment):
+        """
+        Torna definitivo (fsync e rename atômico) o snapshot gravado por
+        write_snapshot e apaga os segmentos e snapshots que ele torna
+        desnecessários.
+        """
+        path = self._path(f'snapshot-{segment:08d}.rgas')
+        tmp = path + '.tmp'
+        with open(tmp, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self._sync_directory()
+
+        segments, snapshots = self._scan()
+        for n in segments:
+            if n < segment:
+                os.remove(self._path(f'wal-{n:08d}.log'))
+        for n in snapshots:
+            if n < segment:
+                os.remove(self._path(f'snapshot-{n:08d}.rgas'))
+
+    def _sync_directory(self):
+        """fsync do diretório, para que o rename sobreviva a uma queda"""
+        try:
+            fd = os.open(self.directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def close(self):
+        """Grava o que está pendente e fecha o segmento"""
+        self._closed = True
+        if self._thread is not None:
+            self._thread.join()
+        with self._io_lock:
+            if self._file is not None:
+                self._commit()
+                self._file.close()
+                self._file = None
+
+    def stats(self):
+        return {
+            'segment': self.segment,
+            'appended': self.appended,
+            'durable': self.durable,
+            'fsyncs': self.fsyncs,
+            'bytes_written': self.bytes_written,
+            'since_snapshot': self.since_snapshot,
+        }
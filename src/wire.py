@@ -0,0 +1,441 @@
+"""
+wire.py - Formato de fio: linhas JSON e frames binários
+
+O fluxo de bytes de uma conexão pode misturar dois tipos de frame, e cada
+frame se identifica pelo primeiro byte:
+- '{' ... '\\n'              -> mensagem JSON (formato original; o 'hello'
+                               é sempre JSON)
+- MAGIC varint(tam) payload -> mensagem binária compacta
+
+O formato binário só é usado depois que o 'hello' do peer anuncia
+'binary' em 'encodings', então nós que só falam JSON continuam
+interoperando. No binário:
+- inteiros (contadores, tamanhos) são varints (LEB128)
+- IDs de site são internados por conexão: a primeira ocorrência leva o
+  texto, as seguintes só o índice (o estado vive no par encoder/decoder de
+  cada sentido da conexão)
+- mensagens de um documento que não é o padrão (campo 'doc') levam o ID
+  do documento, também internado, antes da mensagem
+- mensagens que o codec não conhece seguem como JSON dentro do frame
+
+Com compressão (o 'hello' do peer anuncia 'zlib' em 'compression'), cada
+envio (linhas JSON e/ou frames binários de um lote) vai dentro de um frame
+
+    ZMAGIC varint(tam) bytes-zlib
+
+de um único fluxo zlib por conexão, fechado com Z_SYNC_FLUSH a cada frame:
+o frame pode ser descomprimido assim que chega e o dicionário do fluxo é
+aproveitado pelos lotes seguintes (IDs de site, nomes de campo, texto).
+"""
+import json
+import zlib
+
+MAGIC = 0xB1
+ZMAGIC = 0xC1
+
+# Tipos de mensagem no payload binário
+T_JSON = 0
+T_INSERT = 1
+T_DELETE = 2
+T_BATCH = 3
+T_DELETE_RANGE = 4
+T_DOC = 5       # Prefixo: ID do documento (internado) + a mensagem em si
+
+# Tipos de position_id
+ID_NONE = 0
+ID_VECTOR = 1
+ID_LAMPORT = 2
+
+_INSERT_KEYS = frozenset(('type', 'op_id', 'site_id', 'char', 'origin_id', 'lamport'))
+_DELETE_KEYS = frozenset(('type', 'site_id', 'target_id', 'op_id', 'lamport'))
+_DELETE_RANGE_KEYS = frozenset(('type', 'site_id', 'runs', 'op_id', 'lamport'))
+_CHAR_KEYS = frozenset(('value', 'vector_clock', 'lamport', 'site_id', 'deleted'))
+
+
+def write_varint(out, value):
+    """Escreve um inteiro não negativo em LEB128 no bytearray 'out'"""
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(buf, pos):
+    """Lê um varint de 'buf' (bytes/memoryview); levanta IndexError se incompleto"""
+    result = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+class BinaryEncoder:
+    """Codificador de um sentido de uma conexão (guarda a tabela de sites)"""
+
+    def __init__(self):
+        self.strings = {}
+
+    def encode(self, message):
+        """Codifica uma única mensagem, sem o cabeçalho de frame (ex.: registros do WAL)"""
+        payload = bytearray()
+        self._message(payload, message)
+        return payload
+
+    def encode_frames(self, messages):
+        """Codifica uma lista de mensagens num frame (lote se houver mais de uma)"""
+        payload = bytearray()
+        if len(messages) == 1:
+            self._message(payload, messages[0])
+        else:
+            payload.append(T_BATCH)
+            write_varint(payload, len(messages))
+            for message in messages:
+                self._message(payload, message)
+        frame = bytearray((MAGIC,))
+        write_varint(frame, len(payload))
+        frame += payload
+        return bytes(frame)
+
+    # ------------------------------------------------------------------
+    def _str(self, out, text):
+        index = self.strings.get(text)
+        if index is not None:
+            write_varint(out, index << 1)
+            return
+        self.strings[text] = len(self.strings)
+        data = text.encode('utf-8')
+        write_varint(out, (len(data) << 1) | 1)
+        out += data
+
+    def _text(self, out, text):
+        data = text.encode('utf-8')
+        write_varint(out, len(data))
+        out += data
+
+    def _clock(self, out, pairs):
+        """Relógio como dict ou lista de pares (site, contador)"""
+        if isinstance(pairs, dict):
+            pairs = pairs.items()
+        else:
+            pairs = list(pairs)
+        write_varint(out, len(pairs))
+        for site, counter in pairs:
+            self._str(out, site)
+            write_varint(out, counter)
+
+    def _position_id(self, out, pid):
+        if pid is None:
+            out.append(ID_NONE)
+            return
+        clock, site = pid
+        if isinstance(clock, int):
+            out.append(ID_LAMPORT)
+            write_varint(out, clock)
+        else:
+            out.append(ID_VECTOR)
+            self._clock(out, clock)
+        self._str(out, site)
+
+    def _message(self, out, msg):
+        if 'doc' in msg:
+            out.append(T_DOC)
+            self._str(out, msg['doc'])
+            msg = {key: value for key, value in msg.items() if key != 'doc'}
+        kind = msg.get('type')
+        if kind == 'insert' and self._encode_insert(out, msg):
+            return
+        if kind == 'delete' and self._encode_delete(out, msg):
+            return
+        if kind == 'delete_range' and self._encode_delete_range(out, msg):
+            return
+        if kind == 'batch':
+            ops = msg.get('ops', [])
+            out.append(T_BATCH)
+            write_varint(out, len(ops))
+            for op in ops:
+                self._message(out, op)
+            return
+        # Mensagem sem codificação binária própria: JSON dentro do frame
+        out.append(T_JSON)
+        self._text(out, json.dumps(msg))
+
+    def _encode_insert(self, out, msg):
+        char = msg.get('char')
+        if (not _INSERT_KEYS.issuperset(msg) or not isinstance(char, dict)
+                or not _CHAR_KEYS.issuperset(char) or 'op_id' not in msg
+                or not isinstance(char['deleted'], bool)):
+            return False
+        lamport_char = 'lamport' in char
+        flags = (1 if 'lamport' in msg else 0) | (2 if lamport_char else 0) | (4 if char['deleted'] else 0)
+        out.append(T_INSERT)
+        out.append(flags)
+        self._str(out, msg['site_id'])
+        self._clock(out, msg['op_id'])
+        if 'lamport' in msg:
+            write_varint(out, msg['lamport'])
+        self._text(out, char['value'])
+        if lamport_char:
+            write_varint(out, char['lamport'])
+        else:
+            self._clock(out, char['vector_clock'])
+        self._str(out, char['site_id'])
+        self._position_id(out, msg.get('origin_id'))
+        return True
+
+    def _encode_delete(self, out, msg):
+        if not _DELETE_KEYS.issuperset(msg):
+            return False
+        flags = (1 if 'lamport' in msg else 0) | (2 if 'op_id' in msg else 0)
+        out.append(T_DELETE)
+        out.append(flags)
+        self._str(out, msg['site_id'])
+        self._position_id(out, msg['target_id'])
+        if 'op_id' in msg:
+            self._clock(out, msg['op_id'])
+        if 'lamport' in msg:
+            write_varint(out, msg['lamport'])
+        return True
+
+    def _encode_delete_range(self, out, msg):
+        if not _DELETE_RANGE_KEYS.issuperset(msg) or 'op_id' not in msg:
+            return False
+        runs = msg['runs']
+        out.append(T_DELETE_RANGE)
+        out.append(1 if 'lamport' in msg else 0)
+        self._str(out, msg['site_id'])
+        self._clock(out, msg['op_id'])
+        if 'lamport' in msg:
+            write_varint(out, msg['lamport'])
+        write_varint(out, len(runs))
+        for site, seq, length in runs:
+            self._str(out, site)
+            write_varint(out, seq)
+            write_varint(out, length)
+        return True
+
+
+class BinaryDecoder:
+    """Decodificador de um sentido de uma conexão (espelha a tabela de sites)"""
+
+    def __init__(self):
+        self.strings = []
+
+    def decode(self, view, pos, end):
+        """Decodifica o payload view[pos:end] e retorna a mensagem (dict)"""
+        msg, pos = self._message(view, pos)
+        if pos != end:
+            raise ValueError("Frame binário com tamanho inconsistente")
+        return msg
+
+    # ------------------------------------------------------------------
+    def _str(self, view, pos):
+        ref = view[pos]
+        if ref < 0x80:
+            pos += 1
+        else:
+            ref, pos = read_varint(view, pos)
+        if not ref & 1:
+            return self.strings[ref >> 1], pos
+        length = ref >> 1
+        text = str(view[pos:pos + length], 'utf-8')
+        self.strings.append(text)
+        return text, pos + length
+
+    def _text(self, view, pos):
+        length, pos = read_varint(view, pos)
+        return str(view[pos:pos + length], 'utf-8'), pos + length
+
+    def _clock_pairs(self, view, pos):
+        count, pos = read_varint(view, pos)
+        strings = self.strings
+        pairs = []
+        for _ in range(count):
+            ref = view[pos]
+            if ref < 0x80 and not ref & 1:
+                # Caso comum: site já internado, índice de um byte
+                site = strings[ref >> 1]
+                pos += 1
+            else:
+                site, pos = self._str(view, pos)
+            counter, pos = read_varint(view, pos)
+            pairs.append([site, counter])
+        return pairs, pos
+
+    def _clock_dict(self, view, pos):
+        pairs, pos = self._clock_pairs(view, pos)
+        return dict(pairs), pos
+
+    def _position_id(self, view, pos):
+        kind = view[pos]
+        pos += 1
+        if kind == ID_NONE:
+            return None, pos
+        if kind == ID_LAMPORT:
+            clock, pos = read_varint(view, pos)
+        else:
+            clock, pos = self._clock_pairs(view, pos)
+        site, pos = self._str(view, pos)
+        return [clock, site], pos
+
+    def _message(self, view, pos):
+        kind = view[pos]
+        pos += 1
+        if kind == T_INSERT:
+            return self._insert(view, pos)
+        if kind == T_DELETE:
+            return self._delete(view, pos)
+        if kind == T_DELETE_RANGE:
+            return self._delete_range(view, pos)
+        if kind == T_DOC:
+            doc, pos = self._str(view, pos)
+            msg, pos = self._message(view, pos)
+            msg['doc'] = doc
+            return msg, pos
+        if kind == T_BATCH:
+            count, pos = read_varint(view, pos)
+            ops = []
+            for _ in range(count):
+                op, pos = self._message(view, pos)
+                ops.append(op)
+            return {'type': 'batch', 'ops': ops}, pos
+        if kind == T_JSON:
+            text, pos = self._text(view, pos)
+            return json.loads(text), pos
+        raise ValueError(f"Tipo de mensagem binária desconhecido: {kind}")
+
+    def _insert(self, view, pos):
+        flags = view[pos]
+        pos += 1
+        site, pos = self._str(view, pos)
+        op_id, pos = self._clock_dict(view, pos)
+        msg = {'type': 'insert', 'op_id': op_id, 'site_id': site}
+        if flags & 1:
+            msg['lamport'], pos = read_varint(view, pos)
+        value, pos = self._text(view, pos)
+        char = {'value': value}
+        if flags & 2:
+            char['lamport'], pos = read_varint(view, pos)
+        else:
+            char['vector_clock'], pos = self._clock_pairs(view, pos)
+        char['site_id'], pos = self._str(view, pos)
+        char['deleted'] = bool(flags & 4)
+        msg['char'] = char
+        msg['origin_id'], pos = self._position_id(view, pos)
+        return msg, pos
+
+    def _delete(self, view, pos):
+        flags = view[pos]
+        pos += 1
+        site, pos = self._str(view, pos)
+        msg = {'type': 'delete', 'site_id': site}
+        msg['target_id'], pos = self._position_id(view, pos)
+        if flags & 2:
+            msg['op_id'], pos = self._clock_dict(view, pos)
+        if flags & 1:
+            msg['lamport'], pos = read_varint(view, pos)
+        return msg, pos
+
+    def _delete_range(self, view, pos):
+        flags = view[pos]
+        pos += 1
+        site, pos = self._str(view, pos)
+        op_id, pos = self._clock_dict(view, pos)
+        msg = {'type': 'delete_range', 'op_id': op_id, 'site_id': site}
+        if flags & 1:
+            msg['lamport'], pos = read_varint(view, pos)
+        count, pos = read_varint(view, pos)
+        runs = []
+        for _ in range(count):
+            run_site, pos = self._str(view, pos)
+            seq, pos = read_varint(view, pos)
+            length, pos = read_varint(view, pos)
+            runs.append([run_site, seq, length])
+        msg['runs'] = runs
+        return msg, pos
+
+
+class FrameCompressor:
+    """Lado de envio da compressão de uma conexão (ver ZMAGIC)"""
+
+    def __init__(self, level=zlib.Z_DEFAULT_COMPRESSION):
+        self._zlib = zlib.compressobj(level)
+
+    def compress(self, data):
+        """Frame comprimido com o conteúdo de 'data' (um ou mais frames)"""
+        body = self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+        out = bytearray((ZMAGIC,))
+        write_varint(out, len(body))
+        out += body
+        return bytes(out)
+
+
+class FrameDecoder:
+    """
+    Separa o fluxo de bytes de uma conexão em mensagens, aceitando linhas
+    JSON, frames binários e frames comprimidos misturados. Os bytes ficam
+    num único bytearray e os frames binários são lidos via memoryview, sem
+    cópias intermediárias; os bytes consumidos são descartados uma vez por
+    feed().
+    """
+
+    def __init__(self, binary=None):
+        self.buffer = bytearray()
+        self.binary = binary if binary is not None else BinaryDecoder()
+        # Fluxo zlib da conexão e o conteúdo descomprimido (criados no
+        # primeiro frame comprimido; compartilham a tabela de sites)
+        self._inflate = None
+        self._inner = None
+
+    def feed(self, data):
+        """Consome bytes recebidos e retorna a lista de mensagens completas"""
+        buf = self.buffer
+        buf += data
+        messages = []
+        pos = 0
+        size = len(buf)
+        view = memoryview(buf)
+        try:
+            while pos < size:
+                if buf[pos] == MAGIC:
+                    try:
+                        length, start = read_varint(view, pos + 1)
+                    except IndexError:
+                        break  # Cabeçalho incompleto
+                    end = start + length
+                    if end > size:
+                        break  # Payload incompleto
+                    messages.append(self.binary.decode(view, start, end))
+                    pos = end
+                elif buf[pos] == ZMAGIC:
+                    try:
+                        length, start = read_varint(view, pos + 1)
+                    except IndexError:
+                        break
+                    end = start + length
+                    if end > size:
+                        break
+                    if self._inflate is None:
+                        self._inflate = zlib.decompressobj()
+                        self._inner = FrameDecoder(self.binary)
+                    messages.extend(self._inner.feed(self._inflate.decompress(view[start:end])))
+                    pos = end
+                else:
+                    newline = buf.find(b'\n', pos)
+                    if newline < 0:
+                        break
+                    line = buf[pos:newline]
+                    pos = newline + 1
+                    if line and not line.isspace():
+                        try:
+                            messages.append(json.loads(line))
+                        except ValueError:
+                            continue
+        finally:
+            view.release()
+        if pos:
+            del buf[:pos]
+        return messages